@@ -1,11 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 # from routes.transactions import transaction_router
 from routes.auth import auth_router
 from routes.transaction import t_router
+from routes.metrics import metrics_router
 from config.settings import settings
+from services.forecast_rollover import forecast_rollover
+from utils.log import RequestIdMiddleware, configure_logging
+from utils.metrics import MetricsMiddleware
 
-app = FastAPI(swagger_ui_parameters={"tryItOutEnabled": True})
+configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.FORECAST_ROLLOVER_ENABLED:
+        forecast_rollover.start()
+    yield
+    await forecast_rollover.stop()
+
+app = FastAPI(lifespan=lifespan, swagger_ui_parameters={"tryItOutEnabled": True})
 
 allowed_origins = settings.ALLOWED_ORIGINS.split(",")
 
@@ -17,10 +32,19 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+
+app.add_middleware(RequestIdMiddleware)
+
+# Added last so it is outermost and times the whole stack
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth_router, prefix="/api/v1")
 
 app.include_router(t_router, prefix="/api/v1")
 
+app.include_router(metrics_router)
+
 # import uvicorn
 
 # if __name__ == "__main__":
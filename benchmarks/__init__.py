@@ -0,0 +1,17 @@
+"""Benchmarks for the forecast engine.
+
+Importing the services requires the settings to resolve, so placeholder values
+are provided for anything not already set in the environment.
+"""
+import os
+
+for _name, _value in {
+    'AWS_REGION': 'us-east-1',
+    'AWS_COGNITO_USER_POOL_ID': 'us-east-1_benchmark',
+    'AWS_COGNITO_CLIENT_ID': 'benchmark',
+    'ALLOWED_ORIGINS': 'http://localhost',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'TRANSACTION_TABLE_NAME': 'transactions',
+}.items():
+    os.environ.setdefault(_name, _value)
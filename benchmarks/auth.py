@@ -0,0 +1,93 @@
+"""Time per-request authentication: unverified claims parsing, full local
+verification, and the cached verify_token dependency.
+
+A throwaway RSA key stands in for the Cognito signing key, so no network access
+is needed.
+
+Usage: python -m benchmarks.auth [--requests 2000]
+"""
+import argparse
+import asyncio
+import time
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from config.settings import settings
+from services.cognito_service import CognitoService
+from services.jwks import jwks_manager
+from utils.auth import claims_cache, verify_token
+
+KID = 'benchmark-key'
+
+
+def install_signing_key() -> bytes:
+    """Generate a key pair, publish its public half as the cached JWKS and return the private PEM"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    public_jwk = jwk.construct(public_pem, algorithm='RS256').to_dict()
+    jwks_manager.load({'keys': [{**public_jwk, 'kid': KID, 'use': 'sig'}]})
+    return private_pem
+
+
+def make_token(private_pem: bytes, lifetime: int = 3600, kid: str = KID, **overrides) -> str:
+    """Sign an access token shaped like the ones Cognito issues
+
+    overrides replace claims, or remove them when None.
+    """
+    now = int(time.time())
+    claims = {
+        'sub': 'benchmark-user',
+        'iss': settings.ISSUER,
+        'client_id': settings.AWS_COGNITO_CLIENT_ID,
+        'token_use': 'access',
+        'iat': now,
+        'exp': now + lifetime,
+        **overrides,
+    }
+    claims = {name: value for name, value in claims.items() if value is not None}
+    return jwt.encode(claims, private_pem, algorithm='RS256', headers={'kid': kid})
+
+
+async def _time(func, requests: int) -> float:
+    """Microseconds per awaited call"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        await func()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def run(requests: int):
+    private_pem = install_signing_key()
+    token = make_token(private_pem)
+
+    async def unverified():
+        return jwt.get_unverified_claims(token)
+
+    async def verified():
+        return await CognitoService.decode_and_validate_token(token)
+
+    async def dependency():
+        return await verify_token(token)
+
+    claims_cache.clear()
+    await dependency()
+    results = [
+        ('before: unverified claims parse', await _time(unverified, requests)),
+        ('signature + claims check, no cache', await _time(verified, requests)),
+        ('verify_token, cached claims', await _time(dependency, requests)),
+    ]
+    print(f"{'path':<36} {'us/request':>11}")
+    for name, micros in results:
+        print(f"{name:<36} {micros:>11.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
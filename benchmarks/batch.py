@@ -0,0 +1,56 @@
+"""Compare a per-user forecast loop with the process-pool batch.
+
+Transactions come from an in-memory stand-in for TransactionService, so only
+the fan-out and the CPU-bound forecast are measured. Run it on the target's
+core count before turning on BATCH_FORECAST_ENABLED: on one core the pool only
+adds IPC overhead.
+
+Usage: python -m benchmarks.batch [--users 500] [--transactions 20] [--chunk-size 25]
+"""
+import argparse
+import time
+from benchmarks.synthetic import make_transactions
+from services.batch_forecast import PROCESSES, encode_result, iter_batch_forecasts
+from services.main_service import MainService
+
+
+class InMemoryTransactions:
+    """Serves the same synthetic transactions for every user"""
+    def __init__(self, transactions):
+        self.transactions = transactions
+
+    def list_user_transactions(self, user_id):
+        return self.transactions
+
+
+def run(users, transaction_count, chunk_size):
+    """Time the sequential loop and the batch for the same users"""
+    service = InMemoryTransactions(make_transactions(transaction_count, seed=transaction_count))
+    user_ids = [f'benchmark-user-{index}' for index in range(users)]
+
+    started = time.perf_counter()
+    for user_id in user_ids:
+        transactions = service.list_user_transactions(user_id)
+        encode_result(user_id, MainService(user_id, service).build_forecast(transactions).forecast)
+    sequential = time.perf_counter() - started
+
+    # Start the workers outside the timed run
+    list(iter_batch_forecasts(user_ids[:1], service))
+    started = time.perf_counter()
+    lines = sum(1 for _ in iter_batch_forecasts(user_ids, service, chunk_size=chunk_size))
+    batched = time.perf_counter() - started
+    if lines != users:
+        raise AssertionError(f"expected {users} results, got {lines}")
+
+    print(f"workers: {PROCESSES}  users: {users}  transactions/user: {transaction_count}")
+    print(f"sequential {sequential:8.2f}s  {users / sequential:8.0f} users/s")
+    print(f"batch      {batched:8.2f}s  {users / batched:8.0f} users/s  ({sequential / batched:.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--transactions', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=25)
+    args = parser.parse_args()
+    run(args.users, args.transactions, args.chunk_size)
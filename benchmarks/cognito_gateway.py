@@ -0,0 +1,66 @@
+"""Load CognitoGateway with a burst of calls to a fake slow Cognito client.
+
+Prints how many calls were served and shed, the worst event loop lag while
+every worker is blocked, and the gateway stats. The admission control, timeout
+and breaker behaviour is tested in tests/test_cognito_gateway.py.
+
+Usage: python -m benchmarks.cognito_gateway [--workers 4] [--queue 8] [--delay 0.2]
+"""
+import argparse
+import asyncio
+import time
+from fastapi import HTTPException
+from services.cognito_gateway import CircuitBreaker, CognitoGateway
+
+
+class FakeCognito:
+    """Blocks for delay seconds per call"""
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def initiate_auth(self, **kwargs):
+        time.sleep(self.delay)
+        return {'AuthenticationResult': {}}
+
+
+async def _outcome(gateway: CognitoGateway):
+    """Status code of one call, 200 on success"""
+    try:
+        await gateway.call('initiate_auth', AuthFlow='USER_PASSWORD_AUTH')
+        return 200
+    except HTTPException as e:
+        return e.status_code
+
+
+async def _loop_lag(duration: float) -> float:
+    """Worst event loop scheduling delay over duration, in ms"""
+    worst = 0.0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - started - 0.005)
+    return worst * 1000
+
+
+async def run(workers: int, queue: int, delay: float):
+    gateway = CognitoGateway(FakeCognito(delay), max_workers=workers, max_queue=queue, timeout=10 * delay,
+                             breaker=CircuitBreaker(threshold=3, cooldown=30))
+    burst = 4 * (workers + queue)
+    started = time.perf_counter()
+    calls = asyncio.gather(*(_outcome(gateway) for _ in range(burst)))
+    lag = await _loop_lag(delay)
+    outcomes = await calls
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{burst} calls in {elapsed:.0f} ms: {outcomes.count(200)} served, {outcomes.count(503)} shed, "
+          f"worst loop lag {lag:.1f} ms")
+    print(gateway.stats())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.2, help="fake Cognito latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.workers, args.queue, args.delay))
@@ -0,0 +1,37 @@
+"""Compare the reference and vectorized daily sweep.
+
+Usage: python -m benchmarks.forecast_engines [--transactions 10 50 200] [--repeat 20]
+"""
+import argparse
+import timeit
+from benchmarks.synthetic import make_transactions
+from services.main_service import MainService
+
+
+def run(transaction_counts, repeat):
+    """Time calculate_forecast with each engine and check they agree"""
+    print(f"{'transactions':>12} {'reference ms':>13} {'vectorized ms':>14} {'speedup':>8}")
+    for count in transaction_counts:
+        transactions = make_transactions(count, seed=count)
+        timings = {}
+        outputs = {}
+        for engine in ('reference', 'vectorized'):
+            service = MainService('benchmark-user', transaction_service=object(), engine=engine)
+            outputs[engine] = service.calculate_forecast(transactions)
+            timings[engine] = min(timeit.repeat(
+                lambda: MainService('benchmark-user', transaction_service=object(), engine=engine)
+                .calculate_forecast(transactions),
+                number=1, repeat=repeat
+            )) * 1000
+        if repr(outputs['reference']) != repr(outputs['vectorized']):
+            raise AssertionError(f"engines disagree for {count} transactions")
+        print(f"{count:>12} {timings['reference']:>13.2f} {timings['vectorized']:>14.2f} "
+              f"{timings['reference'] / timings['vectorized']:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run(args.transactions, args.repeat)
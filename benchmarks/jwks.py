@@ -0,0 +1,117 @@
+"""Time JWKSManager lookups against a local stub JWKS endpoint.
+
+Prints the slowest of many concurrent lookups and the fetch count for a cold
+start, the refresh-ahead window, a flood of unknown kids, a key rotation and an
+outage. The behaviour itself is tested in tests/test_jwks.py.
+
+Usage: python -m benchmarks.jwks [--concurrency 200] [--delay 0.2]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk
+from services.jwks import JWKSManager
+
+
+def make_jwk(kid: str) -> dict:
+    public_pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return {**jwk.construct(public_pem, algorithm='RS256').to_dict(), 'kid': kid, 'use': 'sig'}
+
+
+class StubJWKS:
+    """Serves a JWKS document on localhost after an optional delay, counting requests"""
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.keys = [make_jwk('key-1')]
+        self.status = 200
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps({'keys': stub.keys}).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def _gather(manager: JWKSManager, kid: str, concurrency: int):
+    """Run concurrency get_key calls at once and return (keys, slowest call in ms)"""
+    async def timed():
+        started = time.perf_counter()
+        key = await manager.get_key(kid)
+        return key, (time.perf_counter() - started) * 1000
+    results = await asyncio.gather(*(timed() for _ in range(concurrency)))
+    return [key for key, _ in results], max(elapsed for _, elapsed in results)
+
+
+def report(phase: str, slowest: float, stub: StubJWKS):
+    print(f"{phase:<24} {slowest:>10.1f} {stub.requests:>8}")
+
+
+async def run(concurrency: int, delay: float):
+    stub = StubJWKS(delay)
+    clock = Clock()
+    manager = JWKSManager(stub.url, ttl=3600, refresh_ahead=300, max_stale=86400,
+                          min_refetch_interval=30, timeout=5, clock=clock)
+    print(f"{'phase':<24} {'slowest ms':>10} {'fetches':>8}")
+
+    _, slowest = await _gather(manager, 'key-1', concurrency)
+    report('cold start', slowest, stub)
+
+    clock.now = 3400
+    _, slowest = await _gather(manager, 'key-1', concurrency)
+    await manager._background
+    report('refresh ahead', slowest, stub)
+
+    clock.now += 60
+    _, slowest = await _gather(manager, 'forged', concurrency)
+    report('unknown kids', slowest, stub)
+
+    stub.keys = [make_jwk('key-2')]
+    clock.now += 60
+    _, slowest = await _gather(manager, 'key-2', concurrency)
+    report('rotated key', slowest, stub)
+
+    stub.status = 500
+    clock.now += 3600
+    _, slowest = await _gather(manager, 'key-2', concurrency)
+    if manager._background:
+        await manager._background
+    report('outage', slowest, stub)
+    print(manager.stats())
+    stub.server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.2, help="stub response delay in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.delay))
@@ -0,0 +1,133 @@
+"""Request latency of the balance and auth routes under each logging setup.
+
+Runs the app in process with the memory storage and a throwaway signing key,
+and times GET /balance (cached and recomputed, the latter logging one INFO
+record per request) and GET /check-auth with:
+
+- none: no output handler, records are discarded
+- stream: the JSON formatter writing on the request thread, as a plain
+  StreamHandler would
+- queue: the NonBlockingQueueHandler and listener thread configure_logging sets up
+
+Records are written to a temporary file rather than the terminal. Modes are
+interleaved per round so drift affects them alike. Route timings through the
+test client vary by tens of percent between runs, so the cost of one
+logger.info call on the caller's thread is also reported for each mode; a
+route's logging overhead is that times the records it logs.
+
+Usage: python -m benchmarks.logging_overhead [--requests 300] [--rounds 5]
+"""
+import argparse
+import logging
+import os
+import queue
+import statistics
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('FORECAST_ROLLOVER_ENABLED', 'false')
+
+from fastapi.testclient import TestClient
+from app import app
+from benchmarks.auth import install_signing_key, make_token
+from benchmarks.synthetic import make_transactions
+from services.forecast_cache import forecast_cache
+from utils.log import JSONFormatter, NonBlockingQueueHandler, RequestIdFilter
+from utils.transactions import get_transaction_service
+
+USER_ID = 'benchmark-user'
+MODES = ('none', 'stream', 'queue')
+
+
+def install(mode: str, output):
+    """Replace the root handlers for mode; returns the listener to stop, if any"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    # The test client logs each request it sends; only the app's records count here
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    if mode == 'none':
+        root.addHandler(logging.NullHandler())
+        return None
+    stream = logging.StreamHandler(output)
+    stream.setFormatter(JSONFormatter())
+    if mode == 'stream':
+        stream.addFilter(RequestIdFilter())
+        root.addHandler(stream)
+        return None
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=10000))
+    handler.addFilter(RequestIdFilter())
+    root.addHandler(handler)
+    listener = QueueListener(handler.queue, stream)
+    listener.start()
+    return listener
+
+
+def median_us(client, url, requests, before=None) -> float:
+    """Median microseconds per request"""
+    timings = []
+    for _ in range(requests):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return statistics.median(timings) * 1e6
+
+
+def record_us(records: int) -> float:
+    """Microseconds one logger.info call takes on the caller's thread"""
+    logger = logging.getLogger('benchmarks.logging_overhead')
+    started = time.perf_counter()
+    for index in range(records):
+        logger.info("Calculating balances for user: %s", index)
+    return (time.perf_counter() - started) / records * 1e6
+
+
+def run(requests: int, rounds: int):
+    transaction_service = get_transaction_service()
+    for transaction in make_transactions(50, seed=1, user_id=USER_ID):
+        transaction_service.storage.put(transaction.model_dump())
+    token = make_token(install_signing_key())
+    balance = f'/api/v1/users/{USER_ID}/balance'
+    routes = [
+        ('balance, cached', balance, None),
+        ('balance, recomputed', balance, lambda: forecast_cache.invalidate(USER_ID)),
+        ('check-auth', '/api/v1/check-auth', None),
+    ]
+    names = [name for name, _, _ in routes] + ['logger.info']
+    samples = {(name, mode): [] for name in names for mode in MODES}
+    with TestClient(app) as client, tempfile.TemporaryFile('w') as output:
+        client.cookies.set('access_token', token)
+        install('none', output)
+        for name, url, before in routes:
+            median_us(client, url, requests // 10 or 1, before)
+        for _ in range(rounds):
+            for mode in MODES:
+                listener = install(mode, output)
+                try:
+                    for name, url, before in routes:
+                        samples[name, mode].append(median_us(client, url, requests, before))
+                    # Stays under the queue size, so the queue mode measures enqueueing, not drops
+                    samples['logger.info', mode].append(record_us(5000))
+                finally:
+                    if listener:
+                        listener.stop()
+
+    print(f"{'route':<20} " + ' '.join(f'{mode + " us":>10}' for mode in MODES) + f" {'queue/none':>11}")
+    for name in names:
+        medians = [statistics.median(samples[name, mode]) for mode in MODES]
+        print(f"{name:<20} " + ' '.join(f'{value:>10.1f}' for value in medians)
+              + f" {medians[2] / medians[0]:>10.3f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    run(args.requests, args.rounds)
@@ -0,0 +1,46 @@
+"""Measure the cost of the always-on instrumentation.
+
+Times Counter.inc, Histogram.observe, a Histogram.timed call against the bare
+function, and a /metrics render, each on a private registry.
+
+Usage: python -m benchmarks.metrics [--iterations 200000]
+"""
+import argparse
+import time
+from utils.metrics import Registry
+
+
+def per_call_ns(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def run(iterations: int):
+    registry = Registry()
+    counter = registry.counter('bench_total', 'Benchmark counter', ['route', 'status'])
+    histogram = registry.histogram('bench_seconds', 'Benchmark histogram', ['route'])
+
+    def bare():
+        return None
+    timed = histogram.timed('/timed')(bare)
+
+    baseline = per_call_ns(bare, iterations)
+    print(f"{'Counter.inc':<24} {per_call_ns(lambda: counter.inc('/a', '200'), iterations):>8.0f} ns")
+    print(f"{'Histogram.observe':<24} {per_call_ns(lambda: histogram.observe(0.03, '/a'), iterations):>8.0f} ns")
+    print(f"{'Histogram.timed':<24} {per_call_ns(timed, iterations) - baseline:>8.0f} ns over the bare call")
+
+    for index in range(200):
+        histogram.observe(0.01, f'/route/{index}')
+        counter.inc(f'/route/{index}', '200')
+    started = time.perf_counter()
+    text = registry.render()
+    print(f"{'render 400 series':<24} {(time.perf_counter() - started) * 1000:>8.2f} ms, {len(text)} bytes")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+    run(args.iterations)
@@ -0,0 +1,54 @@
+"""Compare balance response size and encoding time per format.
+
+The full format is encoded the way FastAPI does it (jsonable_encoder then
+json.dumps); the compact formats go through utils.serialization.
+
+Usage: python -m benchmarks.payload [--transactions 10 50 200] [--repeat 10]
+"""
+import argparse
+import gzip
+import json
+import timeit
+from fastapi.encoders import jsonable_encoder
+from benchmarks.synthetic import make_transactions
+from services.forecast_format import format_forecast
+from services.main_service import MainService
+from utils import serialization
+
+
+def encode_full(forecast) -> bytes:
+    """Encode the full forecast as the default response does"""
+    return json.dumps(jsonable_encoder(forecast), separators=(',', ':')).encode()
+
+
+def encoders(forecast):
+    """Yield (name, encode) pairs for every available format and encoding"""
+    yield 'full json', lambda: encode_full(forecast)
+    for response_format in ('compact', 'columnar'):
+        yield f'{response_format} json', lambda f=response_format: serialization.dumps_json(
+            format_forecast(forecast, f)
+        )
+        if serialization.msgpack is not None:
+            yield f'{response_format} msgpack', lambda f=response_format: serialization.dumps_msgpack(
+                format_forecast(forecast, f)
+            )
+
+
+def run(transaction_counts, repeat):
+    """Print size, gzipped size and encoding time of each format"""
+    print(f"{'transactions':>12} {'format':<18} {'bytes':>10} {'gzip bytes':>10} {'encode ms':>10}")
+    for count in transaction_counts:
+        transactions = make_transactions(count, seed=count)
+        forecast = MainService('benchmark-user', transaction_service=object()).calculate_forecast(transactions)
+        for name, encode in encoders(forecast):
+            body = encode()
+            elapsed = min(timeit.repeat(encode, number=1, repeat=repeat)) * 1000
+            print(f"{count:>12} {name:<18} {len(body):>10} {len(gzip.compress(body)):>10} {elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    run(args.transactions, args.repeat)
@@ -0,0 +1,44 @@
+"""Time the closed-form recurrence expansion against the stepwise one.
+
+Every frequency is exercised with randomly generated schedules, including
+month-end days, last_day_of_month and skip_end_date, across several windows.
+tests/test_recurrence.py checks that both expansions agree.
+
+Usage: python -m benchmarks.recurrence [--cases 2000] [--seed 0]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from benchmarks.synthetic import FREQUENCIES, make_transaction
+from services.main_service import MainService
+
+
+def run(cases, seed):
+    """Time both expansions for cases random transactions per frequency"""
+    rng = random.Random(seed)
+    service = MainService('benchmark-user', transaction_service=object())
+    print(f"{'frequency':>13} {'cases':>6} {'stepwise ms':>12} {'closed form ms':>15}")
+    for frequency in FREQUENCIES:
+        stepwise_time = closed_form_time = 0.0
+        for index in range(cases):
+            base = datetime(2020, 1, 1) + timedelta(days=rng.randint(0, 3650))
+            transaction = make_transaction(rng, index, frequencies=[frequency], base=base)
+            start_window = service.truncate_date(base - timedelta(days=rng.randint(0, 400)))
+            end_window = start_window + timedelta(days=rng.randint(0, 400))
+
+            started = time.perf_counter()
+            service.expand_transaction_stepwise(transaction, start_window, end_window)
+            stepwise_time += time.perf_counter() - started
+            started = time.perf_counter()
+            service.expand_transaction(transaction, start_window, end_window)
+            closed_form_time += time.perf_counter() - started
+        print(f"{frequency:>13} {cases:>6} {stepwise_time * 1000:>12.1f} {closed_form_time * 1000:>15.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.cases, args.seed)
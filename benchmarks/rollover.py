@@ -0,0 +1,39 @@
+"""Compare rolling a forecast forward by a day with building it for the new day.
+
+Usage: python -m benchmarks.rollover [--transactions 10 50 200] [--repeat 10]
+"""
+import argparse
+import time
+from datetime import timedelta
+from benchmarks.synthetic import make_transactions
+from services.incremental_forecast import IncrementalForecast
+from services.main_service import MainService
+
+
+def run(transaction_counts, repeat):
+    """Print the best build and roll_forward times and whether both agree"""
+    print(f"{'transactions':>12} {'build ms':>9} {'roll ms':>8} {'same':>5}")
+    for count in transaction_counts:
+        transactions = make_transactions(count, seed=count)
+        service = MainService('benchmark-user', transaction_service=object())
+        start_window, end_window = service.forecast_window()
+        next_start, next_end = start_window + timedelta(days=1), end_window + timedelta(days=1)
+        build_times, roll_times = [], []
+        for _ in range(repeat):
+            forecast = IncrementalForecast(service, transactions, start_window, end_window)
+            started = time.perf_counter()
+            forecast.roll_forward()
+            roll_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            built = IncrementalForecast(service, transactions, next_start, next_end)
+            build_times.append(time.perf_counter() - started)
+        same = forecast.forecast == built.forecast
+        print(f"{count:>12} {min(build_times) * 1000:>9.2f} {min(roll_times) * 1000:>8.2f} {str(same):>5}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    run(args.transactions, args.repeat)
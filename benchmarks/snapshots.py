@@ -0,0 +1,57 @@
+"""Compare serving balances from materialized snapshots with forecasting per read.
+
+For each user size, times a cold forecast plus its JSON encoding (a read
+without snapshots or cached forecasts), a snapshot read of the compact JSON,
+and the snapshot refresh a single-transaction write pays. Runs on the memory
+storage and snapshot store.
+
+Usage: python -m benchmarks.snapshots [--transactions 10 50 200] [--repeat 10]
+"""
+import argparse
+import timeit
+from benchmarks.synthetic import make_transactions
+from models.transaction import TransactionCreate
+from services.forecast_cache import forecast_cache
+from services.forecast_format import compact_forecast
+from services.main_service import MainService
+from services.materialized_forecast import ForecastMaterializer
+from services.snapshot_storage import MemorySnapshotStorage
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+from utils.serialization import dumps_json
+
+
+def run(transaction_counts, repeat):
+    """Print per-read and per-write milliseconds and the stored snapshot size"""
+    print(f"{'transactions':>12} {'forecast ms':>11} {'snapshot ms':>11} {'refresh ms':>10} {'stored bytes':>12}")
+    for count in transaction_counts:
+        user_id = f'benchmark-user-{count}'
+        storage = MemoryStorage()
+        for transaction in make_transactions(count, seed=count, user_id=user_id):
+            storage.put(transaction.model_dump())
+        materializer = ForecastMaterializer(MemorySnapshotStorage())
+        transaction_service = TransactionService(storage, materializer=materializer)
+        service = MainService(user_id, transaction_service)
+        version = transaction_service.data_version(user_id)
+
+        def forecast():
+            forecast_cache.invalidate(user_id)
+            return dumps_json(compact_forecast(service.calculate_balances(version=version)))
+        forecast_ms = min(timeit.repeat(forecast, number=1, repeat=repeat)) * 1000
+        materializer.materialize(service, version, 'read')
+        snapshot_ms = min(timeit.repeat(lambda: materializer.read(service, version), number=1, repeat=repeat)) * 1000
+
+        existing = storage.query_user(user_id, limit=1)[0][0]
+        update = TransactionCreate(**{**existing, 'amount': existing['amount'] + 1})
+        refresh = lambda: transaction_service.update_transaction(existing['id'], update)
+        refresh_ms = min(timeit.repeat(refresh, number=1, repeat=repeat)) * 1000
+        stored = len(materializer.storage.snapshots[user_id]['payload'])
+        print(f"{count:>12} {forecast_ms:>11.2f} {snapshot_ms:>11.2f} {refresh_ms:>10.2f} {stored:>12}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+    run(args.transactions, args.repeat)
@@ -0,0 +1,35 @@
+"""Compare the dense and sparse forecast engines on compute time and payload size.
+
+Usage: python -m benchmarks.sparse [--transactions 5 15 50] [--repeat 20]
+"""
+import argparse
+import timeit
+from fastapi.encoders import jsonable_encoder
+from benchmarks.synthetic import make_transactions
+from services.incremental_forecast import IncrementalForecast
+from services.main_service import MainService
+from services.sparse_forecast import SparseForecast
+from utils.serialization import dumps_json
+
+
+def run(transaction_counts, repeat):
+    """Time building each engine and measure the JSON size of its forecast"""
+    print(f"{'transactions':>12} {'engine':<8} {'days':>5} {'build ms':>9} {'bytes':>9}")
+    for count in transaction_counts:
+        transactions = make_transactions(count, seed=count)
+        service = MainService('benchmark-user', transaction_service=object())
+        start_window, end_window = service.forecast_window()
+        for name, engine in (('dense', IncrementalForecast), ('sparse', SparseForecast)):
+            build = lambda: engine(service, transactions, start_window, end_window)
+            forecast = build().forecast
+            elapsed = min(timeit.repeat(build, number=1, repeat=repeat)) * 1000
+            size = len(dumps_json(jsonable_encoder(forecast)))
+            print(f"{count:>12} {name:<8} {len(forecast):>5} {elapsed:>9.2f} {size:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, nargs='+', default=[5, 15, 50])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run(args.transactions, args.repeat)
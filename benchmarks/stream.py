@@ -0,0 +1,67 @@
+"""Compare the streamed balance with the one-shot full response.
+
+For each window length, measures time to the first chunk, total time and peak
+traced memory of MainService.iter_balances encoded as NDJSON, against building
+the whole forecast and encoding it the way the balance route does.
+
+Usage: python -m benchmarks.stream [--transactions 50] [--days 240 366]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from benchmarks.synthetic import make_transactions
+from services.forecast_format import iter_encoded_days
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+
+
+def measure(produce):
+    """Return (ms to the first chunk, total ms, peak KiB, bytes) for an iterator factory"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in produce():
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first * 1000, total * 1000, peak / 1024, size
+
+
+def run(count, day_counts):
+    storage = MemoryStorage()
+    for transaction in make_transactions(count, seed=count):
+        storage.put(transaction.model_dump())
+    transaction_service = TransactionService(storage)
+    today = datetime.now()
+    print(f"{'days':>5} {'mode':<7} {'first ms':>9} {'total ms':>9} {'peak KiB':>9} {'bytes':>9}")
+    for days in day_counts:
+        end = today + timedelta(days=days)
+
+        def full():
+            service = MainService('benchmark-user', transaction_service, end=end)
+            forecast = service.build_forecast(transaction_service.list_user_transactions('benchmark-user'))
+            yield json.dumps(jsonable_encoder(forecast.forecast), separators=(',', ':')).encode()
+
+        def stream():
+            service = MainService('benchmark-user', transaction_service, end=end)
+            return iter_encoded_days(service.iter_balances())
+
+        for mode, produce in (('full', full), ('stream', stream)):
+            first, total, peak, size = measure(produce)
+            print(f"{days:>5} {mode:<7} {first:>9.2f} {total:>9.2f} {peak:>9.0f} {size:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=50)
+    parser.add_argument('--days', type=int, nargs='+', default=[60, 240, 366])
+    args = parser.parse_args()
+    run(args.transactions, args.days)
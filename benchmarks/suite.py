@@ -0,0 +1,258 @@
+"""Benchmark suite for the forecast engine and the /balance route.
+
+For every scenario this times each MainService phase separately, builds the
+cached engines, records peak traced memory and measures end-to-end /balance
+latency through the FastAPI test client, with storage replaced by
+MemoryStorage. Results are written as JSON so runs from different commits
+can be compared.
+
+Usage:
+    python -m benchmarks.suite [--scenario NAME ...] [--repeat 10] [--output results.json]
+    python -m benchmarks.suite --compare baseline.json [--threshold 1.15]
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from benchmarks.synthetic import make_transactions
+from services.incremental_forecast import IncrementalForecast
+from services.main_service import MainService
+from services.sparse_forecast import SparseForecast
+
+USER_ID = 'benchmark-user'
+
+
+@dataclass
+class Scenario:
+    """One synthetic user; None keeps the generator and window defaults"""
+    name: str
+    transactions: int
+    frequencies: Optional[List[str]] = None
+    last_day_share: Optional[float] = None
+    skip_end_share: float = 0.6
+    future_days: Optional[int] = None
+    seed: int = 0
+
+    def make_transactions(self):
+        return make_transactions(
+            self.transactions, seed=self.seed, user_id=USER_ID, frequencies=self.frequencies,
+            last_day_share=self.last_day_share, skip_end_share=self.skip_end_share
+        )
+
+    def service(self, engine: Optional[str] = None, transaction_service=None) -> MainService:
+        end = datetime.now() + timedelta(days=self.future_days) if self.future_days else None
+        return MainService(USER_ID, transaction_service or object(), engine=engine, end=end)
+
+
+SCENARIOS = [
+    Scenario('small-mixed', 10),
+    Scenario('medium-mixed', 50),
+    Scenario('large-mixed', 200),
+    Scenario('weekly-heavy', 50, frequencies=['weekly', 'bi-weekly']),
+    Scenario('monthly-only', 50, frequencies=['semi-monthly', 'monthly']),
+    Scenario('last-day-of-month', 50, frequencies=['semi-monthly', 'monthly'], last_day_share=1.0),
+    Scenario('open-ended', 50, frequencies=['weekly', 'bi-weekly', 'semi-monthly', 'monthly'],
+             skip_end_share=1.0),
+    Scenario('short-window', 50, future_days=30),
+    Scenario('long-window', 50, future_days=366),
+]
+
+
+@dataclass
+class Result:
+    scenario: str
+    metric: str
+    unit: str
+    value: float
+    samples: List[float] = field(default_factory=list)
+
+
+def _time(func: Callable, repeat: int, setup: Optional[Callable] = None) -> List[float]:
+    """Milliseconds per call; setup runs untimed before each call and its result is passed in"""
+    samples = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        started = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _timing(scenario: Scenario, metric: str, samples: List[float]) -> Result:
+    return Result(scenario.name, metric, 'ms', min(samples), samples)
+
+
+def _peak_memory(func: Callable) -> float:
+    """Peak traced allocation of one call, in KiB"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def phase_results(scenario: Scenario, repeat: int) -> List[Result]:
+    """Time the reference pipeline phase by phase and the cached engines"""
+    transactions = scenario.make_transactions()
+    service = scenario.service()
+    start_window, end_window = service.forecast_window()
+
+    def split():
+        fresh = scenario.service()
+        fresh.separate_transactions_by_type(transactions)
+        return fresh
+
+    def recurring(fresh, kind):
+        day_map = {day: [] for day in fresh.date_range(start_window, end_window)}
+        return fresh.calculate_recurring_dates(getattr(fresh, f'{kind}_transactions'), day_map)[1]
+
+    def expanded():
+        fresh = split()
+        return fresh, recurring(fresh, 'income'), recurring(fresh, 'expense')
+
+    results = [
+        _timing(scenario, 'separate_transactions_by_type',
+                _time(lambda fresh: fresh.separate_transactions_by_type(transactions), repeat,
+                      setup=scenario.service)),
+        _timing(scenario, 'calculate_recurring_dates.income',
+                _time(lambda fresh: recurring(fresh, 'income'), repeat, setup=split)),
+        _timing(scenario, 'calculate_recurring_dates.expense',
+                _time(lambda fresh: recurring(fresh, 'expense'), repeat, setup=split)),
+        _timing(scenario, 'calculate_daily_finances',
+                _time(lambda state: state[0].calculate_daily_finances(state[1], state[2], start_window, end_window),
+                      repeat, setup=expanded)),
+    ]
+    for engine in ('reference', 'vectorized'):
+        results.append(_timing(scenario, f'calculate_forecast.{engine}', _time(
+            lambda fresh: fresh.calculate_forecast(transactions), repeat,
+            setup=lambda: scenario.service(engine=engine)
+        )))
+    for name, engine in (('incremental', IncrementalForecast), ('sparse', SparseForecast)):
+        build = lambda: engine(service, transactions, start_window, end_window)
+        results.append(_timing(scenario, f'build.{name}', _time(build, repeat)))
+        forecast = build()
+        transaction = transactions[len(transactions) // 2]
+        results.append(_timing(scenario, f'upsert.{name}', _time(lambda: forecast.upsert(transaction), repeat)))
+        results.append(Result(scenario.name, f'peak_memory.build.{name}', 'KiB', _peak_memory(build)))
+    results.append(Result(
+        scenario.name, 'peak_memory.calculate_forecast.reference', 'KiB',
+        _peak_memory(lambda: scenario.service().calculate_forecast(transactions))
+    ))
+    return results
+
+
+def api_results(scenario: Scenario, repeat: int) -> List[Result]:
+    """Time GET /balance end to end, with the forecast cache cold and warm"""
+    from fastapi.testclient import TestClient
+    from app import app
+    from utils.auth import verify_token
+    from services.forecast_cache import forecast_cache
+    from services.storage import MemoryStorage
+    from services.transaction_service import AsyncTransactionService, TransactionService
+    from utils.transactions import get_async_transaction_service, get_transaction_service
+
+    transaction_service = TransactionService(MemoryStorage())
+    transaction_service.storage.batch_write(transaction.model_dump() for transaction in scenario.make_transactions())
+    async_service = AsyncTransactionService(transaction_service, max_workers=4)
+    app.dependency_overrides[verify_token] = lambda: USER_ID
+    app.dependency_overrides[get_transaction_service] = lambda: transaction_service
+    app.dependency_overrides[get_async_transaction_service] = lambda: async_service
+    params = {}
+    if scenario.future_days:
+        params['to'] = (datetime.now() + timedelta(days=scenario.future_days)).strftime("%m-%d-%Y")
+    url = f'/api/v1/users/{USER_ID}/balance'
+
+    def get(response_format):
+        response = client.get(url, params={**params, 'format': response_format})
+        response.raise_for_status()
+
+    results = []
+    try:
+        with TestClient(app) as client:
+            for response_format in ('full', 'compact'):
+                cold = _time(lambda _: get(response_format), repeat,
+                             setup=lambda: forecast_cache.invalidate(USER_ID))
+                warm = _time(lambda: get(response_format), repeat)
+                for label, samples in (('cold', cold), ('warm', warm)):
+                    metric = f'api.balance.{response_format}.{label}'
+                    results.append(_timing(scenario, f'{metric}.min', samples))
+                    results.append(Result(scenario.name, f'{metric}.p50', 'ms', statistics.median(samples)))
+    finally:
+        app.dependency_overrides.clear()
+        forecast_cache.invalidate(USER_ID)
+    return results
+
+
+def environment() -> Dict[str, str]:
+    """Identify the run: commit, interpreter and machine"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print each shared metric's ratio to the baseline; False if any exceeds threshold"""
+    previous = {(result['scenario'], result['metric']): result['value'] for result in baseline['results']}
+    ok = True
+    print(f"{'scenario':<20} {'metric':<45} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for result in current['results']:
+        before = previous.get((result['scenario'], result['metric']))
+        if not before:
+            continue
+        ratio = result['value'] / before
+        flag = ' !' if ratio > threshold else ''
+        ok = ok and not flag
+        print(f"{result['scenario']:<20} {result['metric']:<45} {before:>10.2f} {result['value']:>10.2f} "
+              f"{ratio:>6.2f}x{flag}")
+    return ok
+
+
+def run(scenarios: List[Scenario], repeat: int, api: bool = True) -> dict:
+    results = []
+    for scenario in scenarios:
+        results.extend(phase_results(scenario, repeat))
+        if api:
+            results.extend(api_results(scenario, repeat))
+        print(f"finished {scenario.name}", file=sys.stderr)
+    return {'environment': environment(), 'repeat': repeat, 'results': [asdict(result) for result in results]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', nargs='+', choices=[scenario.name for scenario in SCENARIOS])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--no-api', action='store_true', help="skip the end-to-end /balance timings")
+    parser.add_argument('--output', help="write results to this file instead of stdout")
+    parser.add_argument('--compare', help="baseline results file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.15,
+                        help="ratio to the baseline above which --compare exits non-zero")
+    args = parser.parse_args()
+
+    selected = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    report = run(selected, args.repeat, api=not args.no_api)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            if not compare(json.load(baseline_file), report, args.threshold):
+                sys.exit(1)
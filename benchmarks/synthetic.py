@@ -0,0 +1,64 @@
+"""Synthetic transaction generators for benchmarks"""
+import calendar
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Optional
+from models.transaction import Transaction
+
+FREQUENCIES = ['one-time', 'weekly', 'bi-weekly', 'semi-monthly', 'monthly']
+AMOUNTS = ['9.99', '25.5', '40', '100.00', '250', '1200', '1500.75', '3100']
+
+
+def format_date(value: datetime) -> str:
+    """Format a datetime the way transactions store dates"""
+    return value.strftime("%m-%d-%Y")
+
+
+def make_transaction(rng: random.Random, index: int, user_id: str = 'benchmark-user',
+                     frequencies: Optional[List[str]] = None, income_share: float = 0.3,
+                     base: Optional[datetime] = None, last_day_share: Optional[float] = None,
+                     skip_end_share: float = 0.6) -> Transaction:
+    """Build one random but valid transaction around base
+
+    last_day_share overrides how often semi-monthly and monthly schedules use
+    last_day_of_month; skip_end_share is how often recurring ones are open-ended.
+    """
+    base = base or datetime.now()
+    frequency = rng.choice(frequencies or FREQUENCIES)
+    first = base + timedelta(days=rng.randint(-90, 180))
+    fields = {
+        'id': f'{user_id}-{index}',
+        'user_id': user_id,
+        'type': 'income' if rng.random() < income_share else 'expense',
+        'name': f'transaction {index}',
+        'amount': Decimal(rng.choice(AMOUNTS)),
+        'frequency': frequency,
+        'date_of_transaction': format_date(first),
+    }
+    if frequency in ('weekly', 'bi-weekly'):
+        fields['start_date'] = format_date(first)
+        fields['day'] = rng.randint(1, 7)
+    if frequency == 'semi-monthly':
+        if rng.random() < (0.3 if last_day_share is None else last_day_share):
+            fields['last_day_of_month'] = True
+        else:
+            fields['date_of_second_transaction'] = format_date(first + timedelta(days=rng.randint(1, 14)))
+    if frequency == 'monthly':
+        if rng.random() < (0.2 if last_day_share is None else last_day_share):
+            fields['last_day_of_month'] = True
+        elif rng.random() < 0.2:
+            last_day = calendar.monthrange(first.year, first.month)[1]
+            fields['date_of_transaction'] = format_date(first.replace(day=min(31, last_day)))
+    if frequency != 'one-time':
+        if rng.random() < skip_end_share:
+            fields['skip_end_date'] = True
+        else:
+            fields['end_date'] = format_date(first + timedelta(days=rng.randint(30, 400)))
+    return Transaction(**fields)
+
+
+def make_transactions(count: int, seed: int = 0, **kwargs) -> List[Transaction]:
+    """Build count random transactions for one user"""
+    rng = random.Random(seed)
+    return [make_transaction(rng, index, **kwargs) for index in range(count)]
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -8,8 +9,66 @@ class Settings(BaseSettings):
     AWS_COGNITO_USER_POOL_ID: str
     AWS_COGNITO_CLIENT_ID: str
     JWKS_CACHE_TIMEOUT: int = 3600
+    JWKS_REFRESH_AHEAD: int = 300
+    JWKS_MAX_STALE: int = 86400
+    JWKS_MIN_REFETCH_INTERVAL: int = 30
+    JWKS_FETCH_TIMEOUT: float = 5
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    PROFILE_CACHE_TTL: int = 60
+    PROFILE_CACHE_MAX_ENTRIES: int = 10000
+    EMAIL_CACHE_TTL: int = 60
+    EMAIL_CACHE_MAX_ENTRIES: int = 10000
+    AWS_MAX_POOL_CONNECTIONS: int = 50
+    AWS_CONNECT_TIMEOUT: float = 2
+    AWS_READ_TIMEOUT: float = 5
+    AWS_TCP_KEEPALIVE: bool = True
+    AWS_RETRY_MODE: str = 'adaptive'
+    AWS_MAX_ATTEMPTS: int = 3
+    COGNITO_MAX_WORKERS: int = 16
+    COGNITO_MAX_QUEUE: int = 64
+    COGNITO_TIMEOUT: float = 5
+    COGNITO_BREAKER_THRESHOLD: int = 5
+    COGNITO_BREAKER_COOLDOWN: float = 30
+    LOG_LEVEL: str = 'INFO'
+    # Comma separated logger=LEVEL overrides
+    LOG_LEVELS: str = 'botocore=WARNING,boto3=WARNING,urllib3=WARNING'
+    LOG_FORMAT: str = 'json'
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_DEBUG_SAMPLE_RATE: float = 0.01
+    BULK_IMPORT_MAX_ROWS: int = 1000
+    FORECAST_CACHE_MAX_ENTRIES: int = 1024
+    FORECAST_CACHE_TTL: int = 300
+    FORECAST_CACHE_MAX_DAYS: int = 250000
+    FORECAST_ENGINE: str = 'reference'
+    FORECAST_PAST_DAYS: int = 30
+    FORECAST_FUTURE_DAYS: int = 210
+    FORECAST_MAX_FUTURE_DAYS: int = 366
+    GZIP_MINIMUM_SIZE: int = 1024
+    BATCH_FORECAST_PROCESSES: int = 0
+    BATCH_FORECAST_CHUNK_SIZE: int = 25
+    BATCH_FORECAST_MAX_USERS: int = 10000
+    # POST /balances/batch answers 404 unless enabled; callers must be in BATCH_FORECAST_GROUP
+    BATCH_FORECAST_ENABLED: bool = False
+    BATCH_FORECAST_GROUP: str = 'admin'
+    # Runs in every worker process, each over the users it served
+    FORECAST_ROLLOVER_ENABLED: bool = True
+    # Seconds after midnight the rollover starts
+    FORECAST_ROLLOVER_DELAY: float = 5
+    FORECAST_ROLLOVER_CONCURRENCY: int = 2
+    # Fraction of one CPU the rollover may use across its workers
+    FORECAST_ROLLOVER_CPU_SHARE: float = 0.25
+    # Users whose balance was read within this many days are rolled over
+    FORECAST_ROLLOVER_ACTIVE_DAYS: int = 7
+    # Further capped at the whole-window forecasts the forecast cache holds
+    FORECAST_ROLLOVER_MAX_USERS: int = 1000
+    # Bearer token scrapers send to /metrics; /metrics answers 404 while it is empty
+    METRICS_TOKEN: str = ''
     ALLOWED_ORIGINS: str
     
+    @property
+    def ISSUER(self):
+        return f'https://cognito-idp.{self.AWS_REGION}.amazonaws.com/{self.AWS_COGNITO_USER_POOL_ID}'
+
     @property
     def KEYS_URL(self):
         return f'https://cognito-idp.{self.AWS_REGION}.amazonaws.com/{self.AWS_COGNITO_USER_POOL_ID}/.well-known/jwks.json'
@@ -17,8 +76,18 @@ class Settings(BaseSettings):
 settings = Settings()
 
 class DBConf(BaseSettings):
-    AWS_ACCESS_KEY_ID: str
-    AWS_SECRET_ACCESS_KEY: str
+    AWS_ACCESS_KEY_ID: Optional[str] = None
+    AWS_SECRET_ACCESS_KEY: Optional[str] = None
     TRANSACTION_TABLE_NAME: str
+    TRANSACTION_EXECUTOR_WORKERS: int = 16
+    # dynamodb, memory, sqlite, or dynamodb+sqlite for a local read-through replica
+    STORAGE_BACKEND: str = 'dynamodb'
+    SQLITE_PATH: str = 'transactions.db'
+    STORAGE_REPLICA_TTL: int = 300
+    BATCH_WRITE_MAX_ATTEMPTS: int = 5
+    BATCH_WRITE_BASE_DELAY: float = 0.05
+    # Materialized forecast snapshots: empty to disable, or dynamodb, memory or sqlite
+    FORECAST_SNAPSHOT_BACKEND: str = ''
+    FORECAST_SNAPSHOT_TABLE_NAME: str = 'forecast_snapshots'
     
 dbconf = DBConf()
\ No newline at end of file
@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class BatchBalanceRequest(BaseModel):
+    user_ids: list[str] = Field(..., min_length=1)
+    from_date: Optional[str] = Field(None, alias="from")
+    to_date: Optional[str] = Field(None, alias="to")
+    sparse: bool = False
+    format: str = "full"
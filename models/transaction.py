@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 from enum import Enum
 from decimal import Decimal
 
@@ -35,4 +35,19 @@ class Transaction(TransactionBase):
     id: str
 
     # class Config:
-    #     orm_mode = True
\ No newline at end of file
+    #     orm_mode = True
+
+class TransactionPage(BaseModel):
+    items: list[Transaction]
+    next: Optional[str] = None
+
+class ImportRowResult(BaseModel):
+    row: int
+    status: Literal['created', 'invalid', 'failed']
+    id: Optional[str] = None
+    errors: List[str] = []
+
+class ImportResult(BaseModel):
+    created: int
+    failed: int
+    rows: List[ImportRowResult]
@@ -1,22 +1,9 @@
 """Routes for authentication"""
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import OAuth2PasswordRequestForm, APIKeyCookie
+from fastapi import APIRouter, Depends
+from fastapi.security import OAuth2PasswordRequestForm
 from models.auth import SignUpModel, ConfirmSignUpModel
 from services.cognito_service import CognitoService
-
-cookie_scheme = APIKeyCookie(name="access_token")
-
-async def verify_token(token: str = Depends(cookie_scheme)):
-    """Verify the token and return the payload"""
-    if not token:
-        raise HTTPException(status_code=403, detail="Not authenticated")
-    try:
-        payload = CognitoService.get_current_user_id(token)
-        if not payload:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        return payload
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid token") from e
+from utils.auth import cookie_scheme, forget_token, verify_claims, verify_token
 
 auth_router = APIRouter()
 
@@ -42,13 +29,21 @@ async def check_auth(current_user: dict = Depends(verify_token)):
 
 @auth_router.post("/logout")
 async def logout(token: str = Depends(cookie_scheme)):
-    """Logout the user"""
+    """Logout the user
+
+    Cognito's global sign out revokes the refresh token, but access tokens are
+    verified locally, so this one keeps being accepted until it expires (at most
+    an hour). Only this process's cached claims for it are dropped; other
+    workers and instances keep theirs. Clients must discard the token.
+    """
+    forget_token(token)
     return await CognitoService.logout(token)
 
 @auth_router.get("/users/me")
 async def read_users_me(token: str):
     """Get the current user"""
-    return await CognitoService.get_current_user_id(token)
+    claims = await verify_claims(token)
+    return claims['sub']
 
 # @auth_router.post("/refresh-token")
 # async def refresh_token(token: str):
@@ -57,15 +52,15 @@ async def read_users_me(token: str):
 @auth_router.post("/{username}/forgot-password")
 async def forgot_password(username: str):
     """Forgot password"""
-    return CognitoService.forgot_password(username)
+    return await CognitoService.forgot_password(username)
 
 @auth_router.post("/{username}/confirm-forgot-password")
 async def confirm_forgot_password(username: str, attributes: dict):
     """Confirm forgot password"""
-    return CognitoService.confirm_forgot_password(username, attributes)
+    return await CognitoService.confirm_forgot_password(username, attributes)
 
 @auth_router.post("/{username}/change-password")
 async def change_password(attributes: dict, username: str, token: str = Depends(cookie_scheme)):
     """Change password"""
-    return CognitoService.change_password(token, username, attributes)
+    return await CognitoService.change_password(token, username, attributes)
 
@@ -0,0 +1,28 @@
+"""Route exporting the process metrics for Prometheus"""
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from config.settings import settings
+from utils.metrics import registry
+
+metrics_router = APIRouter()
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+def verify_metrics_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)):
+    """Require the METRICS_TOKEN bearer token; without one configured the route does not exist"""
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(),
+                                                      settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False,
+                    dependencies=[Depends(verify_metrics_token)])
+def get_metrics():
+    """Prometheus text exposition of all registered metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,88 +1,355 @@
 """Transaction routes"""
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import APIKeyCookie
-from models.transaction import Transaction, TransactionCreate
-from utils.transactions import get_transaction_service
+import csv
+import json
+from itertools import chain
+from typing import Any, List, Optional, Union
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Body, File, UploadFile, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from models.transaction import ImportResult, Transaction, TransactionCreate, TransactionPage
+from models.balance import BatchBalanceRequest
+from config.settings import settings
+from utils.transactions import get_transaction_service, get_async_transaction_service, get_forecast_materializer
 from services.cognito_service import CognitoService
+from services.cognito_gateway import cognito_gateway
 from services.main_service import MainService
-
-transaction_service = get_transaction_service()
+from services.batch_forecast import iter_batch_forecasts
+from services.forecast_cache import forecast_cache
+from services.forecast_format import FORMATS, format_compact, format_forecast, iter_encoded_days
+from services.forecast_rollover import active_users, forecast_rollover
+from services.recurrence import parse_date
+from services.transaction_service import (
+    TransactionService, AsyncTransactionService, IdempotencyConflict, read_csv_rows
+)
+from services.storage import VersionMismatch
+from utils.etag import CACHE_CONTROL, expected_version, if_none_match, make_etag
+from utils.serialization import (
+    JSON_MEDIA_TYPE, accepts_gzip, accepts_msgpack, dumps_json, encode_response, gzip_stream
+)
+from utils.auth import require_group, verify_token
 
 SECRET_KEY = "your_secret_key"  # Replace with your actual secret key
 ALGORITHM = "HS256"
 
-cookie_scheme = APIKeyCookie(name="access_token")
-
-# Dependency to verify the token
-async def verify_token(token: str = Depends(cookie_scheme)):
-    """Verify the token and return the payload"""
-    if not token:
-        raise HTTPException(status_code=403, detail="Not authenticated")
-    try:
-        # Decode the JWT token
-        payload = CognitoService.get_current_user_id(token)
-        # Optionally check for expiration
-        if not payload:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        return payload
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid token") from e
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 t_router = APIRouter(
     dependencies=[Depends(verify_token)],
 )
 @t_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
+async def create_transaction(
+        transaction: TransactionCreate,
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
     """Create a new transaction"""
-    return transaction_service.create_transaction(transaction)
+    return await transaction_service.create_transaction(transaction)
+
+def check_import_size(rows: list):
+    if len(rows) > settings.BULK_IMPORT_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_IMPORT_MAX_ROWS} rows can be imported at once"
+        )
+
+@t_router.post("/users/{user_id}/transactions/bulk", response_model=ImportResult)
+async def import_transactions(
+        user_id: str,
+        rows: List[Any] = Body(...),
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
+    """Create many transactions from a JSON array, reporting the result of each row"""
+    check_import_size(rows)
+    return await transaction_service.import_transactions(user_id, rows)
+
+@t_router.post("/users/{user_id}/transactions/bulk/csv", response_model=ImportResult)
+async def import_transactions_csv(
+        user_id: str,
+        file: UploadFile = File(...),
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
+    """Create many transactions from an uploaded CSV with a header row of transaction fields"""
+    try:
+        rows = read_csv_rows((await file.read()).decode('utf-8-sig'))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}") from e
+    check_import_size(rows)
+    return await transaction_service.import_transactions(user_id, rows)
 
 @t_router.get("/transactions/{transaction_id}", response_model=Transaction)
-async def read_transaction(transaction_id: str):
-    """Get a transaction by ID"""
-    transaction = transaction_service.get_transaction(transaction_id)
+async def read_transaction(
+        transaction_id: str,
+        response: Response,
+        if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"),
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
+    """Get a transaction by ID, with its owner's data version as ETag for If-Match"""
+    transaction = await transaction_service.get_transaction(transaction_id)
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    headers = {'ETag': make_etag(await transaction_service.data_version(transaction.user_id)),
+               'Cache-Control': CACHE_CONTROL}
+    if if_none_match(if_none_match_header, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return transaction
 
 @t_router.put("/transactions/{transaction_id}", response_model=Transaction)
 async def update_transaction(
         transaction_id: str,
-        transaction: TransactionCreate
+        transaction: TransactionCreate,
+        if_match: Optional[str] = Header(None, alias="If-Match"),
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
     ):
-    """Update a transaction"""
-    updated_transaction = transaction_service.update_transaction(transaction_id, transaction)
+    """Update a transaction; with If-Match only if the owner's transactions are unchanged"""
+    version = None
+    if if_match is not None:
+        try:
+            version = expected_version(if_match)
+        except ValueError as e:
+            raise HTTPException(status_code=412, detail=str(e)) from e
+        if version is None and await transaction_service.get_transaction(transaction_id) is None:
+            raise HTTPException(status_code=412, detail="Transaction not found")
+    try:
+        updated_transaction = await transaction_service.update_transaction(transaction_id, transaction, version)
+    except VersionMismatch as e:
+        raise HTTPException(status_code=412, detail="Transactions changed since the ETag was issued") from e
     if updated_transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     return updated_transaction
 
 @t_router.delete("/transactions/{transaction_id}", response_model=dict)
-async def delete_transaction(transaction_id: str):
+async def delete_transaction(
+        transaction_id: str,
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
     """Delete a transaction"""
-    transaction_service.delete_transaction(transaction_id)
+    await transaction_service.delete_transaction(transaction_id)
     return {"message": "Transaction deleted successfully"}
 
-@t_router.get("/users/{user_id}/transactions", response_model=list[Transaction])
-async def get_user_transactions(user_id: str):
-    """Get all transactions for a user"""
-    return transaction_service.list_user_transactions(user_id)
+@t_router.get(
+    "/users/{user_id}/transactions",
+    response_model=Union[list[Transaction], TransactionPage]
+)
+async def get_user_transactions(
+        user_id: str,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        next_cursor: Optional[str] = Query(None, alias="next"),
+        if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"),
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
+    """Get all transactions for a user, or one page of them when limit or next is given
+
+    The ETag is the user's data version; a matching If-None-Match gets a 304
+    without querying the transactions.
+    """
+    headers = {'ETag': make_etag(await transaction_service.data_version(user_id)),
+               'Cache-Control': CACHE_CONTROL}
+    if if_none_match(if_none_match_header, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    if limit is None and next_cursor is None:
+        return await transaction_service.list_user_transactions(user_id)
+    try:
+        items, next_page = await transaction_service.list_user_transactions_page(
+            user_id, limit or DEFAULT_PAGE_SIZE, next_cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return TransactionPage(items=items, next=next_page)
 
 @t_router.get("/users/{user_id}/balance")
-def get_user_balance(user_id: str):
-    """Get the balance for a user"""
-    service=MainService(user_id)
-    return service.calculate_balances()
+def get_user_balance(
+        user_id: str,
+        from_date: Optional[str] = Query(None, alias="from"),
+        to_date: Optional[str] = Query(None, alias="to"),
+        sparse: bool = False,
+        response_format: str = Query("full", alias="format", pattern=f"^({'|'.join(FORMATS)})$"),
+        accept: Optional[str] = Header(None),
+        if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"),
+        transaction_service: TransactionService = Depends(get_transaction_service)
+    ):
+    """Get the balance for a user, optionally for the from/to range (mm-dd-yyyy)
+
+    sparse=true returns only the first day of the range and days with income or expenses.
+    format=compact or format=columnar lists each transaction once and refers to it
+    by id; those formats are sent as msgpack when the Accept header asks for it.
+    The ETag combines the user's data version and the forecast start date; a
+    matching If-None-Match gets a 304 without computing the forecast. With
+    forecast snapshots enabled, requests for the default range are answered
+    from the user's snapshot.
+    """
+    try:
+        service=MainService(
+            user_id,
+            transaction_service,
+            start=parse_date(from_date),
+            end=parse_date(to_date)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    active_users.touch(user_id)
+    version = transaction_service.data_version(user_id)
+    msgpack = response_format != "full" and accepts_msgpack(accept)
+    qualifiers = [service.window_start.strftime('%Y%m%d')]
+    if msgpack:
+        qualifiers.append('msgpack')
+    headers = {'ETag': make_etag(version, *qualifiers), 'Cache-Control': CACHE_CONTROL}
+    if if_none_match(if_none_match_header, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    materializer = get_forecast_materializer()
+    if materializer is not None and not sparse and from_date is None and to_date is None:
+        body = materializer.read(service, version)
+        if response_format == "compact" and not msgpack:
+            # Already the encoded response body
+            response = Response(content=body, media_type=JSON_MEDIA_TYPE, headers={'Vary': 'Accept'})
+        elif response_format == "full":
+            response = Response(content=dumps_json(format_compact(json.loads(body), "full")),
+                                media_type=JSON_MEDIA_TYPE)
+        else:
+            response = encode_response(format_compact(json.loads(body), response_format), accept)
+        response.headers.update(headers)
+        return response
+
+    forecast = service.calculate_balances(sparse=sparse, version=version)
+    if response_format == "full":
+        response = JSONResponse(content=jsonable_encoder(forecast), headers=headers)
+    else:
+        response = encode_response(format_forecast(forecast, response_format), accept)
+        response.headers.update(headers)
+    return response
+
+@t_router.get("/users/{user_id}/balance/stream")
+def stream_user_balance(
+        user_id: str,
+        from_date: Optional[str] = Query(None, alias="from"),
+        to_date: Optional[str] = Query(None, alias="to"),
+        sparse: bool = False,
+        accept: Optional[str] = Header(None),
+        accept_encoding: Optional[str] = Header(None),
+        if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"),
+        transaction_service: TransactionService = Depends(get_transaction_service)
+    ):
+    """Stream the balance for a user day by day in the full format, as it is computed
+
+    Days are sent as NDJSON lines {"date": mm-dd-yyyy, ...day}, or as server-sent
+    events when the Accept header asks for text/event-stream, a week at a time.
+    The stream gzips itself when the client accepts it. ETags work as for the
+    balance route.
+    """
+    try:
+        service=MainService(
+            user_id,
+            transaction_service,
+            start=parse_date(from_date),
+            end=parse_date(to_date)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    active_users.touch(user_id)
+    version = transaction_service.data_version(user_id)
+    event_stream = 'text/event-stream' in (accept or '')
+    qualifiers = [service.window_start.strftime('%Y%m%d')]
+    if event_stream:
+        qualifiers.append('events')
+    headers = {
+        'ETag': make_etag(version, *qualifiers),
+        'Cache-Control': CACHE_CONTROL,
+        'Vary': 'Accept, Accept-Encoding',
+        # Keep proxies such as nginx from buffering the stream
+        'X-Accel-Buffering': 'no',
+    }
+    if if_none_match(if_none_match_header, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    chunks = iter_encoded_days(service.iter_balances(sparse=sparse, version=version), event_stream)
+    if accepts_gzip(accept_encoding):
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    # Prime the generator so a failed fetch is reported before streaming starts
+    first = next(chunks, b"")
+    return StreamingResponse(
+        chain([first], chunks),
+        media_type="text/event-stream" if event_stream else "application/x-ndjson",
+        headers=headers
+    )
+
+def batch_enabled():
+    """The batch route is off unless BATCH_FORECAST_ENABLED is set"""
+    if not settings.BATCH_FORECAST_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@t_router.post(
+    "/balances/batch",
+    dependencies=[Depends(batch_enabled), Depends(require_group(settings.BATCH_FORECAST_GROUP))]
+)
+def get_batch_balances(
+        request: BatchBalanceRequest,
+        transaction_service: TransactionService = Depends(get_transaction_service)
+    ):
+    """Stream the balances of many users as NDJSON, one {"user_id", "balances" | "error"} per line
+
+    It reads any user's data, so only members of the BATCH_FORECAST_GROUP
+    Cognito group may call it, and only with BATCH_FORECAST_ENABLED.
+    """
+    if len(request.user_ids) > settings.BATCH_FORECAST_MAX_USERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BATCH_FORECAST_MAX_USERS} user_ids per batch"
+        )
+    if request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    try:
+        lines = iter_batch_forecasts(
+            request.user_ids,
+            transaction_service,
+            start=parse_date(request.from_date),
+            end=parse_date(request.to_date),
+            sparse=request.sparse,
+            response_format=request.format
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@t_router.get("/forecast-cache/stats")
+def get_forecast_cache_stats():
+    """Get the forecast cache hit/miss counters"""
+    return forecast_cache.stats()
+
+@t_router.get("/forecast-rollover/stats")
+def get_forecast_rollover_stats():
+    """Get the active user count and progress of the daily forecast rollover"""
+    return forecast_rollover.stats()
+
+@t_router.get("/cognito-gateway/stats")
+def get_cognito_gateway_stats():
+    """Get the Cognito gateway queue depth, breaker state and call latency"""
+    return cognito_gateway.stats()
 
 @t_router.post("/users/{username}/update-attributes")
-def update_user_attributes(username: str, attributes: dict):
+async def update_user_attributes(username: str, attributes: dict):
     """Update the user attributes"""
-    return CognitoService.update_user_attributes(username=username, attributes=attributes)
+    return await CognitoService.update_user_attributes(username=username, attributes=attributes)
 
 @t_router.post("/users/{username}/mark-onboarding-completed")
-def mark_onboarding_completed(username: str, attributes: dict):
+async def mark_onboarding_completed(username: str, attributes: dict):
     """Update the user attributes"""
-    return CognitoService.mark_onboarding_completed(username=username, attributes=attributes)
+    return await CognitoService.mark_onboarding_completed(username=username, attributes=attributes)
 
 @t_router.post("/users/{user_id}/borrow")
-def borrow_money(user_id: str, attributes: dict):
-    """Borrow money"""
-    return transaction_service.borrow_money(user_id, attributes)
+async def borrow_money(
+        user_id: str,
+        attributes: dict,
+        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+        transaction_service: AsyncTransactionService = Depends(get_async_transaction_service)
+    ):
+    """Borrow money; retries with the same Idempotency-Key return the original loan"""
+    try:
+        return await transaction_service.borrow_money(user_id, attributes, idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
@@ -0,0 +1,148 @@
+"""Forecasts for many users at once.
+
+Transactions are fetched on a thread pool, grouped into chunks and the CPU-bound
+forecasts are computed on a shared process pool. Each user's result is yielded
+as one encoded NDJSON line as soon as its chunk finishes, so a failure only
+affects the users it belongs to.
+"""
+import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from config.settings import settings, dbconf
+from services.forecast_format import format_forecast
+from services.main_service import MainService
+from utils.serialization import dumps_json
+
+logger = logging.getLogger(__name__)
+
+PROCESSES = settings.BATCH_FORECAST_PROCESSES or os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def get_process_pool() -> ProcessPoolExecutor:
+    # spawn, since forking a process that runs boto3 and executor threads is unsafe
+    return ProcessPoolExecutor(
+        max_workers=PROCESSES,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def encode_result(user_id: str, balances=None, error: Optional[str] = None) -> bytes:
+    """Encode one user's result as an NDJSON line"""
+    record = {'user_id': user_id}
+    if error is None:
+        record['balances'] = jsonable_encoder(balances)
+    else:
+        record['error'] = error
+    return dumps_json(record) + b'\n'
+
+
+def forecast_chunk(chunk: List[Tuple[str, list]], start: datetime, end: datetime,
+                   sparse: bool = False, response_format: str = 'full') -> List[bytes]:
+    """Compute and encode the forecasts for a chunk of (user_id, transactions)
+
+    Runs in a worker process; results are encoded there so only bytes travel back.
+    """
+    lines = []
+    for user_id, transactions in chunk:
+        try:
+            service = MainService(user_id, start=start, end=end)
+            forecast = service.build_forecast(transactions, sparse).forecast
+            lines.append(encode_result(user_id, format_forecast(forecast, response_format)))
+        except Exception as e:
+            logger.exception("Batch forecast failed for user: %s", user_id)
+            lines.append(encode_result(user_id, error=str(e)))
+    return lines
+
+
+def iter_batch_forecasts(
+        user_ids: Iterable[str],
+        transaction_service,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        sparse: bool = False,
+        response_format: str = 'full',
+        chunk_size: Optional[int] = None,
+        fetch_workers: Optional[int] = None,
+        pool: Optional[ProcessPoolExecutor] = None
+    ) -> Iterator[bytes]:
+    """Return an iterator of one NDJSON line per distinct user, in completion order
+
+    Raises ValueError right away if the range is invalid; nothing is fetched or
+    computed until the iterator is consumed. The number of fetched but not yet
+    computed users is bounded, so memory stays flat for large batches.
+    """
+    window = MainService('', transaction_service, start=start, end=end)
+    return _iter_batch(
+        user_ids, transaction_service, window.start_range, window.end_range, sparse, response_format,
+        chunk_size or settings.BATCH_FORECAST_CHUNK_SIZE,
+        fetch_workers or dbconf.TRANSACTION_EXECUTOR_WORKERS,
+        pool
+    )
+
+
+def _iter_batch(user_ids, transaction_service, start: datetime, end: datetime, sparse: bool,
+                response_format: str, chunk_size: int, fetch_workers: int,
+                pool: Optional[ProcessPoolExecutor]) -> Iterator[bytes]:
+    pool = pool or get_process_pool()
+    max_chunks = 2 * PROCESSES
+
+    def fetch(user_id):
+        return transaction_service.list_user_transactions(user_id)
+
+    users = iter(dict.fromkeys(user_ids))
+    pending_fetches = {}
+    pending_chunks = {}
+    chunk = []
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetcher:
+        try:
+            while True:
+                while len(pending_fetches) < fetch_workers and len(pending_chunks) < max_chunks:
+                    user_id = next(users, None)
+                    if user_id is None:
+                        break
+                    pending_fetches[fetcher.submit(fetch, user_id)] = user_id
+
+                if chunk and (len(chunk) >= chunk_size or not pending_fetches):
+                    chunk_users = [user_id for user_id, _ in chunk]
+                    try:
+                        future = pool.submit(forecast_chunk, chunk, start, end, sparse, response_format)
+                    except BrokenProcessPool as e:
+                        get_process_pool.cache_clear()
+                        for user_id in chunk_users:
+                            yield encode_result(user_id, error=str(e))
+                    else:
+                        pending_chunks[future] = chunk_users
+                    chunk = []
+                    continue
+                if not pending_fetches and not pending_chunks:
+                    break
+
+                done, _ = wait([*pending_fetches, *pending_chunks], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in pending_fetches:
+                        user_id = pending_fetches.pop(future)
+                        try:
+                            chunk.append((user_id, future.result()))
+                        except Exception as e:
+                            logger.exception("Fetching transactions failed for user: %s", user_id)
+                            yield encode_result(user_id, error=str(e))
+                        continue
+                    chunk_users = pending_chunks.pop(future)
+                    try:
+                        yield from future.result()
+                    except Exception as e:
+                        logger.exception("Batch forecast chunk failed")
+                        if isinstance(e, BrokenProcessPool):
+                            get_process_pool.cache_clear()
+                        for user_id in chunk_users:
+                            yield encode_result(user_id, error=str(e))
+        finally:
+            for future in [*pending_fetches, *pending_chunks]:
+                future.cancel()
@@ -0,0 +1,254 @@
+"""Bounded, time-limited access to the Cognito client.
+
+Calls run on a dedicated thread pool instead of the event loop or the shared
+threadpool. When the pool and its queue are full new calls are shed with a 503
+rather than queued. Each operation has a timeout (504), Cognito throttling is
+returned as 429, and repeated throttling, timeouts or connection failures open
+a circuit breaker that rejects calls with 503 until a trial call succeeds.
+"""
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from botocore.exceptions import BotoCoreError, ClientError
+from fastapi import HTTPException, status
+from config.settings import settings
+from utils.aws import get_cognito_client
+from utils.metrics import registry
+
+THROTTLING_ERRORS = frozenset({'ThrottlingException', 'TooManyRequestsException', 'RequestLimitExceeded'})
+
+# Sign up and confirmation may run user pool Lambda triggers
+OPERATION_TIMEOUTS = {
+    'sign_up': 2 * settings.COGNITO_TIMEOUT,
+    'confirm_sign_up': 2 * settings.COGNITO_TIMEOUT,
+}
+
+
+class CircuitBreaker:
+    """Opens after threshold consecutive failures and lets one trial call through after cooldown"""
+    def __init__(self, threshold: int, cooldown: float, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if self.clock() - self.opened_at < self.cooldown else 'half-open'
+
+    def allow(self) -> bool:
+        """Whether a call may proceed; in half-open state only one trial call at a time"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at < self.cooldown or self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.trial_in_flight = False
+
+    def release(self):
+        """Give up a trial call that ended without a verdict"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 1
+        return max(1, math.ceil(self.cooldown - (self.clock() - self.opened_at)))
+
+
+class OperationStats:
+    """Counters and latency totals for one Cognito operation"""
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.queue_wait_total = 0.0
+
+    def as_dict(self):
+        completed = self.calls - self.rejected
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+            'latency_ms_avg': self.latency_total / completed * 1000 if completed else 0.0,
+            'latency_ms_max': self.latency_max * 1000,
+            'queue_wait_ms_avg': self.queue_wait_total / completed * 1000 if completed else 0.0,
+        }
+
+
+class CognitoGateway:
+    """Runs Cognito client operations on a bounded pool with admission control"""
+    def __init__(self, client, max_workers: int, max_queue: int, timeout: float,
+                 breaker: CircuitBreaker):
+        self.client = client
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.timeout = timeout
+        self.breaker = breaker
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cognito')
+        # Submitted calls whose thread work has not finished, timed out ones included
+        self.pending = 0
+        self.operations: Dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, operation: str) -> OperationStats:
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations.setdefault(operation, OperationStats())
+        return stats
+
+    def _reject(self, stats: OperationStats, detail: str, retry_after: int):
+        stats.rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={'Retry-After': str(retry_after)}
+        )
+
+    def _invoke(self, operation: str, kwargs: dict, submitted: float):
+        started = time.monotonic()
+        try:
+            return getattr(self.client, operation)(**kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            stats = self._stats(operation)
+            with self._lock:
+                stats.latency_total += elapsed
+                stats.latency_max = max(stats.latency_max, elapsed)
+                stats.queue_wait_total += started - submitted
+
+    def _finished(self, _future):
+        with self._lock:
+            self.pending -= 1
+
+    async def call(self, operation: str, **kwargs):
+        """Run client.<operation>(**kwargs) off the event loop
+
+        Client errors other than throttling are re-raised unchanged, so callers
+        keep handling them as before.
+        """
+        stats = self._stats(operation)
+        stats.calls += 1
+        with self._lock:
+            admitted = self.pending < self.capacity
+            if admitted:
+                self.pending += 1
+        if not admitted:
+            self._reject(stats, "Authentication service is busy, try again later", 1)
+        if not self.breaker.allow():
+            self._finished(None)
+            self._reject(stats, "Authentication service is unavailable, try again later",
+                         self.breaker.retry_after())
+
+        # The request's context goes along so its AWS calls are attributed to it
+        future = self.executor.submit(
+            contextvars.copy_context().run, self._invoke, operation, kwargs, time.monotonic()
+        )
+        # Runs on cancellation too, so a call dropped from the queue frees its slot
+        future.add_done_callback(self._finished)
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(future), OPERATION_TIMEOUTS.get(operation, self.timeout)
+            )
+        except asyncio.TimeoutError as e:
+            stats.timeouts += 1
+            self.breaker.record_failure()
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Authentication service timed out"
+            ) from e
+        except ClientError as e:
+            stats.errors += 1
+            if e.response.get('Error', {}).get('Code') in THROTTLING_ERRORS:
+                stats.throttled += 1
+                self.breaker.record_failure()
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests, try again later",
+                    headers={'Retry-After': str(self.breaker.retry_after())}
+                ) from e
+            # Cognito answered; the request itself was refused
+            self.breaker.record_success()
+            raise
+        except BotoCoreError as e:
+            stats.errors += 1
+            self.breaker.record_failure()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service is unavailable, try again later"
+            ) from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def stats(self):
+        """Return queue depth, breaker state and per-operation counters"""
+        with self._lock:
+            pending = self.pending
+        return {
+            'in_flight': min(pending, self.max_workers),
+            'queued': max(0, pending - self.max_workers),
+            'capacity': self.capacity,
+            'breaker': self.breaker.state,
+            'operations': {name: stats.as_dict() for name, stats in self.operations.items()},
+        }
+
+
+cognito_gateway = CognitoGateway(
+    get_cognito_client(),
+    max_workers=settings.COGNITO_MAX_WORKERS,
+    max_queue=settings.COGNITO_MAX_QUEUE,
+    timeout=settings.COGNITO_TIMEOUT,
+    breaker=CircuitBreaker(
+        threshold=settings.COGNITO_BREAKER_THRESHOLD,
+        cooldown=settings.COGNITO_BREAKER_COOLDOWN
+    )
+)
+
+registry.callback('cognito_gateway_in_flight', 'Cognito calls running on the gateway pool',
+                  lambda: cognito_gateway.stats()['in_flight'])
+registry.callback('cognito_gateway_queued', 'Cognito calls waiting for a gateway worker',
+                  lambda: cognito_gateway.stats()['queued'])
+registry.callback('cognito_gateway_breaker_open', 'Whether the Cognito circuit breaker rejects calls',
+                  lambda: int(cognito_gateway.breaker.state == 'open'))
+registry.callback(
+    'cognito_gateway_rejected_total', 'Cognito calls shed by the gateway or its breaker',
+    lambda: {(name,): stats.rejected for name, stats in cognito_gateway.operations.items()},
+    kind='counter', labelnames=['operation']
+)
+registry.callback(
+    'cognito_gateway_timeouts_total', 'Cognito calls that exceeded their timeout',
+    lambda: {(name,): stats.timeouts for name, stats in cognito_gateway.operations.items()},
+    kind='counter', labelnames=['operation']
+)
@@ -1,34 +1,55 @@
 """CognitoService class which provides methods to interact with AWS Cognito."""
 import logging
-import time
-import httpx
-import boto3
 from botocore.exceptions import ClientError
-from jose import jwt, JWTError, jwk
+from jose import jwt, JWTError
+from jose.exceptions import ExpiredSignatureError
 from fastapi import HTTPException, status
 from fastapi.responses import JSONResponse
-from models.auth import TokenPayload
 from config.settings import settings
-logging.basicConfig(level=logging.INFO)
+from services.cognito_gateway import cognito_gateway
+from services.jwks import JWKSUnavailable, jwks_manager
+from utils.aws import get_cognito_client
+from utils.cache import LRUCache
 logger = logging.getLogger(__name__)
 
-cognito_client = boto3.client('cognito-idp', region_name=settings.AWS_REGION)
-boto3.set_stream_logger('botocore', level='DEBUG')
+cognito_client = get_cognito_client()
 
 class CognitoService:
     """Service class to interact with AWS Cognito."""
-    jwks_cache = {}
-    jwks_cache_timestamp = 0
+    # Profile attributes by cognito:username, dropped when the attributes are updated
+    profile_cache = LRUCache(
+        max_entries=settings.PROFILE_CACHE_MAX_ENTRIES,
+        ttl=settings.PROFILE_CACHE_TTL
+    )
+    # Emails list_users found registered. Free ones are never cached: another
+    # worker may register the email meanwhile, and this one could not tell
+    taken_emails = LRUCache(
+        max_entries=settings.EMAIL_CACHE_MAX_ENTRIES,
+        ttl=settings.EMAIL_CACHE_TTL
+    )
 
     @staticmethod
-    def email_exists(email):
-        """Check if an email exists in the Cognito user pool"""
+    async def email_exists(email):
+        """Check if an email exists in the Cognito user pool
+
+        Emails found taken are remembered for EMAIL_CACHE_TTL seconds, so
+        repeated sign ups with a registered email skip the list_users call.
+        """
+        if CognitoService.taken_emails.get(email):
+            return True
         try:
-            response = cognito_client.list_users(
+            escaped = email.replace('\\', '\\\\').replace('"', '\\"')
+            response = await cognito_gateway.call(
+                'list_users',
                 UserPoolId=settings.AWS_COGNITO_USER_POOL_ID,
-                Filter=f'email = "{email}"'
+                Filter=f'email = "{escaped}"',
+                AttributesToGet=['email'],
+                Limit=1
             )
-            return len(response['Users']) > 0
+            exists = len(response['Users']) > 0
+            if exists:
+                CognitoService.taken_emails.set(email, True)
+            return exists
         except ClientError as e:
             logger.error("Error checking email existence: %s", e)
             raise HTTPException(status_code=500, detail="Error checking email existence") from e
@@ -36,10 +57,11 @@ class CognitoService:
     @staticmethod
     async def sign_up(user):
         """Signup a user with Cognito"""
-        if CognitoService.email_exists(user.email):
+        if await CognitoService.email_exists(user.email):
             raise HTTPException(status_code=409, detail="Email already exists.")
         try:
-            response = cognito_client.sign_up(
+            response = await cognito_gateway.call(
+                'sign_up',
                 ClientId=settings.AWS_COGNITO_CLIENT_ID,
                 Username=user.username,
                 Password=user.password,
@@ -51,6 +73,7 @@ class CognitoService:
                     {'Name': 'custom:acceptTnC', 'Value': str(user.privacy_policy)}
                 ]
             )
+            CognitoService.taken_emails.set(user.email, True)
             return {"message": "User signed up successfully"}
         except ClientError as e:
             error_code = e.response['Error']['Code']
@@ -62,6 +85,9 @@ class CognitoService:
                 raise HTTPException(status_code=400, detail="Invalid parameters provided.") from e
             else:
                 raise HTTPException(status_code=400, detail=str(e)) from e
+        except HTTPException:
+            # Shed, throttled or timed out by the gateway
+            raise
         except Exception as e:
             # For any other unexpected exceptions
             logger.error("Error: %s", e)
@@ -71,12 +97,15 @@ class CognitoService:
     async def confirm_sign_up(confirm):
         """Confirm the user signup with the confirmation code"""
         try:
-            cognito_client.confirm_sign_up(
+            await cognito_gateway.call(
+                'confirm_sign_up',
                 ClientId=settings.AWS_COGNITO_CLIENT_ID,
                 Username=confirm.username,
                 ConfirmationCode=confirm.confirmation_code
             )
             return {"message": "User confirmed successfully"}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("Error: %s", e)
             raise HTTPException(status_code=400, detail=str(e)) from e
@@ -92,13 +121,47 @@ class CognitoService:
 
         return parsed_data
 
+    @staticmethod
+    def token_username(access_token):
+        """cognito:username of an access token initiate_auth just returned, or None
+
+        The claims are read unverified, as the token came straight from Cognito.
+        """
+        try:
+            return jwt.get_unverified_claims(access_token).get('username')
+        except JWTError:
+            return None
+
+    @staticmethod
+    async def get_login_profile(username, authentication):
+        """Profile attributes from the verified ID token, else the profile cache or get_user
+
+        username is the name logged in with, which may be an alias; the cache is
+        keyed on cognito:username.
+        """
+        try:
+            claims = await CognitoService.decode_and_validate_token(
+                authentication['IdToken'], token_use='id', access_token=authentication['AccessToken']
+            )
+            parsed_data = {"username": claims['cognito:username'], **claims}
+        except (KeyError, HTTPException) as e:
+            logger.warning("Falling back to get_user for %s: %s", username, e)
+            cognito_username = CognitoService.token_username(authentication['AccessToken'])
+            parsed_data = CognitoService.profile_cache.get(cognito_username) if cognito_username else None
+            if parsed_data is None:
+                user_info = await cognito_gateway.call('get_user', AccessToken=authentication['AccessToken'])
+                parsed_data = CognitoService.parse_user_attributes(user_info)
+        CognitoService.profile_cache.set(parsed_data['username'], parsed_data)
+        return parsed_data
+
     @staticmethod
     async def login(username, password):
         """Login a user with Cognito"""
         try:
             from config.settings import settings
             allowed_origins = settings.ALLOWED_ORIGINS.split(",")
-            cognito_response = cognito_client.initiate_auth(
+            cognito_response = await cognito_gateway.call(
+                'initiate_auth',
                 ClientId=settings.AWS_COGNITO_CLIENT_ID,
                 AuthFlow='USER_PASSWORD_AUTH',
                 AuthParameters={
@@ -106,10 +169,9 @@ class CognitoService:
                     'PASSWORD': password
                 }
             )
-            user_info = cognito_client.get_user(
-                AccessToken=cognito_response['AuthenticationResult']['AccessToken']
+            parsed_data = await CognitoService.get_login_profile(
+                username, cognito_response['AuthenticationResult']
             )
-            parsed_data = CognitoService.parse_user_attributes(user_info)
             response_data = {
                 "username": parsed_data['username'],
                 "user_id": parsed_data['sub'],
@@ -140,6 +202,8 @@ class CognitoService:
                 max_age=2592000  # 30 days
             )
             return response
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e)) from e
 
@@ -147,69 +211,90 @@ class CognitoService:
     async def logout(token):
         """Logout a user from Cognito"""
         try:
-            cognito_client.global_sign_out(AccessToken=token)
+            await cognito_gateway.call('global_sign_out', AccessToken=token)
             
             response = JSONResponse(content={"message": "User logged out successfully"})
             response.delete_cookie("access_token")
             response.delete_cookie("refresh_token")
             return response
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e)) from e
 
     @staticmethod
-    async def get_jwks():
-        """Get the JWKS from the Cognito endpoint"""
-        if time.time() - CognitoService.jwks_cache_timestamp > settings.JWKS_CACHE_TIMEOUT:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(settings.KEYS_URL)
-                CognitoService.jwks_cache = response.json()['keys']
-            CognitoService.jwks_cache_timestamp = time.time()
-        return CognitoService.jwks_cache
+    async def get_signing_key(kid):
+        """Get the public key for a key id from the Cognito JWKS"""
+        try:
+            return await jwks_manager.get_key(kid)
+        except JWKSUnavailable as e:
+            logger.error("Error: %s", e)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Unable to verify token") from e
 
     @staticmethod
-    async def decode_and_validate_token(token: str):
-        """Decode and validate the JWT token"""
+    async def decode_and_validate_token(token: str, token_use: str = 'access', access_token: str = None) -> dict:
+        """Verify a token's signature, expiry, issuer, use and client and return its claims
+
+        ID tokens name the client in aud, access tokens in client_id.
+        """
         try:
-            headers = jwt.get_unverified_headers(token)
-            kid = headers['kid']
-            jwks = await CognitoService.get_jwks()
-            key = next((k for k in jwks if k['kid'] == kid), None)
-            if not key:
+            kid = jwt.get_unverified_header(token).get('kid')
+            public_key = await CognitoService.get_signing_key(kid)
+            if not public_key:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                                     detail="Key not found")
-            public_key = jwk.construct(key)
-            payload = jwt.decode(
+            claims = jwt.decode(
                 token,
-                public_key.to_pem(),
-                options={'verify_exp': False, "verify_signature": False}
+                public_key,
+                algorithms=['RS256'],
+                issuer=settings.ISSUER,
+                audience=settings.AWS_COGNITO_CLIENT_ID if token_use == 'id' else None,
+                access_token=access_token,
+                options={'verify_aud': token_use == 'id', 'require_exp': True, 'require_sub': True}
             )
-            return TokenPayload(**payload)
+        except ExpiredSignatureError as e:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired") from e
         except JWTError as e:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token") from e
-
+        client_id = claims.get('aud') if token_use == 'id' else claims.get('client_id')
+        if claims.get('token_use') != token_use or client_id != settings.AWS_COGNITO_CLIENT_ID:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token")
+        return claims
 
     @staticmethod
-    def get_current_user_id(token: str):
-        """Get the current user ID from the JWT token"""
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    async def forget_profile(username):
+        """Drop the cached login profile of a user named by cognito:username or an alias
+
+        A name that is not a cached cognito:username is resolved with admin_get_user,
+        unless no profile is cached at all.
+        """
+        profiles = CognitoService.profile_cache
+        if profiles.pop(username) is not None or not len(profiles):
+            return
         try:
-            payload = jwt.get_unverified_claims(token)
-            username: str = payload.get("sub")
-            return username
-        except JWTError as e:
-            raise credentials_exception from e
+            user = await cognito_gateway.call(
+                'admin_get_user',
+                UserPoolId=settings.AWS_COGNITO_USER_POOL_ID,
+                Username=username
+            )
+        except Exception as e:
+            logger.warning("Could not resolve %s to drop its cached profile: %s", username, e)
+            return
+        profiles.pop(user['Username'])
 
     @staticmethod
-    def change_password(token, username, attributes):
+    async def change_password(token, username, attributes):
         """Change the password of a user"""
         try:
-            cognito_client.change_password(
+            await cognito_gateway.call(
+                'change_password',
                 AccessToken=token,
                 PreviousPassword=attributes.get('currentPassword'),
                 ProposedPassword=attributes.get('newPassword')
@@ -221,44 +306,52 @@ class CognitoService:
             raise HTTPException(status_code=400, detail="Invalid new password format") from exc
         except cognito_client.exceptions.LimitExceededException as exc:
             raise HTTPException(status_code=400, detail="Password change limit exceeded") from exc
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("Error: %s", e)
             raise HTTPException(status_code=400, detail=str(e)) from e
 
     @staticmethod
-    def forgot_password(username):
+    async def forgot_password(username):
         """Send a password reset code to the user's email"""
         try:
-            cognito_client.forgot_password(
+            await cognito_gateway.call(
+                'forgot_password',
                 ClientId=settings.AWS_COGNITO_CLIENT_ID,
                 Username=username
             )
             return {"message": "Password reset code sent successfully"}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("Error: %s", e)
             raise HTTPException(status_code=400, detail=str(e)) from e
 
     @staticmethod
-    def confirm_forgot_password(username, atributes):
+    async def confirm_forgot_password(username, atributes):
         """Confirm the password reset with the confirmation code"""
-        print(atributes)
         try:
-            cognito_client.confirm_forgot_password(
+            await cognito_gateway.call(
+                'confirm_forgot_password',
                 ClientId=settings.AWS_COGNITO_CLIENT_ID,
                 Username=username,
                 ConfirmationCode=atributes['code'],
                 Password=atributes['password']
             )
             return {"message": "Password reset successfully"}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("Error: %s", e)
             raise HTTPException(status_code=400, detail=str(e)) from e
 
     @staticmethod
-    def update_user_attributes(username, attributes):
+    async def update_user_attributes(username, attributes):
         """Update the user attributes in Cognito"""
         try:
-            cognito_client.admin_update_user_attributes(
+            await cognito_gateway.call(
+                'admin_update_user_attributes',
                 UserPoolId=settings.AWS_COGNITO_USER_POOL_ID,
                 Username=username,
                 UserAttributes=[
@@ -268,6 +361,7 @@ class CognitoService:
                     {'Name': 'custom:avatar', 'Value': str(attributes.get('avatar', ''))}
                 ]
             )
+            await CognitoService.forget_profile(username)
             return {"message": "User attributes updated successfully"}
         except cognito_client.exceptions.UserNotFoundException as exc:
             raise HTTPException(status_code=404, detail="User not found") from exc
@@ -275,15 +369,18 @@ class CognitoService:
             raise HTTPException(status_code=400, detail="Invalid parameters provided") from exc
         except cognito_client.exceptions.LimitExceededException as exc:
             raise HTTPException(status_code=400, detail="Attribute limit exceeded") from exc
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("Error: %s", e)
             raise HTTPException(status_code=400, detail=str(e)) from e
 
     @staticmethod
-    def mark_onboarding_completed(username, attributes):
+    async def mark_onboarding_completed(username, attributes):
         """Update the user attributes in Cognito"""
         try:
-            cognito_client.admin_update_user_attributes(
+            await cognito_gateway.call(
+                'admin_update_user_attributes',
                 UserPoolId=settings.AWS_COGNITO_USER_POOL_ID,
                 Username=username,
                 UserAttributes=[
@@ -293,7 +390,10 @@ class CognitoService:
                     }
                 ]
             )
+            await CognitoService.forget_profile(username)
             return {"message": "onboarding completed marked successfully"}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error("Error: %s", e)
             raise HTTPException(status_code=400, detail=str(e)) from e
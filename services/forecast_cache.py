@@ -0,0 +1,181 @@
+"""In-process cache of computed forecasts keyed by user, window start date, requested range and sparseness"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from config.settings import settings
+from utils.cache import LRUCache
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastCache:
+    """LRU + TTL cache of per-user forecast engines, updated on every transaction write
+
+    When callers pass the user's data version, the cache remembers which version
+    its forecasts reflect and treats them as missing once the stored version
+    moves on without this process seeing the write, e.g. after a write through
+    another process.
+
+    When the calendar day changes, forecasts of the previous window are dropped,
+    except that with keep_previous dense whole-window ones are set aside for the
+    rollover job to roll forward with take_previous.
+
+    A computation reads generation(user_id) before fetching transactions and
+    passes it to set, which drops the result if that user was written since.
+    Stamps are kept for the max_writers most recently written users; an older
+    one is forgotten by raising the floor every unknown user reports, so a
+    computation that started before it was forgotten is not cached either.
+    """
+    def __init__(self, max_entries: int, ttl: float, max_days: int, keep_previous: bool = False,
+                 max_writers: int = 65536):
+        # Weight is the number of day records so the bound tracks memory, not users
+        self._cache = LRUCache(max_entries, ttl=ttl, max_weight=max_days, weigher=len)
+        self._lock = threading.Lock()
+        self._window_start = None
+        self._versions: Dict[str, int] = {}
+        self.keep_previous = keep_previous
+        self._previous: Dict[str, object] = {}
+        self.max_writers = max_writers
+        # Users by the stamp of their last write, oldest first
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._generation_floor = 0
+        self._stamp = 0
+
+    def generation(self, user_id: str) -> int:
+        """Stamp of the user's last write seen by this cache, to pass to set"""
+        with self._lock:
+            return self._generations.get(user_id, self._generation_floor)
+
+    def _bump_generation(self, user_id: str):
+        """Record a write by user_id; call with the lock held"""
+        self._stamp += 1
+        self._generations[user_id] = self._stamp
+        self._generations.move_to_end(user_id)
+        if len(self._generations) > self.max_writers:
+            _, self._generation_floor = self._generations.popitem(last=False)
+
+    def get(self, user_id: str, window: Tuple[date, date, date, bool], version: Optional[int] = None):
+        """Return the cached forecast engine for (window start, range start, range end, sparse), or None"""
+        self._roll_over(window[0])
+        if version is not None and self._versions.get(user_id) != version:
+            if user_id in self._versions:
+                self.invalidate(user_id)
+            self._cache.misses += 1
+            return None
+        return self._cache.get((user_id, *window))
+
+    def set(self, user_id: str, window: Tuple[date, date, date, bool], forecast, generation: int,
+            version: Optional[int] = None, ttl: Optional[float] = None):
+        """Cache a forecast unless the user was written since generation was read
+
+        ttl overrides the cache-wide expiry, e.g. to keep prepared forecasts all day.
+        """
+        with self._lock:
+            if generation != self._generations.get(user_id, self._generation_floor):
+                return
+            if version is not None and self._versions.get(user_id) != version:
+                # Entries of another or an unknown version may be stale
+                self._cache.pop_where(lambda key: key[0] == user_id)
+                self._versions[user_id] = version
+            self._cache.set((user_id, *window), forecast, ttl=ttl)
+
+    def invalidate(self, user_id: str):
+        """Drop every cached forecast for a user"""
+        with self._lock:
+            self._bump_generation(user_id)
+            self._versions.pop(user_id, None)
+            self._previous.pop(user_id, None)
+            self._cache.pop_where(lambda key: key[0] == user_id)
+
+    def upsert(self, user_id: str, transaction, version: Optional[int] = None):
+        """Apply a created or updated transaction to the user's cached forecasts
+
+        version is the user's data version after the write.
+        """
+        self._apply(user_id, lambda forecast: forecast.upsert(transaction), version)
+
+    def remove(self, user_id: str, transaction_id: str, version: Optional[int] = None):
+        """Apply a deleted transaction to the user's cached forecasts"""
+        self._apply(user_id, lambda forecast: forecast.remove(transaction_id), version)
+
+    def _apply(self, user_id: str, change, version: Optional[int] = None):
+        """Update cached forecasts in place, falling back to invalidation on failure"""
+        with self._lock:
+            self._bump_generation(user_id)
+            self._previous.pop(user_id, None)
+            forecasts = self._cache.peek_where(lambda key: key[0] == user_id)
+        try:
+            for forecast in forecasts:
+                change(forecast)
+        except Exception:
+            logger.exception("Incremental forecast update failed for user: %s", user_id)
+            self.invalidate(user_id)
+            return
+        if version is not None:
+            with self._lock:
+                known = self._versions.get(user_id)
+                if known == version - 1:
+                    self._versions[user_id] = version
+                    return
+            if known is not None or forecasts:
+                # A write this process did not see came in between
+                self.invalidate(user_id)
+
+    def _roll_over(self, window_start: date):
+        """Drop forecasts anchored to earlier days once the calendar day changes"""
+        if self._window_start is None or window_start > self._window_start:
+            self.roll_over(window_start)
+
+    def roll_over(self, window_start: date):
+        """Start the day whose forecast window begins on window_start"""
+        with self._lock:
+            if self._window_start is not None and window_start <= self._window_start:
+                return
+            self._window_start = window_start
+            taken = self._cache.take_where(lambda key: key[1] < window_start)
+            # key is (user_id, window start, range start, range end, sparse)
+            self._previous = {
+                key[0]: forecast for key, forecast in taken
+                if self.keep_previous and key[1] == key[2] and not key[4] and key[0] in self._versions
+            }
+
+    def previous_users(self) -> List[str]:
+        """Users with a forecast set aside at the last roll over"""
+        with self._lock:
+            return list(self._previous)
+
+    def take_previous(self, user_id: str, version: int):
+        """Remove and return the user's whole-window forecast of the previous day
+
+        Returns None unless it was set aside at the last roll over and reflects
+        the given data version.
+        """
+        with self._lock:
+            forecast = self._previous.pop(user_id, None)
+            if forecast is None or self._versions.get(user_id) != version:
+                return None
+            return forecast
+
+    def stats(self):
+        """Return hit/miss counters and cache size"""
+        return self._cache.stats()
+
+
+forecast_cache = ForecastCache(
+    max_entries=settings.FORECAST_CACHE_MAX_ENTRIES,
+    ttl=settings.FORECAST_CACHE_TTL,
+    max_days=settings.FORECAST_CACHE_MAX_DAYS,
+    keep_previous=settings.FORECAST_ROLLOVER_ENABLED
+)
+
+registry.callback('forecast_cache_hits_total', 'Forecast cache hits',
+                  lambda: forecast_cache.stats()['hits'], kind='counter')
+registry.callback('forecast_cache_misses_total', 'Forecast cache misses',
+                  lambda: forecast_cache.stats()['misses'], kind='counter')
+registry.callback('forecast_cache_entries', 'Forecasts held in the cache',
+                  lambda: forecast_cache.stats()['entries'])
+registry.callback('forecast_cache_days', 'Day records held in the cache',
+                  lambda: forecast_cache.stats()['weight'])
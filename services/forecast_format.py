@@ -0,0 +1,168 @@
+"""Compact encodings of a daily forecast.
+
+The full forecast embeds every Transaction in each day it occurs on. These
+formats list each transaction once in a table keyed by id and refer to it by id
+from the days. Values are converted to JSON-native types the same way FastAPI
+encodes the full response, so numbers read back identically.
+
+Streamed forecasts are sent in the full format, one day per NDJSON line or
+server-sent event.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from fastapi.encoders import decimal_encoder
+from utils.serialization import dumps_json
+
+TRANSACTION_FIELDS = ('paid_transactions', 'unpaid_transactions', 'income_transactions')
+BALANCE_FIELDS = ('opening_balance', 'closing_balance', 'income')
+FORMATS = ('full', 'compact', 'columnar')
+
+
+def _number(value):
+    # income is the int 0 on days without income
+    return decimal_encoder(value) if not isinstance(value, int) else value
+
+
+def _transaction_table(forecast: Dict[str, Dict[str, Any]]) -> Dict[str, dict]:
+    """Serialize every transaction referenced by the forecast once"""
+    table = {}
+    for day in forecast.values():
+        for field in TRANSACTION_FIELDS:
+            for transaction in day[field]:
+                if transaction.id not in table:
+                    table[transaction.id] = transaction.model_dump(mode='json')
+    return table
+
+
+def compact_forecast(forecast: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Return {'transactions': {id: transaction}, 'days': {date: day}} with id references"""
+    days = {}
+    for label, day in forecast.items():
+        compact_day = {
+            'opening_balance': _number(day['opening_balance']),
+            'closing_balance': _number(day['closing_balance']),
+            'can_pay': day['can_pay'],
+            'income': _number(day['income']),
+        }
+        for field in TRANSACTION_FIELDS:
+            compact_day[field] = [transaction.id for transaction in day[field]]
+        if 'overdraft' in day:
+            compact_day['overdraft'] = _number(day['overdraft'])
+        days[label] = compact_day
+    return {'transactions': _transaction_table(forecast), 'days': days}
+
+
+def columnar_forecast(forecast: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Return one array per field, aligned with the 'dates' array
+
+    overdraft is null on days that could pay every expense.
+    """
+    columns: Dict[str, List[Any]] = {
+        'dates': list(forecast),
+        'can_pay': [],
+        'overdraft': [],
+    }
+    for field in BALANCE_FIELDS + TRANSACTION_FIELDS:
+        columns[field] = []
+    for day in forecast.values():
+        for field in BALANCE_FIELDS:
+            columns[field].append(_number(day[field]))
+        for field in TRANSACTION_FIELDS:
+            columns[field].append([transaction.id for transaction in day[field]])
+        columns['can_pay'].append(day['can_pay'])
+        overdraft = day.get('overdraft')
+        columns['overdraft'].append(_number(overdraft) if overdraft is not None else None)
+    return {'transactions': _transaction_table(forecast), **columns}
+
+
+def encode_day(day: Dict[str, Any], encoded: Dict[str, dict]) -> Dict[str, Any]:
+    """Return one day of the full forecast as JSON-native data
+
+    encoded maps transaction ids to their serialized form and is filled as
+    transactions are first seen, so each is serialized once per response.
+    """
+    result = {}
+    for field, value in day.items():
+        if field in TRANSACTION_FIELDS:
+            items = []
+            for transaction in value:
+                if transaction.id not in encoded:
+                    encoded[transaction.id] = transaction.model_dump(mode='json')
+                items.append(encoded[transaction.id])
+            result[field] = items
+        elif field == 'can_pay':
+            result[field] = value
+        else:
+            result[field] = _number(value)
+    return result
+
+
+def iter_encoded_days(days: Iterable[Tuple[str, Dict[str, Any]]], event_stream: bool = False,
+                      chunk_days: int = 7) -> Iterator[bytes]:
+    """Encode (date, day) pairs as NDJSON lines {"date", ...day}, chunk_days per chunk
+
+    With event_stream each day is a server-sent event instead and the stream
+    closes with an 'end' event, so EventSource clients do not reconnect.
+    """
+    encoded: Dict[str, dict] = {}
+    chunk = []
+    for label, day in days:
+        line = dumps_json({'date': label, **encode_day(day, encoded)})
+        chunk.append(b'data: ' + line + b'\n\n' if event_stream else line + b'\n')
+        if len(chunk) == chunk_days:
+            yield b''.join(chunk)
+            chunk = []
+    if event_stream:
+        chunk.append(b'event: end\ndata: {}\n\n')
+    if chunk:
+        yield b''.join(chunk)
+
+
+def expand_compact(compact: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Return the JSON-native full forecast that compact_forecast output was made from"""
+    table = compact['transactions']
+    forecast = {}
+    for label, day in compact['days'].items():
+        full_day = {
+            'opening_balance': day['opening_balance'],
+            'closing_balance': day['closing_balance'],
+            'can_pay': day['can_pay'],
+            'paid_transactions': [table[id] for id in day['paid_transactions']],
+            'unpaid_transactions': [table[id] for id in day['unpaid_transactions']],
+            'income': day['income'],
+            'income_transactions': [table[id] for id in day['income_transactions']],
+        }
+        if 'overdraft' in day:
+            full_day['overdraft'] = day['overdraft']
+        forecast[label] = full_day
+    return forecast
+
+
+def columnar_from_compact(compact: Dict[str, Any]) -> Dict[str, Any]:
+    """Return columnar_forecast output from compact_forecast output"""
+    days = compact['days'].values()
+    columns: Dict[str, List[Any]] = {
+        'dates': list(compact['days']),
+        'can_pay': [day['can_pay'] for day in days],
+        'overdraft': [day.get('overdraft') for day in days],
+    }
+    for field in BALANCE_FIELDS + TRANSACTION_FIELDS:
+        columns[field] = [day[field] for day in days]
+    return {'transactions': compact['transactions'], **columns}
+
+
+def format_compact(compact: Dict[str, Any], response_format: str):
+    """Return compact_forecast output in one of FORMATS"""
+    if response_format == 'full':
+        return expand_compact(compact)
+    if response_format == 'columnar':
+        return columnar_from_compact(compact)
+    return compact
+
+
+def format_forecast(forecast: Dict[str, Dict[str, Any]], response_format: str):
+    """Return the forecast in one of FORMATS"""
+    if response_format == 'compact':
+        return compact_forecast(forecast)
+    if response_format == 'columnar':
+        return columnar_forecast(forecast)
+    return forecast
@@ -0,0 +1,240 @@
+"""Daily roll over of active users' forecasts, run just after midnight.
+
+The forecast window is anchored to today, so every cached forecast and snapshot
+goes stale when the day changes. The job started from the app lifespan moves the
+forecast of every recently active user to the new day: a whole-window forecast
+the cache set aside is rolled forward with IncrementalForecast.roll_forward,
+which only expands the new last day; other users are forecast from scratch.
+Results go back into the cache until the next run and, with snapshots enabled,
+into the snapshot store, so the morning's first requests find warm data.
+
+Work runs on a small thread pool. After each user a worker pauses in
+proportion to the CPU time it used, keeping the whole job under
+FORECAST_ROLLOVER_CPU_SHARE of one CPU.
+
+Only as many users are kept active as the forecast cache can hold whole-window
+forecasts for; rolling more would evict the first ones before morning.
+
+Everything here is per process. With several uvicorn workers each runs its own
+job over the users it served and warms its own cache, so a user served by two
+workers is forecast twice and, with snapshots enabled, stored twice. Set
+FORECAST_ROLLOVER_ENABLED=false where that cost is not wanted.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config.settings import settings
+from services.forecast_cache import forecast_cache
+from services.main_service import MainService
+from utils.metrics import registry
+from utils.transactions import get_forecast_materializer, get_transaction_service
+
+logger = logging.getLogger(__name__)
+
+# Prepared forecasts stay cached this long past the next run, so it can roll them again
+CACHE_SLACK = 600
+
+rollover_users = registry.counter(
+    'forecast_rollover_users_total', 'Users processed by the forecast rollover, by result', ['result']
+)
+rollover_duration = registry.histogram(
+    'forecast_rollover_duration_seconds', 'Duration of whole forecast rollover runs',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+
+def cache_capacity(max_entries: int, max_days: int, window_days: int) -> int:
+    """Whole-window forecasts of window_days a forecast cache with these bounds holds at once"""
+    return min(max_entries, max_days // window_days)
+
+
+class ActiveUsers:
+    """Users whose balance was read recently, bounded in number and expiring after ttl seconds"""
+    def __init__(self, max_users: int, ttl: float, clock=time.time):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.clock = clock
+        # Least recently seen first
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, user_id: str):
+        """Record a read by user_id"""
+        with self._lock:
+            self._seen[user_id] = self.clock()
+            self._seen.move_to_end(user_id)
+            while len(self._seen) > self.max_users:
+                self._seen.popitem(last=False)
+
+    def users(self) -> List[str]:
+        """Users seen within ttl, least recently seen first"""
+        with self._lock:
+            cutoff = self.clock() - self.ttl
+            while self._seen and next(iter(self._seen.values())) < cutoff:
+                self._seen.popitem(last=False)
+            return list(self._seen)
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class ForecastRollover:
+    """Moves active users' forecasts to the new day once a day"""
+    def __init__(self, active: ActiveUsers, concurrency: int, cpu_share: float, delay: float,
+                 clock=datetime.now):
+        self.active = active
+        self.concurrency = concurrency
+        self.cpu_share = cpu_share
+        self.delay = delay
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='forecast-rollover')
+        self.pending = 0
+        self.last_run: Dict[str, object] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def seconds_until_run(self) -> float:
+        """Seconds from now until the next run, delay seconds after midnight"""
+        now = self.clock()
+        midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+        return (midnight - now).total_seconds() + self.delay
+
+    def start(self):
+        """Schedule the daily runs on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run_daily())
+
+    async def stop(self):
+        """Cancel the daily runs; a user already being rolled over finishes in the background"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_daily(self):
+        while True:
+            await asyncio.sleep(self.seconds_until_run())
+            try:
+                await self.run()
+            except Exception:
+                logger.exception("Forecast rollover run failed")
+
+    async def run(self) -> Dict[str, int]:
+        """Roll every active user over now and return how many ended in each result"""
+        # The cache changes day lazily on a read, which may not have come in since midnight
+        start_window, _ = MainService('forecast-rollover').forecast_window()
+        forecast_cache.roll_over(start_window.date())
+        users = self.active.users()
+        # Forecasts set aside for users not seen lately fill whatever room is left; the most
+        # recently seen users go last, so they are the last the cache would evict
+        known = set(users)
+        previous = [user_id for user_id in forecast_cache.previous_users() if user_id not in known]
+        users = previous[:max(0, self.active.max_users - len(users))] + users
+        queue: asyncio.Queue = asyncio.Queue()
+        for user_id in users:
+            queue.put_nowait(user_id)
+        self.pending = len(users)
+        results = {'rolled': 0, 'rebuilt': 0, 'failed': 0}
+        started = time.monotonic()
+        logger.info("Forecast rollover started for %d users", len(users))
+        try:
+            await asyncio.gather(*(self._worker(queue, results) for _ in range(self.concurrency)))
+        finally:
+            self.pending = 0
+        elapsed = time.monotonic() - started
+        rollover_duration.observe(elapsed)
+        self.last_run = {'finished_at': self.clock().isoformat(), 'seconds': round(elapsed, 3), **results}
+        logger.info("Forecast rollover finished", extra={'rollover': self.last_run})
+        return results
+
+    async def _worker(self, queue: asyncio.Queue, results: Dict[str, int]):
+        loop = asyncio.get_running_loop()
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            started = time.monotonic()
+            result, cpu = await loop.run_in_executor(
+                self.executor, contextvars.copy_context().run, self.roll_user, user_id
+            )
+            results[result] += 1
+            self.pending -= 1
+            # Sleep so this worker's CPU time stays within its part of the share
+            pause = cpu * self.concurrency / self.cpu_share - (time.monotonic() - started)
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+    def roll_user(self, user_id: str):
+        """Roll one user over; returns the result and the thread CPU time it took"""
+        started = time.thread_time()
+        try:
+            result = self._roll(user_id)
+        except Exception:
+            logger.exception("Forecast rollover failed for user: %s", user_id)
+            result = 'failed'
+        rollover_users.inc(result)
+        return result, time.thread_time() - started
+
+    def _roll(self, user_id: str) -> str:
+        transaction_service = get_transaction_service()
+        service = MainService(user_id, transaction_service)
+        start_window, end_window = service.forecast_window()
+        window = (start_window.date(), service.start_range.date(), end_window.date(), False)
+        forecast_cache.roll_over(start_window.date())
+        generation = forecast_cache.generation(user_id)
+        version = transaction_service.data_version(user_id)
+
+        forecast = forecast_cache.take_previous(user_id, version)
+        if (forecast is not None and forecast.start_window + timedelta(days=1) == start_window
+                and forecast.end_window + timedelta(days=1) == end_window):
+            forecast.roll_forward()
+            result = 'rolled'
+        else:
+            transactions = transaction_service.list_user_transactions(user_id)
+            forecast = service.build_forecast(transactions)
+            result = 'rebuilt'
+        forecast_cache.set(user_id, window, forecast, generation, version,
+                           ttl=self.seconds_until_run() + CACHE_SLACK)
+
+        materializer = get_forecast_materializer()
+        if materializer is not None:
+            # Served from the forecast just cached unless a write came in meanwhile
+            materializer.materialize(service, version, 'rollover')
+        return result
+
+    def stats(self):
+        """Return the active user count, users left in the current run and the last run's results"""
+        return {
+            'active_users': len(self.active),
+            'pending': self.pending,
+            'next_run_in': round(self.seconds_until_run(), 3),
+            'last_run': self.last_run,
+        }
+
+
+active_users = ActiveUsers(
+    max_users=min(settings.FORECAST_ROLLOVER_MAX_USERS, cache_capacity(
+        settings.FORECAST_CACHE_MAX_ENTRIES,
+        settings.FORECAST_CACHE_MAX_DAYS,
+        settings.FORECAST_PAST_DAYS + settings.FORECAST_FUTURE_DAYS + 1
+    )),
+    ttl=settings.FORECAST_ROLLOVER_ACTIVE_DAYS * 86400
+)
+
+forecast_rollover = ForecastRollover(
+    active_users,
+    concurrency=settings.FORECAST_ROLLOVER_CONCURRENCY,
+    cpu_share=settings.FORECAST_ROLLOVER_CPU_SHARE,
+    delay=settings.FORECAST_ROLLOVER_DELAY
+)
+
+registry.callback('forecast_rollover_active_users', 'Users whose forecasts the rollover keeps warm',
+                  lambda: len(active_users))
+registry.callback('forecast_rollover_pending', 'Users left in the running forecast rollover',
+                  lambda: forecast_rollover.pending)
@@ -0,0 +1,219 @@
+"""Incremental forecast engine that applies single-transaction changes as deltas"""
+import bisect
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+from utils.metrics import registry
+
+forecast_phase_seconds = registry.histogram(
+    'forecast_phase_duration_seconds', 'Time spent in each forecast phase', ['phase'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+
+
+def order_key(transaction, ranks: Dict[str, int]):
+    """Order of a day's transactions: income in query order, expenses largest first"""
+    if transaction.type == 'income':
+        return (0, ranks[transaction.id])
+    return (-transaction.amount, ranks[transaction.id])
+
+
+def map_occurrences(service, transactions, start_window: datetime, end_window: datetime,
+                    ranks: Dict[str, int], income: dict, expense: dict) -> Dict[str, List[datetime]]:
+    """Expand transactions over the window into the income and expense day maps
+
+    Each day's list is in order_key order, as the balance sweep applies it.
+    Returns the days each transaction occurs on, by id.
+    """
+    occurrences = {
+        transaction.id: service.expand_transaction(transaction, start_window, end_window)
+        for transaction in transactions
+    }
+    for transaction in sorted(transactions, key=lambda transaction: order_key(transaction, ranks)):
+        day_map = income if transaction.type == 'income' else expense
+        for day in occurrences[transaction.id]:
+            day_map.setdefault(day, []).append(transaction)
+    return occurrences
+
+
+def closing_balances(service, days: Iterable[datetime], income: dict, expense: dict,
+                     prev_balance: Decimal = Decimal('0')) -> List[Decimal]:
+    """Closing balance of each of consecutive days, for seeding the days after them"""
+    balances = []
+    for day in days:
+        prev_balance = service.calculate_closing_balance(prev_balance, income.get(day, []), expense.get(day, []))
+        balances.append(prev_balance)
+    return balances
+
+
+class IncrementalForecast:
+    """Per-user occurrence map that re-runs the balance sweep only from the earliest affected day.
+
+    The full recompute in MainService.calculate_forecast stays the reference; this
+    engine is built from the same expand_transaction and calculate_day steps so both
+    produce identical results. MainService.iter_balances streams from the same
+    map_occurrences and closing_balances helpers.
+    """
+    def __init__(self, service, transactions, start_window: datetime, end_window: datetime,
+                 output_start: Optional[datetime] = None):
+        self.service = service
+        self.start_window = start_window
+        self.end_window = end_window
+        # Days before output_start only seed the opening balance of the requested range
+        self.output_start = output_start or start_window
+        self._init_days()
+        # Query position of each transaction; new ones rank after every rank ever given out
+        self.ranks: Dict[str, int] = {}
+        self._next_rank = 0
+        self.transactions = {}
+        self.occurrences: Dict[str, List[datetime]] = {}
+        self.results = []
+        self.forecast = {}
+        self._lock = threading.Lock()
+
+        with forecast_phase_seconds.time('expand'):
+            for transaction in transactions:
+                self._assign_rank(transaction.id)
+                self.transactions[transaction.id] = transaction
+            self.occurrences = map_occurrences(
+                service, list(self.transactions.values()), start_window, end_window,
+                self.ranks, self.income, self.expense
+            )
+        with forecast_phase_seconds.time('sweep'):
+            self._sweep(0)
+
+    def _init_days(self):
+        self.days = list(self.service.date_range(self.start_window, self.end_window))
+        self.output_index = (self.output_start - self.start_window).days
+        self.labels = [day.strftime("%m-%d-%Y") for day in self.days[self.output_index:]]
+        self.seed_balances: List[Decimal] = []
+        self.day_index = {day: index for index, day in enumerate(self.days)}
+        self.income: Dict[datetime, list] = {day: [] for day in self.days}
+        self.expense: Dict[datetime, list] = {day: [] for day in self.days}
+
+    def __len__(self):
+        return len(self.days)
+
+    def upsert(self, transaction):
+        """Add a new transaction or replace an existing one with the same id"""
+        with self._lock:
+            affected = self._detach(transaction.id)
+            self._assign_rank(transaction.id)
+            self.transactions[transaction.id] = transaction
+            occurrences = self.service.expand_transaction(
+                transaction, self.start_window, self.end_window
+            )
+            self.occurrences[transaction.id] = occurrences
+            day_map = self._day_map(transaction)
+            for day in sorted(set(occurrences)):
+                # Copy on write so forecasts already handed out stay consistent
+                day_list = list(day_map.get(day, ()))
+                for _ in range(occurrences.count(day)):
+                    bisect.insort(day_list, transaction, key=self._order_key)
+                day_map[day] = day_list
+            affected.extend(occurrences)
+            with forecast_phase_seconds.time('resweep'):
+                self._sweep_from(affected)
+
+    def remove(self, transaction_id: str):
+        """Remove a transaction by id"""
+        with self._lock:
+            affected = self._detach(transaction_id)
+            self.ranks.pop(transaction_id, None)
+            with forecast_phase_seconds.time('resweep'):
+                self._sweep_from(affected)
+
+    def roll_forward(self):
+        """Move the window one day later in place: drop the first day and append a new last one
+
+        Only the new day is expanded. Expansion does not depend on the window, so a
+        weekly schedule whose first occurrence moves back from a later start_date
+        onto the new day is found there as well. Balances restart from zero on the new first
+        day, so days are re-swept until one opens exactly as it did before; from
+        there on every day is unchanged and its result is kept. Only forecasts of
+        the whole window roll, as a requested range would stay on its dates.
+        """
+        with self._lock:
+            if self.output_index:
+                raise ValueError("Only forecasts of the whole window can roll forward")
+            head = self.days[0]
+            new_day = self.end_window + timedelta(days=1)
+            self.start_window += timedelta(days=1)
+            self.end_window = new_day
+            self.output_start = self.start_window
+            self.days = self.days[1:] + [new_day]
+            self.labels = self.labels[1:] + [new_day.strftime("%m-%d-%Y")]
+            self.day_index = {day: index for index, day in enumerate(self.days)}
+            del self.income[head], self.expense[head]
+            self.income[new_day] = []
+            self.expense[new_day] = []
+            for transaction in sorted(self.transactions.values(), key=self._order_key):
+                occurrences = [day for day in self.occurrences[transaction.id] if day != head]
+                added = self.service.expand_transaction(transaction, new_day, new_day)
+                self.occurrences[transaction.id] = occurrences + added
+                self._day_map(transaction)[new_day].extend([transaction] * len(added))
+
+            previous = self.results[1:]
+            results = []
+            prev_balance = Decimal('0')
+            for index, day in enumerate(self.days[:-1]):
+                if prev_balance.compare_total(previous[index]['opening_balance']) == 0:
+                    results.extend(previous[index:])
+                    prev_balance = results[-1]['closing_balance']
+                    break
+                day_result = self.service.calculate_day(prev_balance, self.income[day], self.expense[day])
+                results.append(day_result)
+                prev_balance = day_result['closing_balance']
+            results.extend(self.service.sweep_days([new_day], self.income, self.expense, prev_balance))
+            self.results = results
+            self.forecast = dict(zip(self.labels, results))
+
+    def _assign_rank(self, transaction_id: str):
+        # Ranks are never reused, so a removed transaction's rank cannot tie with a live one
+        if transaction_id not in self.ranks:
+            self.ranks[transaction_id] = self._next_rank
+            self._next_rank += 1
+
+    def _detach(self, transaction_id: str) -> List[datetime]:
+        """Remove a transaction's occurrences and return the days they were on"""
+        transaction = self.transactions.pop(transaction_id, None)
+        if transaction is None:
+            return []
+        occurrences = self.occurrences.pop(transaction_id)
+        day_map = self._day_map(transaction)
+        for day in set(occurrences):
+            day_map[day] = [item for item in day_map[day] if item.id != transaction_id]
+        return list(occurrences)
+
+    def _day_map(self, transaction):
+        return self.income if transaction.type == 'income' else self.expense
+
+    def _order_key(self, transaction):
+        return order_key(transaction, self.ranks)
+
+    def _sweep_from(self, affected: List[datetime]):
+        if affected:
+            self._sweep(min(self.day_index[day] for day in affected))
+
+    def _sweep(self, start_index: int):
+        """Recompute daily results from start_index to the end of the window"""
+        if start_index < self.output_index:
+            balances = self.seed_balances[:start_index]
+            prev_balance = balances[-1] if balances else Decimal('0')
+            balances.extend(closing_balances(
+                self.service, self.days[start_index:self.output_index], self.income, self.expense, prev_balance
+            ))
+            self.seed_balances = balances
+            start_index = self.output_index
+
+        results = self.results[:start_index - self.output_index]
+        if results:
+            prev_balance = results[-1]['closing_balance']
+        else:
+            prev_balance = self.seed_balances[-1] if self.seed_balances else Decimal('0')
+        results.extend(
+            self.service.sweep_days(self.days[start_index:], self.income, self.expense, prev_balance)
+        )
+        self.results = results
+        self.forecast = dict(zip(self.labels, results))
@@ -0,0 +1,125 @@
+"""Cognito signing keys, parsed once per fetch and refreshed off the request path"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+import httpx
+from jose import jwk
+from jose.backends.base import Key
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSUnavailable(Exception):
+    """No usable key set: it was never fetched or is older than the stale limit"""
+
+
+class JWKSManager:
+    """kid to public key map for a JWKS URL.
+
+    - Concurrent refreshes share one in-flight fetch.
+    - Once the keys are older than ttl - refresh_ahead, a background refresh
+      starts and requests keep using the current keys (stale-while-revalidate).
+      Only keys older than ttl + max_stale make requests wait for a fetch.
+    - An unknown kid triggers a refetch, since the pool may have rotated keys,
+      but at most once per min_refetch_interval so forged kids cannot flood
+      the endpoint.
+    """
+    def __init__(self, url: str, ttl: float, refresh_ahead: float, max_stale: float,
+                 min_refetch_interval: float, timeout: float, clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_stale = max_stale
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.keys: Dict[str, Key] = {}
+        self.fetched_at: Optional[float] = None
+        self.last_attempt = float('-inf')
+        self.fetches = 0
+        self.failures = 0
+        self._inflight: Optional[asyncio.Future] = None
+        self._background: Optional[asyncio.Task] = None
+
+    def load(self, document: dict):
+        """Replace the keys with those of a JWKS document"""
+        keys = {}
+        for key in document.get('keys', []):
+            if 'kid' in key:
+                keys[key['kid']] = jwk.construct(key, algorithm=key.get('alg', 'RS256'))
+        self.keys = keys
+        self.fetched_at = self.clock()
+
+    async def _fetch(self):
+        self.last_attempt = self.clock()
+        self.fetches += 1
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(self.url)
+                response.raise_for_status()
+                self.load(response.json())
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def refresh(self):
+        """Fetch the key set, joining the fetch already in flight if there is one"""
+        inflight = self._inflight
+        if inflight is None or inflight.done() or inflight.get_loop() is not asyncio.get_running_loop():
+            inflight = self._inflight = asyncio.ensure_future(self._fetch())
+        # Shielded so a cancelled request does not cancel the fetch others are waiting on
+        await asyncio.shield(inflight)
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh()
+        except Exception:
+            logger.warning("JWKS refresh from %s failed, keeping keys fetched %.0fs ago",
+                           self.url, self.age(), exc_info=True)
+
+    def _refresh_in_background(self):
+        if self.clock() - self.last_attempt < self.min_refetch_interval:
+            return
+        if self._background is None or self._background.done():
+            self._background = asyncio.get_running_loop().create_task(self._refresh_quietly())
+
+    def age(self) -> float:
+        """Seconds since the keys were fetched, inf if they never were"""
+        return float('inf') if self.fetched_at is None else self.clock() - self.fetched_at
+
+    async def get_key(self, kid: Optional[str]) -> Optional[Key]:
+        """Return the public key for kid, or None if the key set does not have it"""
+        if self.age() >= self.ttl + self.max_stale:
+            try:
+                await self.refresh()
+            except Exception as e:
+                raise JWKSUnavailable(f"Could not fetch signing keys from {self.url}") from e
+        elif self.age() >= self.ttl - self.refresh_ahead:
+            self._refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None and self.clock() - self.last_attempt >= self.min_refetch_interval:
+            await self._refresh_quietly()
+            key = self.keys.get(kid)
+        return key
+
+    def stats(self):
+        """Return fetch counters and the age of the keys"""
+        return {
+            'keys': len(self.keys),
+            'age': self.age(),
+            'fetches': self.fetches,
+            'failures': self.failures,
+        }
+
+
+jwks_manager = JWKSManager(
+    settings.KEYS_URL,
+    ttl=settings.JWKS_CACHE_TIMEOUT,
+    refresh_ahead=settings.JWKS_REFRESH_AHEAD,
+    max_stale=settings.JWKS_MAX_STALE,
+    min_refetch_interval=settings.JWKS_MIN_REFETCH_INTERVAL,
+    timeout=settings.JWKS_FETCH_TIMEOUT
+)
@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from decimal import Decimal
 import calendar
 from datetime import date, timedelta, datetime
@@ -9,34 +9,64 @@ from botocore.exceptions import ClientError
 from uuid import uuid4
 from boto3.dynamodb.conditions import Key
 from utils.transactions import get_transaction_service
+from services.forecast_cache import forecast_cache
+from services.incremental_forecast import (
+    IncrementalForecast, closing_balances, forecast_phase_seconds, map_occurrences
+)
+from services.sparse_forecast import SparseForecast
+from services.vectorized_forecast import sweep_vectorized, forecast_vectorized
+from services.recurrence import occurrence_ordinals
+from config.settings import settings
 from models.transaction import Transaction
 from calendar import monthrange
+from itertools import islice
 
 import logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-
 class MainService:
-    def __init__(self, user_id: str):
+    def __init__(
+        self,
+        user_id: str,
+        transaction_service=None,
+        engine: Optional[str] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ):
         self.user_id = user_id
-        self.today = datetime.now()
-        self.start_range = self.today - timedelta(days=30)
-        self.end_range = self.today + timedelta(days=210)
-        self.balance_dict = self.initialize_balance_dict(self.start_range, self.end_range)
+        # Resolved on first use so workers given prefetched transactions never build a client
+        self._transaction_service = transaction_service
+        self.engine = engine or settings.FORECAST_ENGINE
+        self.today = self.truncate_date(datetime.now())
+        # Balances start from zero on window_start; a requested range is seeded from there
+        self.window_start = self.today - timedelta(days=settings.FORECAST_PAST_DAYS)
+        self.start_range = self.truncate_date(start) if start else self.window_start
+        self.end_range = self.truncate_date(end) if end else self.today + timedelta(days=settings.FORECAST_FUTURE_DAYS)
+        self.validate_range()
         self.income_transactions = []
         self.expense_transactions = []
         self.current_balance = Decimal(0)
 
+    @property
+    def transaction_service(self):
+        if self._transaction_service is None:
+            self._transaction_service = get_transaction_service()
+        return self._transaction_service
+
     def parse_date(self, date_str: Optional[str]) -> Optional[datetime]:
         """Convert string date to datetime object."""
         return datetime.strptime(date_str, "%m-%d-%Y") if date_str else None
 
-    def initialize_balance_dict(self, start_date: datetime, end_date: datetime) -> Dict[datetime, Dict[str, Optional[Decimal]]]:
-        """Initialize balance dictionary for the specified date range."""
-        return {start_date + timedelta(days=i): {'balance': Decimal(0), 'overdraft': None, 'can_pay': True} 
-                for i in range((end_date - start_date).days + 1)}
-        
+    def validate_range(self):
+        """Reject requested ranges outside the server-side limits."""
+        latest = self.today + timedelta(days=settings.FORECAST_MAX_FUTURE_DAYS)
+        if self.start_range < self.window_start:
+            raise ValueError(f"from must be on or after {self.window_start.strftime('%m-%d-%Y')}")
+        if self.end_range > latest:
+            raise ValueError(f"to must be on or before {latest.strftime('%m-%d-%Y')}")
+        if self.start_range > self.end_range:
+            raise ValueError("from must not be after to")
+
     def separate_transactions_by_type(self, transactions):
         # Separate transactions into income and expense lists
         for transaction in transactions:
@@ -87,9 +117,13 @@ class MainService:
         
         return new_date
             
+    def truncate_date(self, value: datetime) -> datetime:
+        """Drop the time of day from a datetime."""
+        return datetime(value.year, value.month, value.day)
+
     def date_range(self, start_date_str, end_date_str):
-        start_date = self.parse_date(start_date_str.strftime("%m-%d-%Y"))
-        end_date = self.parse_date(end_date_str.strftime("%m-%d-%Y"))
+        start_date = self.truncate_date(start_date_str)
+        end_date = self.truncate_date(end_date_str)
         
         if start_date and end_date:
             current_date = start_date
@@ -106,12 +140,8 @@ class MainService:
 
     def calculate_recurring_dates(self, transactions, recurring_transactions):
         """Calculate recurring income transactions for the next 7 months."""
-        today = datetime.now()
-        start_window = today - timedelta(days=30)
-        end_window = today + timedelta(days=210)
-        start_window = self.parse_date(start_window.strftime("%m-%d-%Y"))
-        end_window = self.parse_date(end_window.strftime("%m-%d-%Y"))
-        logger.info(f"Start window: {start_window}, End window: {end_window}")
+        start_window, end_window = self.forecast_window()
+        logger.debug("Start window: %s, End window: %s", start_window, end_window)
         transaction_dates = {}
         
         if len(transactions) > 0 and transactions[0].type == 'expense':
@@ -119,172 +149,278 @@ class MainService:
             
 
         for transaction in transactions:
-            # if transaction.type != 'income':
-            #     continue
-            if transaction.start_date:
-                start_date = self.parse_date(transaction.start_date)
-            else:
-                start_date = self.parse_date(transaction.date_of_transaction)
-            if(transaction.skip_end_date):
-                end_date = self.parse_date(end_window.strftime("%m-%d-%Y"))
+            for trans_date in self.expand_transaction(transaction, start_window, end_window):
+                transaction_dates[trans_date] = transaction_dates.get(trans_date, Decimal(0)) + Decimal(transaction.amount)
+                recurring_transactions[trans_date].append(transaction)
+
+        return dict(sorted(transaction_dates.items())), recurring_transactions
+
+    def expand_transaction(self, transaction, start_window, end_window) -> List[datetime]:
+        """Return every date a transaction occurs on within the window."""
+        ordinals = occurrence_ordinals(transaction, start_window.toordinal(), end_window.toordinal())
+        return [datetime.fromordinal(ordinal) for ordinal in ordinals]
+
+    def expand_transaction_stepwise(self, transaction, start_window, end_window) -> List[datetime]:
+        """Step through a transaction's schedule one occurrence at a time.
+
+        Reference for services.recurrence; unlike it, semi-monthly schedules with an
+        end date past the window can return dates after end_window.
+        """
+        occurrences = []
+        if transaction.start_date:
+            start_date = self.parse_date(transaction.start_date)
+        else:
+            start_date = self.parse_date(transaction.date_of_transaction)
+        if(transaction.skip_end_date):
+            end_date = self.parse_date(end_window.strftime("%m-%d-%Y"))
+        else:
+            if transaction.end_date:
+                end_date = self.parse_date(transaction.end_date)
             else:
-                if transaction.end_date:
-                    end_date = self.parse_date(transaction.end_date)
-                else:
-                    end_date = self.parse_date(transaction.date_of_transaction)
-            
-            # Check if the transaction falls within the specified date range
-            if not self.is_within_date_range(start_date, end_date, start_window, end_window):
-                continue
-            
-            if transaction.frequency == 'one-time':
-                trans_date = self.parse_date(transaction.date_of_transaction)
-                if start_window <= trans_date <= end_window:
-                    transaction_dates[trans_date] = transaction_dates.get(trans_date, Decimal(0)) + Decimal(transaction.amount)
-                    recurring_transactions[trans_date].append(transaction)
+                end_date = self.parse_date(transaction.date_of_transaction)
 
-            elif transaction.frequency in ['weekly', 'bi-weekly']:
-                trans_date = self.parse_date(transaction.start_date)
-                interval_days = 7 if transaction.frequency == 'weekly' else 14
-                target_weekday = transaction.day - 1  # Adjust for 0-indexed weekday
+        # A weekly schedule's first occurrence can be moved up to 3 days before its start date
+        first_date = start_date
+        if transaction.frequency in ['weekly', 'bi-weekly'] and start_date is not None:
+            first_date = start_date - timedelta(days=3)
 
-                if trans_date.weekday() != target_weekday:
-                    days_diff = (target_weekday - trans_date.weekday()) % 7
-                    
-                    # If the difference is more than 3 days, subtract instead of add
-                    if days_diff > 3:
-                        days_diff -= 7
-                    
-                    trans_date += timedelta(days=days_diff)
-                    
-                # Generate dates for weekly or bi-weekly transactions
-                while trans_date <= end_window:
-                    if trans_date >= start_window and trans_date <= end_date:
-                        transaction_dates[trans_date] = transaction_dates.get(trans_date, Decimal(0)) + Decimal(transaction.amount)
-                        recurring_transactions[trans_date].append(transaction)
-                    
-                    trans_date += timedelta(days=interval_days)
+        # Check if the transaction falls within the specified date range
+        if not self.is_within_date_range(first_date, end_date, start_window, end_window):
+            return occurrences
+        
+        if transaction.frequency == 'one-time':
+            trans_date = self.parse_date(transaction.date_of_transaction)
+            if start_window <= trans_date <= end_window:
+                occurrences.append(trans_date)
 
-            elif transaction.frequency == 'semi-monthly':
-                first_trans_date = self.parse_date(transaction.date_of_transaction)
+        elif transaction.frequency in ['weekly', 'bi-weekly']:
+            trans_date = self.parse_date(transaction.start_date)
+            interval_days = 7 if transaction.frequency == 'weekly' else 14
+            target_weekday = transaction.day - 1  # Adjust for 0-indexed weekday
+
+            if trans_date.weekday() != target_weekday:
+                days_diff = (target_weekday - trans_date.weekday()) % 7
                 
-                if(transaction.last_day_of_month):
-                    second_trans_date = self.last_day_of_month(start_date)
-                else:
-                    second_trans_date = self.parse_date(transaction.date_of_second_transaction)
+                # If the difference is more than 3 days, subtract instead of add
+                if days_diff > 3:
+                    days_diff -= 7
+                
+                trans_date += timedelta(days=days_diff)
+                
+            # Generate dates for weekly or bi-weekly transactions
+            while trans_date <= end_window:
+                if trans_date >= start_window and trans_date <= end_date:
+                    occurrences.append(trans_date)
+                
+                trans_date += timedelta(days=interval_days)
+
+        elif transaction.frequency == 'semi-monthly':
+            first_trans_date = self.parse_date(transaction.date_of_transaction)
+            
+            if(transaction.last_day_of_month):
+                second_trans_date = self.last_day_of_month(start_date)
+            else:
+                second_trans_date = self.parse_date(transaction.date_of_second_transaction)
+            
+            while first_trans_date <= end_window or second_trans_date <= end_window:
+                if first_trans_date >= start_window and first_trans_date <= end_date:
+                    occurrences.append(first_trans_date)
                 
-                while first_trans_date <= end_window or second_trans_date <= end_window:
-                    if first_trans_date >= start_window and first_trans_date <= end_date:
-                        transaction_dates[first_trans_date] = transaction_dates.get(first_trans_date, Decimal(0)) + transaction.amount
-                        recurring_transactions[first_trans_date].append(transaction)
+                if second_trans_date >= start_window and second_trans_date <= end_date:
+                    occurrences.append(second_trans_date)
                     
-                    if second_trans_date >= start_window and second_trans_date <= end_date:
-                        transaction_dates[second_trans_date] = transaction_dates.get(second_trans_date, Decimal(0)) + transaction.amount
-                        recurring_transactions[second_trans_date].append(transaction)
-                        
-                    first_trans_date = self.add_months(first_trans_date, 1)
-                    if transaction.last_day_of_month:
-                        second_trans_date = self.add_month_if_possible(second_trans_date, second_trans_date, True)
-                    else:
-                        second_trans_date = self.add_months(second_trans_date, 1)
-
-            elif transaction.frequency == 'monthly':
+                first_trans_date = self.add_months(first_trans_date, 1)
+                if transaction.last_day_of_month:
+                    second_trans_date = self.add_month_if_possible(second_trans_date, second_trans_date, True)
+                else:
+                    second_trans_date = self.add_months(second_trans_date, 1)
+
+        elif transaction.frequency == 'monthly':
+            trans_date = self.parse_date(transaction.date_of_transaction)
+            orignal_date = self.parse_date(transaction.date_of_transaction)
+            
+            if(transaction.last_day_of_month):
+                trans_date = self.last_day_of_month(start_date)
+            else:
                 trans_date = self.parse_date(transaction.date_of_transaction)
-                orignal_date = self.parse_date(transaction.date_of_transaction)
                 
-                if(transaction.last_day_of_month):
-                    trans_date = self.last_day_of_month(start_date)
-                else:
-                    trans_date = self.parse_date(transaction.date_of_transaction)
+            while trans_date <= end_window:
+                if trans_date >= start_window and trans_date <= end_date:
+                    occurrences.append(trans_date)
                     
-                while trans_date <= end_window:
-                    if trans_date >= start_window and trans_date <= end_date:
-                        transaction_dates[trans_date] = transaction_dates.get(trans_date, Decimal(0)) + transaction.amount
-                        recurring_transactions[trans_date].append(transaction)
-                        
-                    if transaction.last_day_of_month:
-                        trans_date = self.add_month_if_possible(orignal_date, trans_date, True)
-                    else:
-                        trans_date = self.add_month_if_possible(orignal_date, trans_date)
+                if transaction.last_day_of_month:
+                    trans_date = self.add_month_if_possible(orignal_date, trans_date, True)
+                else:
+                    trans_date = self.add_month_if_possible(orignal_date, trans_date)
+
+        return occurrences
 
-        return dict(sorted(transaction_dates.items())), recurring_transactions
-    
     def calculate_daily_finances(self, income_dict, expense_dict, start_date_str, end_date_str):
 
-        start_date = self.parse_date(start_date_str.strftime("%m-%d-%Y"))
-        end_date = self.parse_date(end_date_str.strftime("%m-%d-%Y"))
+        days = list(self.date_range(start_date_str, end_date_str))
+        results = self.sweep_days(days, income_dict, expense_dict, Decimal('0'))
+        return {day.strftime("%m-%d-%Y"): day_result for day, day_result in zip(days, results)}
 
-        result = {}
-        prev_balance = Decimal('0')
+    def calculate_closing_balance(self, prev_balance, income_transactions, daily_expenses):
+        """Closing balance calculate_day would produce, without building the day's result."""
+        available_balance = prev_balance + sum(transaction.amount for transaction in income_transactions)
+        for expense in daily_expenses:
+            if available_balance >= expense.amount:
+                available_balance -= expense.amount
+            else:
+                available_balance = Decimal('0')
+        return available_balance
 
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime("%m-%d-%Y")
-            
-            # Get income and expenses for the current day
-            daily_income = sum(transaction.amount for transaction in income_dict.get(current_date, []))
-            daily_expenses = expense_dict.get(current_date, [])
-            # daily_expenses = sum(transaction.amount for transaction in expense_dict.get(current_date, []))
-
-            # Calculate available balance for the day
-            available_balance = prev_balance + daily_income
-
-            # Process expenses
-            can_pay_all = True
-            paid_expenses = []
-            unpaid_expenses = []
-            overdraft = Decimal('0')
-
-            for expense in daily_expenses:
-                if available_balance >= expense.amount:
-                    available_balance -= expense.amount
-                    paid_expenses.append(expense)
-                else:
-                    can_pay_all = False
-                    unpaid_expenses.append(expense)
-                    overdraft += expense.amount - available_balance
-                    available_balance = Decimal('0')
-                    # break  # Stop processing further expenses
-                    if available_balance < 0:
-                        break
-
-            # Prepare the result for this day
-            day_result = {
-                'opening_balance': prev_balance,
-                'closing_balance': available_balance,
-                'can_pay': can_pay_all,
-                'paid_transactions': paid_expenses,
-                'unpaid_transactions': unpaid_expenses,
-                'income': daily_income,
-                'income_transactions': income_dict.get(current_date, []),
-            }
-
-            if not can_pay_all:
-                day_result['overdraft'] = overdraft
-
-            result[date_str] = day_result
+    def sweep_days(self, days, income_dict, expense_dict, prev_balance) -> List[Dict[str, any]]:
+        """Compute the daily results for consecutive days starting from prev_balance."""
+        if self.engine == 'vectorized':
+            results = sweep_vectorized(self.calculate_day, days, income_dict, expense_dict, prev_balance)
+            if results is not None:
+                return results
+
+        return [day_result for _, day_result in self.iter_days(days, income_dict, expense_dict, prev_balance)]
+
+    def iter_days(self, days, income_dict, expense_dict, prev_balance) -> Iterator[Tuple[datetime, Dict[str, any]]]:
+        """Yield (day, result) for each of consecutive days as soon as it is computed."""
+        for current_date in days:
+            day_result = self.calculate_day(
+                prev_balance,
+                income_dict.get(current_date, []),
+                expense_dict.get(current_date, [])
+            )
+            yield current_date, day_result
 
             # Update previous balance for the next day
-            prev_balance = available_balance
+            prev_balance = day_result['closing_balance']
+
+    def calculate_day(self, prev_balance, income_transactions, daily_expenses):
+        """Apply one day's income and expenses to the previous closing balance."""
+        # Get income for the current day
+        daily_income = sum(transaction.amount for transaction in income_transactions)
 
-            current_date += timedelta(days=1)
+        # Calculate available balance for the day
+        available_balance = prev_balance + daily_income
 
-        return result
+        # Process expenses
+        can_pay_all = True
+        paid_expenses = []
+        unpaid_expenses = []
+        overdraft = Decimal('0')
+
+        for expense in daily_expenses:
+            if available_balance >= expense.amount:
+                available_balance -= expense.amount
+                paid_expenses.append(expense)
+            else:
+                can_pay_all = False
+                unpaid_expenses.append(expense)
+                overdraft += expense.amount - available_balance
+                available_balance = Decimal('0')
+                # break  # Stop processing further expenses
+                if available_balance < 0:
+                    break
+
+        # Prepare the result for this day
+        day_result = {
+            'opening_balance': prev_balance,
+            'closing_balance': available_balance,
+            'can_pay': can_pay_all,
+            'paid_transactions': paid_expenses,
+            'unpaid_transactions': unpaid_expenses,
+            'income': daily_income,
+            'income_transactions': income_transactions,
+        }
+
+        if not can_pay_all:
+            day_result['overdraft'] = overdraft
+
+        return day_result
     
-    def calculate_balances(self) -> Dict[datetime, Dict[str, Optional[Decimal]]]:
-        """Calculate daily balances based on the list of transactions."""
+    def forecast_window(self):
+        """Return the days recurrences are expanded over: window_start to the end of the range."""
+        return self.window_start, self.end_range
+
+    def calculate_balances(
+        self,
+        sparse: bool = False,
+        version: Optional[int] = None
+        ) -> Dict[datetime, Dict[str, Optional[Decimal]]]:
+        """Calculate daily balances based on the list of transactions.
+
+        With sparse, only the first day of the range and days with income or expenses are returned.
+        version, the user's data version when known, keeps forecasts cached before a
+        write made through another process from being served.
+        """
         
-        logger.info(f"Calculating balances for user: {self.user_id}")
-        transactions = get_transaction_service().list_user_transactions(self.user_id)
+        start_window, end_window = self.forecast_window()
+        window = (start_window.date(), self.start_range.date(), end_window.date(), sparse)
+        forecast = forecast_cache.get(self.user_id, window, version)
+        if forecast is not None:
+            return forecast.forecast
+        generation = forecast_cache.generation(self.user_id)
+
+        logger.info("Calculating balances for user: %s", self.user_id)
+        with forecast_phase_seconds.time('fetch_transactions'):
+            transactions = self.transaction_service.list_user_transactions(self.user_id)
+        forecast = self.build_forecast(transactions, sparse)
+        forecast_cache.set(self.user_id, window, forecast, generation, version)
+        return forecast.forecast
+
+    def iter_balances(
+        self,
+        sparse: bool = False,
+        version: Optional[int] = None
+        ) -> Iterator[Tuple[str, Dict[str, any]]]:
+        """Yield (mm-dd-yyyy, day) for the requested range, each day as soon as it is computed.
+
+        The days match calculate_balances. A cached forecast is replayed as is;
+        otherwise occurrences are mapped for only the days they fall on and the
+        days are swept one by one without being kept, so memory does not grow
+        with the window.
+        """
+        start_window, end_window = self.forecast_window()
+        window = (start_window.date(), self.start_range.date(), end_window.date(), sparse)
+        forecast = forecast_cache.get(self.user_id, window, version)
+        if forecast is not None:
+            yield from forecast.forecast.items()
+            return
+
+        with forecast_phase_seconds.time('fetch_transactions'):
+            transactions = self.transaction_service.list_user_transactions(self.user_id)
+        income, expense = {}, {}
+        ranks = {transaction.id: rank for rank, transaction in enumerate(transactions)}
+        with forecast_phase_seconds.time('expand'):
+            map_occurrences(self, transactions, start_window, end_window, ranks, income, expense)
+
+        balances = closing_balances(
+            self, self.date_range(start_window, self.start_range - timedelta(days=1)), income, expense
+        )
+        prev_balance = balances[-1] if balances else Decimal('0')
+        days = self.iter_days(self.date_range(self.start_range, end_window), income, expense, prev_balance)
+        for index, (day, day_result) in enumerate(days):
+            if not sparse or index == 0 or day in income or day in expense:
+                yield day.strftime("%m-%d-%Y"), day_result
+
+    def build_forecast(self, transactions, sparse: bool = False) -> IncrementalForecast:
+        """Build the forecast engine for already fetched transactions, bypassing the cache."""
+        start_window, end_window = self.forecast_window()
+        engine = SparseForecast if sparse else IncrementalForecast
+        return engine(self, transactions, start_window, end_window, self.start_range)
+
+    def calculate_forecast(self, transactions) -> Dict[str, Dict[str, any]]:
+        """Reference full recomputation of the forecast for a list of transactions."""
+        start_window, end_window = self.forecast_window()
+        offset = (self.start_range - start_window).days
+        if self.engine == 'vectorized':
+            results = forecast_vectorized(self, transactions, start_window, end_window)
+            if results is not None:
+                return dict(islice(results.items(), offset, None))
+
         self.separate_transactions_by_type(transactions)
-        today = datetime.now()
-        start_window = today - timedelta(days=30)
-        end_window = today + timedelta(days=210)
         recurring_income_transactions = {date: [] for date in self.date_range(start_window, end_window)}
         recurring_expense_transactions = {date: [] for date in self.date_range(start_window, end_window)}
         
         recurring_income , recurring_income_transactions= self.calculate_recurring_dates(self.income_transactions, recurring_income_transactions)
         recurring_expense, recurring_expense_transactions = self.calculate_recurring_dates(self.expense_transactions, recurring_expense_transactions)
         results = self.calculate_daily_finances(recurring_income_transactions, recurring_expense_transactions, start_window, end_window)
-        return results
-       
\ No newline at end of file
+        return dict(islice(results.items(), offset, None))
@@ -0,0 +1,74 @@
+"""Forecasts materialized at write time.
+
+With a snapshot store configured, every transaction write recomputes the
+user's default forecast and stores it as a compressed compact snapshot keyed by
+user and window start date. The recompute goes through the forecast cache, so
+after a single-transaction write only the affected suffix of days is swept.
+Default balance reads then decompress the snapshot instead of forecasting.
+
+A snapshot is stale once the day rolls over or the user's data version moved
+past it, e.g. after a failed refresh or a write from a process without
+materialization; the read recomputes and stores it again.
+"""
+import logging
+import zlib
+from services.forecast_format import compact_forecast
+from services.main_service import MainService
+from services.snapshot_storage import SnapshotStorage
+from utils.metrics import registry
+from utils.serialization import dumps_json
+
+logger = logging.getLogger(__name__)
+
+snapshot_reads = registry.counter(
+    'forecast_snapshot_reads_total', 'Balance reads by snapshot result', ['result']
+)
+snapshot_writes = registry.counter(
+    'forecast_snapshot_writes_total', 'Snapshots stored, by trigger', ['trigger']
+)
+
+
+class ForecastMaterializer:
+    """Keeps per-user forecast snapshots in a SnapshotStorage"""
+    def __init__(self, storage: SnapshotStorage, compression_level: int = 6):
+        self.storage = storage
+        self.compression_level = compression_level
+
+    def refresh(self, transaction_service, user_id: str, version: int) -> None:
+        """Materialize the user's forecast after a write that produced version
+
+        Failures are logged rather than failing the write; the next read finds
+        the snapshot stale and recomputes it.
+        """
+        try:
+            self.materialize(MainService(user_id, transaction_service), version, 'write')
+        except Exception:
+            logger.exception("Could not materialize the forecast of user: %s", user_id)
+
+    def materialize(self, service: MainService, version: int, trigger: str) -> bytes:
+        """Compute the service's forecast, store it as a snapshot and return its compact JSON"""
+        start_window, end_window = service.forecast_window()
+        body = dumps_json(compact_forecast(service.calculate_balances(version=version)))
+        self.storage.put({
+            'user_id': service.user_id,
+            'base_date': start_window.date().isoformat(),
+            'end_date': end_window.date().isoformat(),
+            'data_version': version,
+            'payload': zlib.compress(body, self.compression_level),
+        })
+        snapshot_writes.inc(trigger)
+        return body
+
+    def read(self, service: MainService, version: int) -> bytes:
+        """Compact forecast JSON of the service's window at version, from the snapshot when current
+
+        Only for the default range of a non-sparse forecast, which is what snapshots hold.
+        """
+        start_window, end_window = service.forecast_window()
+        snapshot = self.storage.get(service.user_id, start_window.date().isoformat())
+        if (snapshot is not None and snapshot['data_version'] == version
+                and snapshot['end_date'] == end_window.date().isoformat()):
+            snapshot_reads.inc('hit')
+            return zlib.decompress(snapshot['payload'])
+        snapshot_reads.inc('stale' if snapshot is not None else 'miss')
+        return self.materialize(service, version, 'read')
@@ -0,0 +1,143 @@
+"""Closed-form expansion of transaction schedules into occurrence ordinals.
+
+Dates are handled as proleptic Gregorian ordinals (date.toordinal()) so a
+schedule can be expanded with integer arithmetic: a stepped range for weekly
+and bi-weekly transactions and a month-index sequence clamped by month length
+for semi-monthly and monthly ones. Each date field is parsed once.
+"""
+import calendar
+from datetime import date
+from typing import List, Optional
+
+# Every month has at least this many days, so clamping to it is stable
+_SHORTEST_MONTH = 28
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """Parse an mm-dd-yyyy string without going through strptime"""
+    if not value:
+        return None
+    month, day, year = value.split('-')
+    return date(int(year), int(month), int(day))
+
+
+def month_index(value: date) -> int:
+    """Number of months since year 0, so consecutive months differ by one"""
+    return value.year * 12 + value.month - 1
+
+
+def _days_in_month(index: int) -> int:
+    return calendar.monthrange(index // 12, index % 12 + 1)[1]
+
+
+def _month_ordinal(index: int, day: int) -> int:
+    return date(index // 12, index % 12 + 1, day).toordinal()
+
+
+def monthly_ordinals(first_month: int, day: int, low: int, high: int,
+                     last_day: bool = False, cumulative: bool = False) -> List[int]:
+    """Ordinals of a once-a-month schedule that fall within [low, high].
+
+    last_day picks the last day of every month. Otherwise day is clamped to the
+    month length, either per month or, when cumulative, carried forward so a
+    date clamped once stays clamped (stepping a date by one month at a time).
+    """
+    occurrences = []
+    low_month = month_index(date.fromordinal(low))
+    month = first_month
+    while True:
+        length = _days_in_month(month)
+        if last_day:
+            occurrence_day = length
+        else:
+            occurrence_day = min(day, length)
+            if cumulative:
+                day = occurrence_day
+        ordinal = _month_ordinal(month, occurrence_day)
+        if ordinal > high:
+            break
+        if ordinal >= low:
+            occurrences.append(ordinal)
+        month += 1
+        # Months before the window cannot match; skip them once the day can no longer change
+        if month < low_month and (not cumulative or last_day or day <= _SHORTEST_MONTH):
+            month = low_month
+    return occurrences
+
+
+def occurrence_ordinals(transaction, window_start: int, window_end: int) -> List[int]:
+    """Return the ordinals a transaction occurs on within [window_start, window_end].
+
+    A day is repeated when a schedule hits it twice, e.g. both semi-monthly dates.
+    """
+    date_of_transaction = parse_date(transaction.date_of_transaction)
+    start_date = parse_date(transaction.start_date) or date_of_transaction
+    if transaction.skip_end_date:
+        end = window_end
+    else:
+        end_date = parse_date(transaction.end_date) or date_of_transaction
+        end = end_date.toordinal() if end_date else None
+    if start_date is None or end is None:
+        return []
+
+    frequency = transaction.frequency
+    first = start_date.toordinal()
+    if frequency in ('weekly', 'bi-weekly'):
+        first_date = parse_date(transaction.start_date)
+        if first_date is None or transaction.day is None:
+            return []
+        # Move to the nearest target weekday, backwards if it is more than 3 days ahead
+        days_diff = (transaction.day - 1 - first_date.weekday()) % 7
+        if days_diff > 3:
+            days_diff -= 7
+        first = first_date.toordinal() + days_diff
+    # The shifted first occurrence, not start_date, decides whether a schedule
+    # reaches the window, so a day's occurrences never depend on where it ends
+    if not (first <= window_end and end >= window_start):
+        return []
+    high = min(window_end, end)
+
+    if frequency == 'one-time':
+        if date_of_transaction is None:
+            return []
+        ordinal = date_of_transaction.toordinal()
+        return [ordinal] if window_start <= ordinal <= window_end else []
+
+    if frequency in ('weekly', 'bi-weekly'):
+        step = 7 if frequency == 'weekly' else 14
+        low = max(window_start, first)
+        if low > high:
+            return []
+        first += -(-(low - first) // step) * step
+        return list(range(first, high + 1, step))
+
+    if frequency == 'semi-monthly':
+        if date_of_transaction is None:
+            return []
+        occurrences = monthly_ordinals(
+            month_index(date_of_transaction), date_of_transaction.day,
+            window_start, high, cumulative=True
+        )
+        if transaction.last_day_of_month:
+            occurrences += monthly_ordinals(
+                month_index(start_date), 0, window_start, high, last_day=True
+            )
+        else:
+            second_date = parse_date(transaction.date_of_second_transaction)
+            if second_date is not None:
+                occurrences += monthly_ordinals(
+                    month_index(second_date), second_date.day,
+                    window_start, high, cumulative=True
+                )
+        return occurrences
+
+    if frequency == 'monthly':
+        if transaction.last_day_of_month:
+            return monthly_ordinals(month_index(start_date), 0, window_start, high, last_day=True)
+        if date_of_transaction is None:
+            return []
+        return monthly_ordinals(
+            month_index(date_of_transaction), date_of_transaction.day, window_start, high
+        )
+
+    return []
@@ -0,0 +1,128 @@
+"""Stores for materialized forecast snapshots.
+
+A snapshot is a plain dict: user_id, base_date and end_date (the forecast
+window, yyyy-mm-dd), data_version (the user's data version it was computed at)
+and payload (the zlib-compressed compact forecast JSON). Each store keeps one
+snapshot per user; get only returns it for the base date asked for, so a
+snapshot from an earlier day is never served.
+"""
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+from boto3.dynamodb.types import Binary
+
+
+class SnapshotStorage(ABC):
+    """Interface of the snapshot stores"""
+    @abstractmethod
+    def get(self, user_id: str, base_date: str) -> Optional[dict]:
+        """Return the user's snapshot for base_date, or None"""
+
+    @abstractmethod
+    def put(self, snapshot: dict) -> None:
+        """Store a snapshot, replacing the user's previous one"""
+
+    @abstractmethod
+    def delete(self, user_id: str) -> None:
+        """Drop the user's snapshot, if any"""
+
+
+class DynamoDBSnapshotStorage(SnapshotStorage):
+    """Snapshots in their own DynamoDB table with a user_id hash key
+
+    Payloads over MAX_PAYLOAD_BYTES would not fit the 400 KB item limit; those
+    users get no snapshot and are forecast on every read, as without one. Like
+    DynamoDBStorage, it calls a resource's thread-safe client.
+    """
+    MAX_PAYLOAD_BYTES = 350 * 1024
+
+    def __init__(self, client, table_name: str):
+        self.client = client
+        self.table_name = table_name
+
+    def get(self, user_id: str, base_date: str) -> Optional[dict]:
+        item = self.client.get_item(TableName=self.table_name, Key={'user_id': user_id}).get('Item')
+        if item is None or item['base_date'] != base_date:
+            return None
+        return {
+            **item,
+            'data_version': int(item['data_version']),
+            'payload': bytes(item['payload']),
+        }
+
+    def put(self, snapshot: dict) -> None:
+        if len(snapshot['payload']) > self.MAX_PAYLOAD_BYTES:
+            self.delete(snapshot['user_id'])
+            return
+        self.client.put_item(TableName=self.table_name, Item={**snapshot, 'payload': Binary(snapshot['payload'])})
+
+    def delete(self, user_id: str) -> None:
+        self.client.delete_item(TableName=self.table_name, Key={'user_id': user_id})
+
+
+class MemorySnapshotStorage(SnapshotStorage):
+    """Snapshots in a dict, for tests and single-process deployments"""
+    def __init__(self):
+        self.snapshots: Dict[str, dict] = {}
+
+    def get(self, user_id: str, base_date: str) -> Optional[dict]:
+        snapshot = self.snapshots.get(user_id)
+        if snapshot is None or snapshot['base_date'] != base_date:
+            return None
+        return snapshot
+
+    def put(self, snapshot: dict) -> None:
+        self.snapshots[snapshot['user_id']] = dict(snapshot)
+
+    def delete(self, user_id: str) -> None:
+        self.snapshots.pop(user_id, None)
+
+
+class SQLiteSnapshotStorage(SnapshotStorage):
+    """Snapshots in a forecast_snapshots table of a SQLite file"""
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS forecast_snapshots (
+                    user_id TEXT PRIMARY KEY,
+                    base_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    data_version INTEGER NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            """)
+
+    def get(self, user_id: str, base_date: str) -> Optional[dict]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT end_date, data_version, payload FROM forecast_snapshots "
+                "WHERE user_id = ? AND base_date = ?",
+                (user_id, base_date)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'user_id': user_id,
+            'base_date': base_date,
+            'end_date': row[0],
+            'data_version': row[1],
+            'payload': row[2],
+        }
+
+    def put(self, snapshot: dict) -> None:
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO forecast_snapshots "
+                "(user_id, base_date, end_date, data_version, payload) VALUES (?, ?, ?, ?, ?)",
+                (snapshot['user_id'], snapshot['base_date'], snapshot['end_date'],
+                 snapshot['data_version'], snapshot['payload'])
+            )
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self.connection.execute("DELETE FROM forecast_snapshots WHERE user_id = ?", (user_id,))
@@ -0,0 +1,53 @@
+"""Forecast engine that only visits days with income or expenses"""
+from decimal import Decimal
+from typing import List
+from services.incremental_forecast import IncrementalForecast
+
+
+class SparseForecast(IncrementalForecast):
+    """Event-days-only variant of IncrementalForecast.
+
+    Occurrences are kept only for the days they fall on and the sweep jumps
+    between those days in date order, carrying the closing balance across the
+    quiet days in between. The forecast holds the first day of the requested
+    range, so its opening balance is always present, followed by every day with
+    income or expenses; each listed day opens with the previous one's closing
+    balance.
+    """
+    def _init_days(self):
+        self.income = {}
+        self.expense = {}
+        self.event_count = 0
+
+    def __len__(self):
+        return self.event_count
+
+    def _sweep_from(self, affected: List):
+        if affected:
+            self._sweep(0)
+
+    def _sweep(self, start_index: int):
+        """Recompute the forecast over the event days"""
+        event_days = sorted(
+            day for day in self.income.keys() | self.expense.keys()
+            if self.income.get(day) or self.expense.get(day)
+        )
+        forecast = {}
+        prev_balance = Decimal('0')
+        for day in event_days:
+            if day < self.output_start:
+                prev_balance = self.service.calculate_closing_balance(
+                    prev_balance, self.income.get(day, []), self.expense.get(day, [])
+                )
+                continue
+            if not forecast and day > self.output_start:
+                forecast[self.output_start.strftime("%m-%d-%Y")] = self.service.calculate_day(prev_balance, [], [])
+            day_result = self.service.calculate_day(
+                prev_balance, self.income.get(day, []), self.expense.get(day, [])
+            )
+            forecast[day.strftime("%m-%d-%Y")] = day_result
+            prev_balance = day_result['closing_balance']
+        if not forecast:
+            forecast[self.output_start.strftime("%m-%d-%Y")] = self.service.calculate_day(prev_balance, [], [])
+        self.event_count = len(event_days)
+        self.forecast = forecast
@@ -0,0 +1,754 @@
+"""Storage backends for transaction items.
+
+TransactionService works on plain item dicts through TransactionStorage, so the
+DynamoDB table can be swapped for an in-process dict or a SQLite file, or fronted
+by a SQLite read-through replica. Pagination keys are opaque dicts holding at
+least 'id' and 'user_id', like a DynamoDB LastEvaluatedKey.
+
+Each backend also keeps a data version per user, used for ETags and optimistic
+concurrency. Single-item writes and atomic puts bump it in the same transaction
+as the data, so a version is never paired with data it does not describe.
+"""
+import copy
+import json
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from boto3.dynamodb.table import BatchWriter
+from botocore.exceptions import BotoCoreError, ClientError
+from services.recurrence import parse_date
+from utils.cache import LRUCache
+
+Page = Tuple[List[dict], Optional[dict]]
+
+# Item attributes stored as Decimal, the type boto3 returns for DynamoDB numbers
+DECIMAL_FIELDS = ('amount',)
+
+# Most put requests one BatchWriteItem call accepts
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_MAX_DELAY = 2.0
+
+
+class WriteConflict(Exception):
+    """An atomic write was refused: one of its items already exists"""
+
+
+class VersionMismatch(Exception):
+    """A conditional write found the user's data version changed"""
+
+
+class TransactionStorage(ABC):
+    """Operations TransactionService needs from a backend"""
+    @abstractmethod
+    def get(self, transaction_id: str) -> Optional[dict]:
+        """Return the item with this id, or None"""
+
+    @abstractmethod
+    def put(self, item: dict) -> int:
+        """Insert or replace an item and bump its user's data version atomically; return the new version"""
+
+    @abstractmethod
+    def update(self, transaction_id: str, user_id: str, fields: dict,
+               expected_version: Optional[int] = None) -> int:
+        """Set attributes on an existing item of user_id and bump the version atomically; return the new version
+
+        Raises KeyError if the item does not exist and, with expected_version,
+        VersionMismatch if the user's version is no longer expected_version.
+        """
+
+    @abstractmethod
+    def delete(self, transaction_id: str, user_id: str) -> Optional[int]:
+        """Delete an item of user_id and bump the version atomically; return the new version
+
+        Returns None, leaving the version alone, if the item did not exist.
+        """
+
+    @abstractmethod
+    def get_version(self, user_id: str) -> int:
+        """Return the user's data version, 0 before the first write"""
+
+    @abstractmethod
+    def bump_version(self, user_id: str) -> int:
+        """Increment the user's data version on its own and return the new value"""
+
+    @abstractmethod
+    def query_user(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None
+        ) -> Page:
+        """Return one page of a user's items and the key to continue from"""
+
+    def batch_write(self, puts: Iterable[dict] = (), deletes: Iterable[str] = ()) -> None:
+        """Apply many puts and deletes by id"""
+        for item in puts:
+            self.put(item)
+        for transaction_id in deletes:
+            item = self.get(transaction_id)
+            if item is not None:
+                self.delete(transaction_id, item['user_id'])
+
+    @abstractmethod
+    def put_atomic(self, user_id: str, items: List[dict], token: Optional[str] = None) -> int:
+        """Insert new items of user_id all or none and bump the version with them; return the new version
+
+        Raises WriteConflict if any id is taken. token identifies the request so a
+        retried call is not applied twice where the backend supports it.
+        """
+
+    def put_many(self, items: List[dict]) -> List[Optional[str]]:
+        """Insert or replace items, returning per item None if written or an error message
+
+        Data versions are left alone; callers bump them around the batch.
+        """
+        errors = []
+        for item in items:
+            try:
+                self.put(item)
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+
+class DynamoDBStorage(TransactionStorage):
+    """Items in a DynamoDB table with a user_id_index global secondary index
+
+    Data versions are items of the same table with ids 'version#<user_id>' and no
+    user_id attribute, so they stay out of the index.
+
+    Calls go through client, a DynamoDB resource's client that takes and returns
+    plain Python values. Unlike resources and their tables, clients are thread
+    safe, so one storage serves every executor thread.
+
+    The last version this process read or wrote for each of up to max_known
+    users is remembered, so a write can require it and return the next one
+    without reading it back.
+    """
+    VERSION_PREFIX = 'version#'
+
+    def __init__(self, client, table_name: str, max_attempts: int = 5, base_delay: float = 0.05,
+                 sleep=time.sleep, max_known: int = 65536):
+        self.client = client
+        self.table_name = table_name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.sleep = sleep
+        self.known_versions = LRUCache(max_known)
+
+    def get(self, transaction_id: str) -> Optional[dict]:
+        if transaction_id.startswith(self.VERSION_PREFIX):
+            return None
+        return self.client.get_item(TableName=self.table_name, Key={'id': transaction_id}).get('Item')
+
+    def _version_update(self, user_id: str, expected_version: Optional[int] = None) -> dict:
+        """TransactWriteItems Update incrementing the user's version, optionally only from expected_version"""
+        update = {
+            'TableName': self.table_name,
+            'Key': self._version_key(user_id),
+            'UpdateExpression': 'ADD data_version :one',
+            'ExpressionAttributeValues': {':one': 1},
+        }
+        if expected_version:
+            update['ConditionExpression'] = 'data_version = :expected'
+            update['ExpressionAttributeValues'][':expected'] = expected_version
+        elif expected_version is not None:
+            update['ConditionExpression'] = 'attribute_not_exists(data_version)'
+        return {'Update': update}
+
+    def _transact(self, user_id: str, actions: List[dict], expected_version: Optional[int] = None,
+                  token: Optional[str] = None) -> int:
+        """Apply actions and the user's version bump in one TransactWriteItems; return the new version
+
+        TransactWriteItems returns no attributes, so the bump is conditioned on a
+        version known beforehand and the new version is the next one. Without
+        expected_version the last version this process saw is used, 0 for a user
+        it has not seen; if another process wrote since, the version is read and
+        the write retried, up to max_attempts calls.
+        """
+        strict = expected_version is not None
+        version = expected_version if strict else self.known_versions.get(user_id, 0)
+        for attempt in range(1, self.max_attempts + 1):
+            request = {'TransactItems': [*actions, self._version_update(user_id, version)]}
+            if token:
+                request['ClientRequestToken'] = token
+            try:
+                self.client.transact_write_items(**request)
+            except ClientError as e:
+                reasons = self._cancellation_reasons(e)
+                # Only a stale version alone is retried; a failed action is the caller's answer
+                if (strict or attempt == self.max_attempts or not reasons
+                        or reasons[-1] != 'ConditionalCheckFailed'
+                        or 'ConditionalCheckFailed' in reasons[:-1]):
+                    raise
+                version = self.get_version(user_id)
+                # The retry differs from the cancelled request, so it cannot reuse its token;
+                # the actions' own conditions still keep it from applying twice
+                token = None
+                continue
+            self.known_versions.set(user_id, version + 1)
+            return version + 1
+
+    @staticmethod
+    def _cancellation_reasons(error: ClientError) -> List[Optional[str]]:
+        if error.response['Error']['Code'] != 'TransactionCanceledException':
+            return []
+        return [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+
+    def put(self, item: dict) -> int:
+        return self._transact(item['user_id'], [{'Put': {'TableName': self.table_name, 'Item': item}}])
+
+    @staticmethod
+    def _update_expression(fields: dict) -> dict:
+        """UpdateExpression and attribute placeholders setting fields"""
+        update_expression = "SET "
+        expression_attribute_values = {}
+        expression_attribute_names = {}
+        for key, value in fields.items():
+            placeholder = f":val_{key}"
+            name_placeholder = f"#name_{key}"
+            update_expression += f"{name_placeholder} = {placeholder}, "
+            expression_attribute_values[placeholder] = value
+            expression_attribute_names[name_placeholder] = key
+
+        # Remove trailing comma and space
+        update_expression = update_expression.rstrip(', ')
+        return {
+            'UpdateExpression': update_expression,
+            'ExpressionAttributeValues': expression_attribute_values,
+            'ExpressionAttributeNames': expression_attribute_names,
+        }
+
+    def update(self, transaction_id: str, user_id: str, fields: dict,
+               expected_version: Optional[int] = None) -> int:
+        action = {'Update': {
+            'TableName': self.table_name,
+            'Key': {'id': transaction_id},
+            'ConditionExpression': 'attribute_exists(id)',
+            **self._update_expression(fields),
+        }}
+        try:
+            return self._transact(user_id, [action], expected_version)
+        except ClientError as e:
+            reasons = self._cancellation_reasons(e)
+            if len(reasons) != 2:
+                raise
+            if reasons[1] == 'ConditionalCheckFailed' and expected_version is not None:
+                raise VersionMismatch(f"Data version of {user_id} is no longer {expected_version}") from e
+            if reasons[0] == 'ConditionalCheckFailed':
+                raise KeyError(transaction_id) from e
+            raise
+
+    def delete(self, transaction_id: str, user_id: str) -> Optional[int]:
+        if transaction_id.startswith(self.VERSION_PREFIX):
+            return None
+        action = {'Delete': {
+            'TableName': self.table_name,
+            'Key': {'id': transaction_id},
+            'ConditionExpression': 'attribute_exists(id)',
+        }}
+        try:
+            return self._transact(user_id, [action])
+        except ClientError as e:
+            if self._cancellation_reasons(e)[:1] == ['ConditionalCheckFailed']:
+                return None
+            raise
+
+    def _version_key(self, user_id: str) -> dict:
+        return {'id': f'{self.VERSION_PREFIX}{user_id}'}
+
+    def get_version(self, user_id: str) -> int:
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key=self._version_key(user_id),
+            ConsistentRead=True,
+            ProjectionExpression='data_version'
+        ).get('Item')
+        version = int(item['data_version']) if item else 0
+        self.known_versions.set(user_id, version)
+        return version
+
+    def bump_version(self, user_id: str) -> int:
+        response = self.client.update_item(
+            TableName=self.table_name,
+            Key=self._version_key(user_id),
+            UpdateExpression='ADD data_version :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='UPDATED_NEW'
+        )
+        version = int(response['Attributes']['data_version'])
+        self.known_versions.set(user_id, version)
+        return version
+
+    def query_user(self, user_id, limit=None, start_key=None) -> Page:
+        query_kwargs = {
+            'TableName': self.table_name,
+            'IndexName': 'user_id_index',
+            'KeyConditionExpression': '#user_id = :user_id',
+            'ExpressionAttributeValues': {':user_id': user_id},
+            'ExpressionAttributeNames': {'#user_id': 'user_id'},
+        }
+        if limit:
+            query_kwargs['Limit'] = limit
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        response = self.client.query(**query_kwargs)
+        return response['Items'], response.get('LastEvaluatedKey')
+
+    def batch_write(self, puts: Iterable[dict] = (), deletes: Iterable[str] = ()) -> None:
+        # batch_writer sends BatchWriteItem requests of 25 and resends unprocessed items
+        with BatchWriter(self.table_name, self.client) as batch:
+            for item in puts:
+                batch.put_item(Item=item)
+            for transaction_id in deletes:
+                batch.delete_item(Key={'id': transaction_id})
+
+    def put_atomic(self, user_id: str, items: List[dict], token: Optional[str] = None) -> int:
+        # One TransactWriteItems round trip; each put requires its id to be unused
+        actions = [
+            {'Put': {
+                'TableName': self.table_name,
+                'Item': item,
+                'ConditionExpression': 'attribute_not_exists(id)',
+            }}
+            for item in items
+        ]
+        try:
+            return self._transact(user_id, actions, token=token)
+        except ClientError as e:
+            if (e.response['Error']['Code'] == 'IdempotentParameterMismatchException'
+                    or 'ConditionalCheckFailed' in self._cancellation_reasons(e)[:-1]):
+                raise WriteConflict(e.response['Error']['Message']) from e
+            raise
+
+    def put_many(self, items: List[dict]) -> List[Optional[str]]:
+        errors: List[Optional[str]] = [None] * len(items)
+        for offset in range(0, len(items), BATCH_WRITE_LIMIT):
+            for index, message in self._batch_put(items[offset:offset + BATCH_WRITE_LIMIT]).items():
+                errors[offset + index] = message
+        return errors
+
+    def _batch_put(self, chunk: List[dict]) -> Dict[int, str]:
+        """One BatchWriteItem of up to 25 puts; return error messages by position in chunk
+
+        Unprocessed items are resent with exponential backoff and full jitter,
+        up to max_attempts calls in total.
+        """
+        positions = {item['id']: index for index, item in enumerate(chunk)}
+        pending = [{'PutRequest': {'Item': item}} for item in chunk]
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.sleep(random.uniform(0, min(BATCH_WRITE_MAX_DELAY, self.base_delay * 2 ** attempt)))
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table_name: pending})
+            except (ClientError, BotoCoreError) as e:
+                # Only this chunk's pending rows fail; other chunks are reported on their own
+                message = e.response['Error']['Message'] if isinstance(e, ClientError) else str(e)
+                return {positions[request['PutRequest']['Item']['id']]: message for request in pending}
+            pending = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not pending:
+                return {}
+        message = f"Not written after {self.max_attempts} attempts"
+        return {positions[request['PutRequest']['Item']['id']]: message for request in pending}
+
+
+class MemoryStorage(TransactionStorage):
+    """Items in process memory; a user's items are returned in insertion order"""
+    def __init__(self):
+        self.items: Dict[str, dict] = {}
+        self.by_user: Dict[str, Dict[str, None]] = {}
+        self.versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, transaction_id: str) -> Optional[dict]:
+        item = self.items.get(transaction_id)
+        return copy.deepcopy(item) if item is not None else None
+
+    def put(self, item: dict) -> int:
+        with self._lock:
+            self._delete(item['id'])
+            self.items[item['id']] = copy.deepcopy(item)
+            self.by_user.setdefault(item['user_id'], {})[item['id']] = None
+            return self._bump_version(item['user_id'])
+
+    def update(self, transaction_id: str, user_id: str, fields: dict,
+               expected_version: Optional[int] = None) -> int:
+        with self._lock:
+            if expected_version is not None and self.versions.get(user_id, 0) != expected_version:
+                raise VersionMismatch(f"Data version of {user_id} is no longer {expected_version}")
+            if transaction_id not in self.items:
+                raise KeyError(transaction_id)
+            self.items[transaction_id].update(copy.deepcopy(fields))
+            return self._bump_version(user_id)
+
+    def delete(self, transaction_id: str, user_id: str) -> Optional[int]:
+        with self._lock:
+            if self._delete(transaction_id) is None:
+                return None
+            return self._bump_version(user_id)
+
+    def get_version(self, user_id: str) -> int:
+        return self.versions.get(user_id, 0)
+
+    def _bump_version(self, user_id: str) -> int:
+        self.versions[user_id] = self.versions.get(user_id, 0) + 1
+        return self.versions[user_id]
+
+    def bump_version(self, user_id: str) -> int:
+        with self._lock:
+            return self._bump_version(user_id)
+
+    def put_atomic(self, user_id: str, items: List[dict], token: Optional[str] = None) -> int:
+        with self._lock:
+            taken = [item['id'] for item in items if item['id'] in self.items]
+            if taken:
+                raise WriteConflict(f"Items already exist: {', '.join(taken)}")
+            for item in items:
+                self.items[item['id']] = copy.deepcopy(item)
+                self.by_user.setdefault(item['user_id'], {})[item['id']] = None
+            return self._bump_version(user_id)
+
+    def _delete(self, transaction_id: str) -> Optional[dict]:
+        item = self.items.pop(transaction_id, None)
+        if item is not None and 'user_id' in item:
+            self.by_user.get(item['user_id'], {}).pop(transaction_id, None)
+        return item
+
+    def query_user(self, user_id, limit=None, start_key=None) -> Page:
+        with self._lock:
+            ids = list(self.by_user.get(user_id, ()))
+            if start_key:
+                ids = ids[ids.index(start_key['id']) + 1:] if start_key['id'] in ids else []
+            last_key = None
+            if limit and len(ids) > limit:
+                ids = ids[:limit]
+                last_key = {'id': ids[-1], 'user_id': user_id}
+            return [copy.deepcopy(self.items[item_id]) for item_id in ids], last_key
+
+
+class SQLiteStorage(TransactionStorage):
+    """Items in a SQLite file as JSON, indexed by user_id and by user and date columns
+
+    Dates are also stored as ISO yyyy-mm-dd columns so they sort and range-scan.
+    One connection is shared behind a lock, in WAL mode so readers of the file
+    from other processes are not blocked.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    date_of_transaction TEXT,
+                    start_date TEXT,
+                    end_date TEXT,
+                    item TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS transactions_user_id ON transactions (user_id, id);
+                CREATE INDEX IF NOT EXISTS transactions_user_dates
+                    ON transactions (user_id, start_date, end_date, date_of_transaction);
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    user_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                );
+            """)
+
+    @staticmethod
+    def _iso_date(value) -> Optional[str]:
+        try:
+            parsed = parse_date(value)
+        except (TypeError, ValueError):
+            return None
+        return parsed.isoformat() if parsed else None
+
+    @staticmethod
+    def _dumps(item: dict) -> str:
+        return json.dumps(item, default=str, separators=(',', ':'))
+
+    @staticmethod
+    def _loads(raw: str) -> dict:
+        item = json.loads(raw)
+        for field in DECIMAL_FIELDS:
+            if item.get(field) is not None:
+                item[field] = Decimal(item[field])
+        return item
+
+    def _row(self, item: dict) -> tuple:
+        return (
+            item['id'], item.get('user_id'),
+            self._iso_date(item.get('date_of_transaction')),
+            self._iso_date(item.get('start_date')),
+            self._iso_date(item.get('end_date')),
+            self._dumps(item),
+        )
+
+    def _put_rows(self, rows: List[tuple]) -> None:
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO transactions "
+            "(id, user_id, date_of_transaction, start_date, end_date, item) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    @contextmanager
+    def _immediate(self):
+        """Hold the lock and run the block in one write transaction, rolled back on any error"""
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _get(self, transaction_id: str) -> Optional[dict]:
+        row = self.connection.execute(
+            "SELECT item FROM transactions WHERE id = ?", (transaction_id,)
+        ).fetchone()
+        return self._loads(row[0]) if row else None
+
+    def get(self, transaction_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._get(transaction_id)
+
+    def put(self, item: dict) -> int:
+        with self._immediate():
+            self._put_rows([self._row(item)])
+            return self._bump_version(item['user_id'])
+
+    def update(self, transaction_id: str, user_id: str, fields: dict,
+               expected_version: Optional[int] = None) -> int:
+        with self._immediate():
+            if expected_version is not None and self._get_version(user_id) != expected_version:
+                raise VersionMismatch(f"Data version of {user_id} is no longer {expected_version}")
+            item = self._get(transaction_id)
+            if item is None:
+                raise KeyError(transaction_id)
+            self._put_rows([self._row({**item, **fields})])
+            return self._bump_version(user_id)
+
+    def delete(self, transaction_id: str, user_id: str) -> Optional[int]:
+        with self._immediate():
+            deleted = self.connection.execute(
+                "DELETE FROM transactions WHERE id = ? RETURNING id", (transaction_id,)
+            ).fetchone()
+            return self._bump_version(user_id) if deleted else None
+
+    def query_user(self, user_id, limit=None, start_key=None) -> Page:
+        sql = "SELECT id, item FROM transactions WHERE user_id = ?"
+        params: list = [user_id]
+        if start_key:
+            sql += " AND id > ?"
+            params.append(start_key['id'])
+        sql += " ORDER BY id"
+        if limit:
+            # One extra row tells whether another page follows
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        last_key = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            last_key = {'id': rows[-1][0], 'user_id': user_id}
+        return [self._loads(item) for _, item in rows], last_key
+
+    def replace_user(self, user_id: str, items: Iterable[dict]) -> None:
+        """Atomically make items the complete set stored for a user"""
+        rows = [self._row(item) for item in items]
+        with self._immediate():
+            self.connection.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
+            self._put_rows(rows)
+
+    def _get_version(self, user_id: str) -> int:
+        row = self.connection.execute(
+            "SELECT version FROM data_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_version(self, user_id: str) -> int:
+        with self._lock:
+            return self._get_version(user_id)
+
+    def _bump_version(self, user_id: str) -> int:
+        return self.connection.execute(
+            "INSERT INTO data_versions (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1 RETURNING version",
+            (user_id,)
+        ).fetchone()[0]
+
+    def bump_version(self, user_id: str) -> int:
+        with self._lock:
+            return self._bump_version(user_id)
+
+    def put_atomic(self, user_id: str, items: List[dict], token: Optional[str] = None) -> int:
+        rows = [self._row(item) for item in items]
+        try:
+            with self._immediate():
+                self.connection.executemany(
+                    "INSERT INTO transactions "
+                    "(id, user_id, date_of_transaction, start_date, end_date, item) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                return self._bump_version(user_id)
+        except sqlite3.IntegrityError as e:
+            raise WriteConflict(str(e)) from e
+
+    def put_many(self, items: List[dict]) -> List[Optional[str]]:
+        # One transaction; a failed INSERT only undoes that statement, so other rows still commit
+        errors: List[Optional[str]] = []
+        try:
+            with self._immediate():
+                for item in items:
+                    try:
+                        self._put_rows([self._row(item)])
+                        errors.append(None)
+                    except Exception as e:
+                        if not self.connection.in_transaction:
+                            # SQLite rolled the whole transaction back; later rows must not autocommit
+                            raise
+                        errors.append(str(e))
+        except sqlite3.Error as e:
+            return [str(e)] * len(items)
+        return errors
+
+    def batch_write(self, puts: Iterable[dict] = (), deletes: Iterable[str] = ()) -> None:
+        rows = [self._row(item) for item in puts]
+        with self._immediate():
+            self._put_rows(rows)
+            self.connection.executemany(
+                "DELETE FROM transactions WHERE id = ?", [(transaction_id,) for transaction_id in deletes]
+            )
+
+
+class ReplicatedStorage(TransactionStorage):
+    """Read-through SQLite replica in front of a primary backend
+
+    A user's items are copied from the primary on their first query and served
+    locally until the copy is older than ttl seconds. Writes go to the primary
+    first and are then applied to the replica, so this process reads its own
+    writes; changes made through other processes appear once the copy expires.
+    """
+    def __init__(self, primary: TransactionStorage, replica: SQLiteStorage, ttl: float,
+                 clock=time.monotonic):
+        self.primary = primary
+        self.replica = replica
+        self.ttl = ttl
+        self.clock = clock
+        self.loaded_at: Dict[str, float] = {}
+        # Primary data version each copy was loaded at, to notice writes from elsewhere
+        self.versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._user_locks: Dict[str, threading.Lock] = {}
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def _is_fresh(self, user_id: Optional[str]) -> bool:
+        """Whether the user's copy was loaded by this process less than ttl seconds ago"""
+        loaded_at = self.loaded_at.get(user_id)
+        return loaded_at is not None and self.clock() - loaded_at < self.ttl
+
+    def _ensure_loaded(self, user_id: str) -> None:
+        """Copy the user's items from the primary unless a fresh copy exists"""
+        if self._is_fresh(user_id):
+            return
+        # One load per user at a time; others wait for it instead of hitting the primary
+        with self._user_lock(user_id):
+            if self._is_fresh(user_id):
+                return
+            started = self.clock()
+            # Read before the items, so a write during the load shows up as a newer version
+            version = self.primary.get_version(user_id)
+            items, start_key = [], None
+            while True:
+                page, start_key = self.primary.query_user(user_id, start_key=start_key)
+                items.extend(page)
+                if not start_key:
+                    break
+            self.replica.replace_user(user_id, items)
+            self.versions[user_id] = version
+            self.loaded_at[user_id] = started
+
+    def _track_version(self, user_id: str, version: int) -> None:
+        """Keep the copy if version follows the one it was loaded at, else drop it"""
+        if self.versions.get(user_id) == version - 1:
+            self.versions[user_id] = version
+        else:
+            self.loaded_at.pop(user_id, None)
+
+    def get(self, transaction_id: str) -> Optional[dict]:
+        item = self.replica.get(transaction_id)
+        if item is None or not self._is_fresh(item.get('user_id')):
+            # Expired, dropped after a write from elsewhere, or left over from an earlier run of this file
+            return self.primary.get(transaction_id)
+        return item
+
+    def put(self, item: dict) -> int:
+        version = self.primary.put(item)
+        self.replica.batch_write(puts=[item])
+        self._track_version(item['user_id'], version)
+        return version
+
+    def update(self, transaction_id: str, user_id: str, fields: dict,
+               expected_version: Optional[int] = None) -> int:
+        version = self.primary.update(transaction_id, user_id, fields, expected_version)
+        item = self.replica.get(transaction_id)
+        if item is not None:
+            self.replica.batch_write(puts=[{**item, **fields}])
+            self._track_version(user_id, version)
+        else:
+            self.loaded_at.pop(user_id, None)
+        return version
+
+    def delete(self, transaction_id: str, user_id: str) -> Optional[int]:
+        version = self.primary.delete(transaction_id, user_id)
+        self.replica.batch_write(deletes=[transaction_id])
+        if version is not None:
+            self._track_version(user_id, version)
+        return version
+
+    def get_version(self, user_id: str) -> int:
+        version = self.primary.get_version(user_id)
+        if self.versions.get(user_id) != version:
+            # Written through another process since the copy was loaded
+            self.loaded_at.pop(user_id, None)
+        return version
+
+    def bump_version(self, user_id: str) -> int:
+        version = self.primary.bump_version(user_id)
+        self._track_version(user_id, version)
+        return version
+
+    def query_user(self, user_id, limit=None, start_key=None) -> Page:
+        self._ensure_loaded(user_id)
+        return self.replica.query_user(user_id, limit=limit, start_key=start_key)
+
+    def batch_write(self, puts: Iterable[dict] = (), deletes: Iterable[str] = ()) -> None:
+        puts, deletes = list(puts), list(deletes)
+        self.primary.batch_write(puts, deletes)
+        self.replica.batch_write(puts, deletes)
+
+    def put_many(self, items: List[dict]) -> List[Optional[str]]:
+        errors = self.primary.put_many(items)
+        self.replica.batch_write(puts=[item for item, error in zip(items, errors) if error is None])
+        return errors
+
+    def put_atomic(self, user_id: str, items: List[dict], token: Optional[str] = None) -> int:
+        version = self.primary.put_atomic(user_id, items, token)
+        self.replica.batch_write(puts=items)
+        self._track_version(user_id, version)
+        return version
@@ -1,111 +1,276 @@
-"""Service class to interact with the DynamoDB table"""
+"""Service class to interact with the transaction storage backend"""
+import asyncio
+import base64
+import binascii
+import contextvars
+import csv
+import io
+import json
+import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-import boto3
+from typing import Iterator, List, Optional, Tuple
 from botocore.exceptions import ClientError
-from models.transaction import Transaction, TransactionCreate
+from pydantic import ValidationError
+from models.transaction import ImportResult, ImportRowResult, Transaction, TransactionCreate
+from services.forecast_cache import forecast_cache
+from services.storage import TransactionStorage, WriteConflict
+
+logger = logging.getLogger(__name__)
+
+# Namespace for ids derived from idempotency keys
+IDEMPOTENCY_NAMESPACE = uuid.UUID('6f1c2b8e-3f5a-4c1e-9a7d-2b4e8c0d5f13')
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request"""
+
+def encode_cursor(last_evaluated_key: dict) -> str:
+    """Encode a LastEvaluatedKey as an opaque pagination token"""
+    raw = json.dumps(last_evaluated_key, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, user_id: str) -> dict:
+    """Decode a pagination token, rejecting tokens issued for another user"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        start_key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+    if not isinstance(start_key, dict) or start_key.get('user_id') != user_id:
+        raise ValueError("Invalid pagination cursor")
+    return start_key
+
+def read_csv_rows(text: str) -> List[dict]:
+    """Rows of a CSV with a header line of TransactionCreate fields; empty cells are omitted"""
+    return [
+        {field: value for field, value in row.items() if field and value not in (None, '')}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
 
 class TransactionService:
-    """Service class to interact with the DynamoDB table"""
-    def __init__(self, region_name, aws_access_key_id, aws_secret_access_key, table_name):
-        self.dynamodb  = boto3.resource('dynamodb',
-                                     region_name=region_name,
-                                     aws_access_key_id=aws_access_key_id,
-                                     aws_secret_access_key=aws_secret_access_key)
-        self.table = self.dynamodb.Table(table_name)
+    """Service class to interact with the transaction storage backend"""
+    def __init__(self, storage: TransactionStorage, materializer=None):
+        self.storage = storage
+        # A ForecastMaterializer refreshed after every write, when snapshots are enabled
+        self.materializer = materializer
 
-    def create_transaction(self, transaction: TransactionCreate) -> Transaction:
-        """Create a new transaction"""
+    def _materialize(self, user_id: str, version: int):
+        if self.materializer is not None:
+            self.materializer.refresh(self, user_id, version)
+
+    @staticmethod
+    def new_item(transaction: TransactionCreate) -> dict:
+        """Storage item for a new transaction, with a fresh id"""
         transaction_dict = transaction.dict()
         transaction_dict['id'] = str(uuid.uuid4())
-        # transaction_dict['user_id'] = user_id
         transaction_dict['amount'] = Decimal(str(transaction_dict['amount']))
+        return transaction_dict
+
+    def create_transaction(self, transaction: TransactionCreate) -> Transaction:
+        """Create a new transaction"""
+        transaction_dict = self.new_item(transaction)
         try:
-            self.table.put_item(Item=transaction_dict)
-            return Transaction(**transaction_dict)
+            version = self.storage.put(transaction_dict)
+            created = Transaction(**transaction_dict)
+            forecast_cache.upsert(created.user_id, created, version)
+            self._materialize(created.user_id, version)
+            return created
         except ClientError as e:
-            print(e.response['Error']['Message'])
+            logger.error("Could not create transaction: %s", e.response['Error']['Message'])
             raise
 
     def get_transaction(self, transaction_id: str) -> Transaction:
         """Get a transaction by ID"""
         try:
-            # response = self.table.get_item(Key={'id': transaction_id, 'user_id': user_id})
-            response = self.table.get_item(Key={'id': transaction_id})
-            item = response.get('Item')
+            item = self.storage.get(transaction_id)
             if item:
                 return Transaction(**item)
             else:
                 return None
         except ClientError as e:
-            print(e.response['Error']['Message'])
+            logger.error("Could not get transaction %s: %s", transaction_id, e.response['Error']['Message'])
             raise
 
+    def data_version(self, user_id: str) -> int:
+        """The user's data version, bumped by every write to their transactions"""
+        return self.storage.get_version(user_id)
+
     def update_transaction(
         self,
         transaction_id: str,
-        transaction: TransactionCreate
+        transaction: TransactionCreate,
+        expected_version: Optional[int] = None
         ) -> Transaction:
-        """Update a transaction"""
+        """Update a transaction
+
+        With expected_version the update only applies if the owner's data version
+        still matches, raising VersionMismatch otherwise.
+        """
         try:
-            update_expression = "SET "
-            expression_attribute_values = {}
-            expression_attribute_names = {}
+            fields = {}
             for key, value in transaction.model_dump(exclude_unset=True).items():
                 if key not in ['id', 'user_id']:
                     if key == 'amount':
                         value = Decimal(str(value))
-                    placeholder = f":val_{key}"
-                    name_placeholder = f"#name_{key}"
-                    update_expression += f"{name_placeholder} = {placeholder}, "
-                    expression_attribute_values[placeholder] = value
-                    expression_attribute_names[name_placeholder] = key
-
-            # Remove trailing comma and space
-            update_expression = update_expression.rstrip(', ')
-            if not expression_attribute_values:
+                    fields[key] = value
+
+            if not fields:
                 # return existing_transaction  # No fields to update
                 return transaction.model_dump()
 
-            # Perform the update
-            response = self.table.update_item(
-                Key={'id': transaction_id},
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_attribute_values,
-                ExpressionAttributeNames=expression_attribute_names,
-                ReturnValues="ALL_NEW"
-            )
-
-            return Transaction(**response['Attributes'])
+            current = self.storage.get(transaction_id)
+            if current is None:
+                return None
+            try:
+                version = self.storage.update(transaction_id, current['user_id'], fields, expected_version)
+            except KeyError:
+                return None
+            updated = Transaction(**{**current, **fields})
+            forecast_cache.upsert(updated.user_id, updated, version)
+            self._materialize(updated.user_id, version)
+            return updated
         except ClientError as e:
-            print(e.response['Error']['Message'])
+            logger.error("Could not update transaction %s: %s", transaction_id, e.response['Error']['Message'])
             raise
 
     def delete_transaction(self, transaction_id: str):
         """Delete a transaction"""
         try:
-            self.table.delete_item(Key={'id': transaction_id})
+            current = self.storage.get(transaction_id)
+            if current is None:
+                return
+            version = self.storage.delete(transaction_id, current['user_id'])
+            if version is not None:
+                forecast_cache.remove(current['user_id'], transaction_id, version)
+                self._materialize(current['user_id'], version)
         except ClientError as e:
-            print(e.response['Error']['Message'])
+            logger.error("Could not delete transaction %s: %s", transaction_id, e.response['Error']['Message'])
             raise
 
-    def list_user_transactions(self, user_id: str):
-        """Get all transactions for a user"""
+    def import_transactions(self, user_id: str, rows: List[dict]) -> ImportResult:
+        """Validate rows as TransactionCreate, batch write the valid ones and report each row
+
+        Rows default to user_id and may not name another user. The user's cached
+        forecasts are invalidated once after the writes rather than updated per row.
+        A batch cannot bump the data version in the same write, so it is bumped
+        before and after: ETags issued before the import never match again, even
+        if the second bump fails.
+        """
+        results: List[ImportRowResult] = []
+        items, positions = [], []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                results.append(ImportRowResult(row=index, status='invalid', errors=["Row must be an object"]))
+                continue
+            row = {**row, 'user_id': row.get('user_id') or user_id}
+            if row['user_id'] != user_id:
+                results.append(ImportRowResult(row=index, status='invalid', errors=["user_id does not match"]))
+                continue
+            try:
+                item = self.new_item(TransactionCreate(**row))
+            except ValidationError as e:
+                errors = [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+                results.append(ImportRowResult(row=index, status='invalid', errors=errors))
+                continue
+            positions.append(len(results))
+            results.append(ImportRowResult(row=index, status='created', id=item['id']))
+            items.append(item)
+
+        if items:
+            version = None
+            try:
+                self.storage.bump_version(user_id)
+                write_errors = self.storage.put_many(items)
+                if any(error is None for error in write_errors):
+                    version = self.storage.bump_version(user_id)
+            finally:
+                forecast_cache.invalidate(user_id)
+            if version is not None:
+                self._materialize(user_id, version)
+            for position, error in zip(positions, write_errors):
+                if error is not None:
+                    logger.error("Could not import row %d for user %s: %s", results[position].row, user_id, error)
+                    results[position] = ImportRowResult(row=results[position].row, status='failed', errors=[error])
+        created = sum(result.status == 'created' for result in results)
+        return ImportResult(created=created, failed=len(results) - created, rows=results)
+
+    def iter_user_transaction_pages(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        start_key: Optional[dict] = None
+        ) -> Iterator[Tuple[List[Transaction], Optional[dict]]]:
+        """Yield pages of a user's transactions, following LastEvaluatedKey"""
         try:
-            response = self.table.query(
-                IndexName='user_id_index',
-                KeyConditionExpression='user_id = :user_id',
-                ExpressionAttributeValues={':user_id': user_id}
-            )
-            return [Transaction(**item) for item in response['Items']]
+            while True:
+                items, start_key = self.storage.query_user(user_id, limit=limit, start_key=start_key)
+                yield [Transaction(**item) for item in items], start_key
+                if not start_key:
+                    break
         except ClientError as e:
-            print(e.response['Error']['Message'])
+            logger.error("Could not query transactions for user %s: %s", user_id, e.response['Error']['Message'])
             raise
 
-    def borrow_money(self, user_id: str, attributes: dict):
-        """Borrow money"""
+    def iter_user_transactions(self, user_id: str) -> Iterator[Transaction]:
+        """Stream all transactions for a user page by page"""
+        for items, _ in self.iter_user_transaction_pages(user_id):
+            yield from items
+
+    def list_user_transactions(self, user_id: str):
+        """Get all transactions for a user"""
+        return list(self.iter_user_transactions(user_id))
+
+    def list_user_transactions_page(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+        ) -> Tuple[List[Transaction], Optional[str]]:
+        """Get one page of a user's transactions and the cursor for the next page"""
+        start_key = decode_cursor(cursor, user_id) if cursor else None
+        pages = self.iter_user_transaction_pages(user_id, limit=limit, start_key=start_key)
+        items, last_key = next(pages)
+        pages.close()
+        return items, encode_cursor(last_key) if last_key else None
+
+    def create_transactions(
+        self,
+        user_id: str,
+        transactions: List[TransactionCreate],
+        idempotency_key: Optional[str] = None
+        ) -> List[Transaction]:
+        """Create several transactions of one user atomically
+
+        With an idempotency key the ids are derived from it, so a retry finds the
+        transactions it created before and returns them instead of duplicating them.
+        """
+        items = [self.new_item(transaction) for transaction in transactions]
+        token = None
+        if idempotency_key:
+            token = str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{user_id}\n{idempotency_key}"))
+            for leg, item in enumerate(items):
+                item['id'] = str(uuid.uuid5(uuid.UUID(token), str(leg)))
+        created = [Transaction(**item) for item in items]
         try:
+            version = self.storage.put_atomic(user_id, items, token)
+        except WriteConflict as e:
+            stored = [self.storage.get(item['id']) for item in items]
+            if not idempotency_key or any(
+                    existing is None or Transaction(**existing) != transaction
+                    for existing, transaction in zip(stored, created)):
+                raise IdempotencyConflict("Idempotency key was already used for a different request") from e
+            # A retry of a request that was applied with its version bump; the cache already has these
+            return created
+        for leg, transaction in enumerate(created, 1):
+            forecast_cache.upsert(user_id, transaction, version if leg == len(created) else None)
+        self._materialize(user_id, version)
+        return created
 
+    def borrow_money(self, user_id: str, attributes: dict, idempotency_key: Optional[str] = None):
+        """Borrow money: record the loan and its repayment together or not at all"""
+        try:
             transaction_income = TransactionCreate(
                 user_id = user_id,
                 name = 'Borrowed Money',
@@ -116,7 +281,6 @@ class TransactionService:
                 end_date=None,
                 date_of_transaction = attributes['current_date']
             )
-            transaction_income = self.create_transaction(transaction_income)
             transaction_expense = TransactionCreate(
                 user_id = user_id,
                 name='Return Borrowed Money',
@@ -127,8 +291,74 @@ class TransactionService:
                 end_date=None,
                 date_of_transaction = attributes['date_of_return']
             )
-            transaction_expense = self.create_transaction(transaction_expense)
-            return [transaction_income, transaction_expense]
+        except KeyError as e:
+            raise ValueError(f"Missing attribute: {e.args[0]}") from e
+        except (ArithmeticError, ValidationError) as e:
+            raise ValueError(f"Invalid loan: {e}") from e
+        try:
+            return self.create_transactions(user_id, [transaction_income, transaction_expense], idempotency_key)
         except ClientError as e:
-            print(e.response['Error']['Message'])
+            logger.error("Could not record loan for user %s: %s", user_id, e.response['Error']['Message'])
             raise
+
+
+class AsyncTransactionService:
+    """Awaitable TransactionService that runs the storage calls on a bounded thread pool"""
+    def __init__(self, service: TransactionService, max_workers: int):
+        self.service = service
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='transaction-service'
+        )
+
+    async def _run(self, func, *args):
+        """Run a blocking service call on the executor without stalling the event loop"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, context.run, func, *args)
+
+    async def create_transaction(self, transaction: TransactionCreate) -> Transaction:
+        """Create a new transaction"""
+        return await self._run(self.service.create_transaction, transaction)
+
+    async def import_transactions(self, user_id: str, rows: List[dict]) -> ImportResult:
+        """Validate and batch write many transactions"""
+        return await self._run(self.service.import_transactions, user_id, rows)
+
+    async def data_version(self, user_id: str) -> int:
+        """The user's data version"""
+        return await self._run(self.service.data_version, user_id)
+
+    async def get_transaction(self, transaction_id: str) -> Transaction:
+        """Get a transaction by ID"""
+        return await self._run(self.service.get_transaction, transaction_id)
+
+    async def update_transaction(
+        self,
+        transaction_id: str,
+        transaction: TransactionCreate,
+        expected_version: Optional[int] = None
+        ) -> Transaction:
+        """Update a transaction"""
+        return await self._run(self.service.update_transaction, transaction_id, transaction, expected_version)
+
+    async def delete_transaction(self, transaction_id: str):
+        """Delete a transaction"""
+        return await self._run(self.service.delete_transaction, transaction_id)
+
+    async def list_user_transactions(self, user_id: str):
+        """Get all transactions for a user"""
+        return await self._run(self.service.list_user_transactions, user_id)
+
+    async def list_user_transactions_page(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+        ) -> Tuple[List[Transaction], Optional[str]]:
+        """Get one page of a user's transactions and the cursor for the next page"""
+        return await self._run(self.service.list_user_transactions_page, user_id, limit, cursor)
+
+    async def borrow_money(self, user_id: str, attributes: dict, idempotency_key: Optional[str] = None):
+        """Borrow money"""
+        return await self._run(self.service.borrow_money, user_id, attributes, idempotency_key)
@@ -0,0 +1,172 @@
+"""Array-backed daily balance sweep on a day-index axis with integer cents"""
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from services.recurrence import occurrence_ordinals
+
+# Divisor from cents to the integer coefficient of a Decimal with the given exponent
+_SCALE = {0: 100, -1: 10, -2: 1}
+
+
+def _to_cents(amount: Decimal):
+    """Return (cents, exponent) for an amount, or None if it has sub-cent precision"""
+    exponent = amount.as_tuple().exponent
+    if not isinstance(exponent, int) or exponent < -2:
+        return None
+    return int(amount.scaleb(2)), min(exponent, 0)
+
+
+def _to_decimal(cents: int, exponent: int) -> Decimal:
+    """Rebuild the Decimal the reference sweep would hold, including its exponent"""
+    return Decimal(cents // _SCALE[exponent]).scaleb(exponent)
+
+
+class _DailyTotals:
+    """Per-day totals in cents, the smallest amount exponent seen and whether anything occurred"""
+    def __init__(self, count: int):
+        self.cents = np.zeros(count, dtype=np.int64)
+        self.exponent = np.zeros(count, dtype=np.int64)
+        self.present = np.zeros(count, dtype=bool)
+
+    def add(self, indices, cents, exponents):
+        """Scatter-add amounts onto their day indices"""
+        if len(indices):
+            np.add.at(self.cents, indices, cents)
+            np.minimum.at(self.exponent, indices, exponents)
+            self.present[indices] = True
+
+    def tolist(self):
+        return self.cents.tolist(), self.exponent.tolist(), self.present.tolist()
+
+
+def _scatter(days, day_map, converted) -> Optional[_DailyTotals]:
+    """Build daily totals from a day -> transactions map"""
+    indices, cents, exponents = [], [], []
+    for index, day in enumerate(days):
+        for transaction in day_map.get(day, ()):
+            # Recurring transactions repeat across days, so convert each amount once
+            amount = converted.get(id(transaction))
+            if amount is None:
+                amount = converted[id(transaction)] = _to_cents(transaction.amount) or (None, None)
+            if amount[0] is None:
+                return None
+            indices.append(index)
+            cents.append(amount[0])
+            exponents.append(amount[1])
+    totals = _DailyTotals(len(days))
+    totals.add(indices, cents, exponents)
+    return totals
+
+
+def forecast_vectorized(service, transactions, start_window, end_window) -> Optional[Dict[str, dict]]:
+    """Expand transactions straight onto the day-index axis and sweep them.
+
+    Returns None if any amount has sub-cent precision, in which case the caller
+    should use the reference implementation.
+    """
+    days = list(service.date_range(start_window, end_window))
+    start_ordinal = start_window.toordinal()
+    end_ordinal = end_window.toordinal()
+    income_dict = {day: [] for day in days}
+    expense_dict = {day: [] for day in days}
+    income = _DailyTotals(len(days))
+    expense = _DailyTotals(len(days))
+    income_transactions = [transaction for transaction in transactions if transaction.type == 'income']
+    expense_transactions = sorted(
+        (transaction for transaction in transactions if transaction.type == 'expense'),
+        key=lambda transaction: transaction.amount, reverse=True
+    )
+    for day_map, totals, ordered in ((income_dict, income, income_transactions),
+                                     (expense_dict, expense, expense_transactions)):
+        ordinals, cents, exponents = [], [], []
+        for transaction in ordered:
+            converted = _to_cents(transaction.amount)
+            if converted is None:
+                return None
+            occurrences = occurrence_ordinals(transaction, start_ordinal, end_ordinal)
+            for ordinal in occurrences:
+                day_map[days[ordinal - start_ordinal]].append(transaction)
+            ordinals.extend(occurrences)
+            cents.extend([converted[0]] * len(occurrences))
+            exponents.extend([converted[1]] * len(occurrences))
+        totals.add(np.asarray(ordinals, dtype=np.int64) - start_ordinal, cents, exponents)
+
+    results = sweep_vectorized(
+        service.calculate_day, days, income_dict, expense_dict, Decimal('0'), (income, expense)
+    )
+    return {day.strftime("%m-%d-%Y"): day_result for day, day_result in zip(days, results)}
+
+
+def sweep_vectorized(
+        calculate_day: Callable,
+        days: List,
+        income_dict: Dict,
+        expense_dict: Dict,
+        opening_balance: Decimal,
+        totals: Optional[tuple] = None
+    ) -> Optional[List[dict]]:
+    """Compute daily results for consecutive days, or None if amounts need the reference sweep.
+
+    Daily income and expense totals are built with scatter-adds in integer cents, so a
+    day on which everything can be paid costs one integer comparison. Only days where
+    the available balance falls short of the day's expenses, i.e. where can_pay flips,
+    are handed to calculate_day for the exact sequential treatment.
+    """
+    count = len(days)
+    if count == 0:
+        return []
+    opening = _to_cents(opening_balance)
+    if totals is None:
+        converted = {}
+        totals = (_scatter(days, income_dict, converted), _scatter(days, expense_dict, converted))
+    income, expense = totals
+    if opening is None or income is None or expense is None:
+        return None
+    income_cents, income_exponent, has_income = income.tolist()
+    expense_cents, expense_exponent, has_expense = expense.tolist()
+
+    results = []
+    balance, balance_exponent = opening
+    prev_balance = opening_balance
+    for index, day in enumerate(days):
+        if not has_income[index] and not has_expense[index]:
+            income_transactions = income_dict.get(day, [])
+            day_result = {
+                'opening_balance': prev_balance,
+                'closing_balance': prev_balance,
+                'can_pay': True,
+                'paid_transactions': [],
+                'unpaid_transactions': [],
+                'income': 0,
+                'income_transactions': income_transactions,
+            }
+            results.append(day_result)
+            continue
+
+        available = balance + income_cents[index]
+        if available < expense_cents[index]:
+            day_result = calculate_day(prev_balance, income_dict.get(day, []), expense_dict.get(day, []))
+            prev_balance = day_result['closing_balance']
+            balance, balance_exponent = _to_cents(prev_balance)
+            results.append(day_result)
+            continue
+
+        balance = available - expense_cents[index]
+        balance_exponent = min(balance_exponent, income_exponent[index], expense_exponent[index])
+        closing_balance = _to_decimal(balance, balance_exponent)
+        if has_income[index]:
+            daily_income = _to_decimal(income_cents[index], income_exponent[index])
+        else:
+            daily_income = 0
+        day_result = {
+            'opening_balance': prev_balance,
+            'closing_balance': closing_balance,
+            'can_pay': True,
+            'paid_transactions': list(expense_dict.get(day, [])),
+            'unpaid_transactions': [],
+            'income': daily_income,
+            'income_transactions': income_dict.get(day, []),
+        }
+        results.append(day_result)
+        prev_balance = closing_balance
+    return results
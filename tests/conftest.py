@@ -0,0 +1,91 @@
+"""Shared test setup: settings that need no AWS account, and DynamoDB, user, app and signing key fixtures"""
+import os
+import uuid
+
+# Settings are read at import time, so these must be in place before the app modules load
+for name, value in {
+    'AWS_REGION': 'us-east-1',
+    'AWS_COGNITO_USER_POOL_ID': 'us-east-1_test',
+    'AWS_COGNITO_CLIENT_ID': 'test-client',
+    'ALLOWED_ORIGINS': 'http://localhost',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'TRANSACTION_TABLE_NAME': 'transactions',
+    'STORAGE_BACKEND': 'memory',
+    'FORECAST_ROLLOVER_ENABLED': 'false',
+}.items():
+    os.environ.setdefault(name, value)
+
+import boto3
+import pytest
+from moto import mock_aws
+
+
+def create_table(resource):
+    """The transactions table with its user_id_index, as the app expects it"""
+    resource.create_table(
+        TableName='transactions',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'user_id_index',
+            'KeySchema': [{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'},
+        }],
+        BillingMode='PAY_PER_REQUEST',
+    )
+
+
+@pytest.fixture
+def dynamodb():
+    with mock_aws():
+        resource = boto3.resource('dynamodb', region_name='us-east-1')
+        create_table(resource)
+        # The storages take the resource's client, as the app gives them
+        yield resource.meta.client
+
+
+@pytest.fixture
+def user_id():
+    """A user id no other test uses, so the process-wide forecast cache never leaks between tests"""
+    return f'test-user-{uuid.uuid4()}'
+
+
+@pytest.fixture
+def client(user_id):
+    """Test client of the app, authenticated as user_id"""
+    from fastapi.testclient import TestClient
+    from app import app
+    from utils.auth import verify_token
+    app.dependency_overrides[verify_token] = lambda: user_id
+    try:
+        with TestClient(app) as test_client:
+            yield test_client
+    finally:
+        app.dependency_overrides.pop(verify_token, None)
+
+
+@pytest.fixture(scope='module')
+def signing_key():
+    """Private PEM of a throwaway key published as the Cognito JWKS, for signing test tokens"""
+    from benchmarks.auth import install_signing_key
+    from services.jwks import jwks_manager
+    keys, fetched_at = jwks_manager.keys, jwks_manager.fetched_at
+    yield install_signing_key()
+    jwks_manager.keys, jwks_manager.fetched_at = keys, fetched_at
+
+
+@pytest.fixture
+def no_refetch(monkeypatch):
+    """Record JWKS refetches instead of reaching the Cognito endpoint"""
+    from services.jwks import jwks_manager
+    refetches = []
+
+    async def refetch():
+        refetches.append(True)
+
+    monkeypatch.setattr(jwks_manager, '_refresh_quietly', refetch)
+    return refetches
@@ -0,0 +1,78 @@
+"""Concurrent transaction requests run side by side instead of queueing on the event loop"""
+import asyncio
+import threading
+import time
+from typing import Optional
+import httpx
+import pytest
+from app import app
+from models.transaction import TransactionCreate
+from services.storage import MemoryStorage
+from services.transaction_service import AsyncTransactionService, TransactionService
+from utils.auth import verify_token
+from utils.transactions import get_async_transaction_service
+
+DELAY = 0.05
+REQUESTS = 8
+
+
+class SlowStorage(MemoryStorage):
+    """MemoryStorage whose reads block like a DynamoDB round trip and count the reads in flight
+
+    With a barrier every read waits until all parties have arrived, which only
+    happens if the reads overlap; a timed out barrier fails the request.
+    """
+    def __init__(self, barrier: Optional[threading.Barrier] = None):
+        super().__init__()
+        self.barrier = barrier
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, transaction_id):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.barrier is not None:
+                self.barrier.wait()
+            else:
+                time.sleep(DELAY)
+            return super().get(transaction_id)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+async def fetch_concurrently(transaction_id: str) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        responses = await asyncio.gather(*(
+            client.get(f'/api/v1/transactions/{transaction_id}') for _ in range(REQUESTS)
+        ))
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+
+
+@pytest.mark.parametrize('workers', [REQUESTS, 1])
+def test_concurrent_requests_do_not_queue(user_id, workers):
+    # A single worker cannot get past a barrier, so it only gets the counter
+    barrier = threading.Barrier(REQUESTS, timeout=10) if workers == REQUESTS else None
+    storage = SlowStorage(barrier)
+    transaction_service = TransactionService(storage)
+    created = transaction_service.create_transaction(TransactionCreate(
+        user_id=user_id, type='expense', name='rent', amount=900,
+        frequency='one-time', date_of_transaction='01-01-2026'
+    ))
+    async_service = AsyncTransactionService(transaction_service, max_workers=workers)
+    app.dependency_overrides[verify_token] = lambda: user_id
+    app.dependency_overrides[get_async_transaction_service] = lambda: async_service
+    try:
+        asyncio.run(fetch_concurrently(created.id))
+    finally:
+        app.dependency_overrides.pop(verify_token, None)
+        app.dependency_overrides.pop(get_async_transaction_service, None)
+        async_service.executor.shutdown()
+
+    # Every read was in flight at once, or with a single worker strictly one at a time,
+    # which shows the overlap is the executor's doing and not the test client's
+    assert storage.max_in_flight == workers
@@ -0,0 +1,113 @@
+"""Local verification of Cognito tokens and the verified claims cache"""
+import asyncio
+import time
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from benchmarks.auth import make_token
+from config.settings import settings
+from services.cognito_service import CognitoService
+from services.jwks import jwks_manager
+from utils import auth
+from utils.cache import LRUCache
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def validate(token: str, **kwargs) -> dict:
+    return asyncio.run(CognitoService.decode_and_validate_token(token, **kwargs))
+
+
+def assert_rejected(token: str, status_code: int = 401, **kwargs):
+    with pytest.raises(HTTPException) as raised:
+        validate(token, **kwargs)
+    assert raised.value.status_code == status_code
+    return raised.value
+
+
+def test_valid_access_tokens_return_their_claims(signing_key, no_refetch):
+    claims = validate(make_token(signing_key))
+    assert (claims['sub'], claims['token_use']) == ('benchmark-user', 'access')
+
+
+def test_tampered_signature_is_rejected(signing_key, no_refetch):
+    header, payload, signature = make_token(signing_key).split('.')
+    forged = 'A' if signature[0] != 'A' else 'B'
+    assert_rejected(f'{header}.{payload}.{forged}{signature[1:]}')
+
+
+def test_token_signed_by_another_key_is_rejected(signing_key, no_refetch):
+    other = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    assert_rejected(make_token(other))
+
+
+def test_expired_token_is_rejected(signing_key, no_refetch):
+    now = int(time.time())
+    assert assert_rejected(make_token(signing_key, iat=now - 7200, exp=now - 60)).detail == "Token has expired"
+
+
+@pytest.mark.parametrize('claims', [
+    {'iss': 'https://cognito-idp.us-east-1.amazonaws.com/another-pool'},
+    {'client_id': 'another-client'},
+    {'client_id': None},
+    {'exp': None},
+    {'sub': None},
+])
+def test_tokens_with_wrong_claims_are_rejected(signing_key, no_refetch, claims):
+    assert_rejected(make_token(signing_key, **claims))
+
+
+def test_id_token_is_not_accepted_as_an_access_token(signing_key, no_refetch):
+    id_token = make_token(signing_key, token_use='id', client_id=None, aud=settings.AWS_COGNITO_CLIENT_ID)
+    assert_rejected(id_token)
+    assert validate(id_token, token_use='id')['token_use'] == 'id'
+
+
+def test_id_token_for_another_client_is_rejected(signing_key, no_refetch):
+    assert_rejected(make_token(signing_key, token_use='id', client_id=None, aud='another-client'), token_use='id')
+
+
+def test_unknown_kid_is_rejected_after_one_refetch(signing_key, no_refetch, monkeypatch):
+    monkeypatch.setattr(jwks_manager, 'last_attempt', float('-inf'))
+    assert assert_rejected(make_token(signing_key, kid='rotated-away')).detail == "Key not found"
+    assert no_refetch == [True]
+
+
+def test_cached_claims_drop_out_at_exp(signing_key, no_refetch, monkeypatch):
+    now = int(time.time())
+    clock = Clock(now)
+    monkeypatch.setattr(auth, 'claims_cache', LRUCache(max_entries=16, clock=clock))
+    verified = []
+    decode = CognitoService.decode_and_validate_token
+
+    async def counting(token, **kwargs):
+        verified.append(token)
+        return await decode(token, **kwargs)
+
+    monkeypatch.setattr(CognitoService, 'decode_and_validate_token', counting)
+    token = make_token(signing_key, exp=now + 60)
+    assert asyncio.run(auth.verify_token(token)) == 'benchmark-user'
+    clock.now = now + 59
+    assert asyncio.run(auth.verify_token(token)) == 'benchmark-user'
+    assert len(verified) == 1
+    clock.now = now + 60
+    assert asyncio.run(auth.verify_token(token)) == 'benchmark-user'
+    assert len(verified) == 2
+
+
+def test_forgotten_tokens_are_verified_again(signing_key, no_refetch, monkeypatch):
+    monkeypatch.setattr(auth, 'claims_cache', LRUCache(max_entries=16))
+    token = make_token(signing_key)
+    asyncio.run(auth.verify_claims(token))
+    assert len(auth.claims_cache) == 1
+    auth.forget_token(token)
+    assert len(auth.claims_cache) == 0
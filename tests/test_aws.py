@@ -0,0 +1,35 @@
+"""The shared AWS session and clients"""
+import pytest
+from config.settings import dbconf
+from utils import aws
+
+
+@pytest.fixture
+def fresh_clients():
+    caches = (aws.get_session, aws.get_dynamodb_client, aws.get_cognito_client)
+    for cached in caches:
+        cached.cache_clear()
+    yield
+    for cached in caches:
+        cached.cache_clear()
+
+
+def access_key(client) -> str:
+    return client._request_signer._credentials.get_frozen_credentials().access_key
+
+
+def test_only_dynamodb_uses_the_configured_keys(fresh_clients, monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'default-chain')
+    monkeypatch.setattr(dbconf, 'AWS_ACCESS_KEY_ID', 'dynamodb-only')
+    monkeypatch.setattr(dbconf, 'AWS_SECRET_ACCESS_KEY', 'secret')
+    assert access_key(aws.get_dynamodb_client()) == 'dynamodb-only'
+    assert access_key(aws.get_cognito_client()) == 'default-chain'
+
+
+def test_clients_are_shared_and_configured_alike(fresh_clients):
+    dynamodb, cognito = aws.get_dynamodb_client(), aws.get_cognito_client()
+    assert dynamodb is aws.get_dynamodb_client()
+    config = aws.get_client_config()
+    for client in (dynamodb, cognito):
+        assert client.meta.config.max_pool_connections == config.max_pool_connections
+        assert client.meta.config.retries == config.retries
@@ -0,0 +1,83 @@
+"""Batch forecasts for many users and the route guarding them"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import pytest
+from benchmarks.synthetic import make_transactions
+from config.settings import settings
+from services import batch_forecast
+from services.batch_forecast import iter_batch_forecasts
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+from utils import auth
+from utils.transactions import get_transaction_service
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Threads run forecast_chunk the same way as the process pool, without spawning
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(batch_forecast, 'get_process_pool', lambda: pool)
+    yield pool
+    pool.shutdown()
+
+
+def add_users(transaction_service, count):
+    user_ids = [f'batch-user-{index}' for index in range(count)]
+    for index, user_id in enumerate(user_ids):
+        for transaction in make_transactions(5, seed=index, user_id=user_id):
+            transaction_service.storage.put(transaction.model_dump())
+    return user_ids
+
+
+def test_batch_matches_single_user_forecasts(pool):
+    transaction_service = TransactionService(MemoryStorage())
+    user_ids = add_users(transaction_service, 7)
+    lines = iter_batch_forecasts(user_ids + user_ids[:2], transaction_service, chunk_size=3)
+    results = {record['user_id']: record['balances'] for record in map(json.loads, lines)}
+    assert sorted(results) == sorted(user_ids)
+    for user_id in user_ids:
+        service = MainService(user_id, transaction_service)
+        forecast = service.build_forecast(transaction_service.list_user_transactions(user_id)).forecast
+        assert results[user_id] == json.loads(batch_forecast.encode_result(user_id, forecast))['balances']
+
+
+def test_invalid_range_is_refused_before_anything_runs():
+    class NoFetch(TransactionService):
+        def list_user_transactions(self, user_id):
+            raise AssertionError("fetched")
+
+    today = MainService('').today
+    with pytest.raises(ValueError):
+        iter_batch_forecasts(['u1'], NoFetch(MemoryStorage()), start=today + timedelta(days=5), end=today)
+
+
+@pytest.fixture
+def groups(client, monkeypatch):
+    """Groups in the claims of the token the client sends"""
+    groups = []
+
+    async def verify_claims(token):
+        return {'sub': 'caller', 'cognito:groups': groups}
+    monkeypatch.setattr(auth, 'verify_claims', verify_claims)
+    client.cookies.set('access_token', 'token')
+    return groups
+
+
+def test_batch_route_is_off_by_default(client, groups):
+    groups.append(settings.BATCH_FORECAST_GROUP)
+    assert client.post('/api/v1/balances/batch', json={'user_ids': ['u1']}).status_code == 404
+
+
+def test_batch_route_needs_the_group(client, groups, monkeypatch, pool):
+    monkeypatch.setattr(settings, 'BATCH_FORECAST_ENABLED', True)
+    user_ids = add_users(get_transaction_service(), 2)
+    assert client.post('/api/v1/balances/batch', json={'user_ids': user_ids}).status_code == 403
+
+    groups.append(settings.BATCH_FORECAST_GROUP)
+    response = client.post('/api/v1/balances/batch', json={'user_ids': user_ids})
+    assert response.status_code == 200
+    assert sorted(json.loads(line)['user_id'] for line in response.text.splitlines()) == user_ids
+    invalid = client.post('/api/v1/balances/batch', json={'user_ids': user_ids, 'from': '01-01-2000'})
+    assert invalid.status_code == 400
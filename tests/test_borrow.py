@@ -0,0 +1,67 @@
+"""Borrowing writes both legs together or not at all, and retries are idempotent"""
+import uuid
+import pytest
+from services.storage import DynamoDBStorage
+from services.transaction_service import IDEMPOTENCY_NAMESPACE, IdempotencyConflict, TransactionService
+
+LOAN = {'amount_borrowed': 100, 'amount_to_be_returned': 110,
+        'current_date': '01-01-2026', 'date_of_return': '02-01-2026'}
+
+
+@pytest.fixture
+def transaction_service(dynamodb):
+    return TransactionService(DynamoDBStorage(dynamodb, 'transactions', sleep=lambda _: None))
+
+
+def leg_id(user_id, key, leg):
+    token = uuid.uuid5(IDEMPOTENCY_NAMESPACE, f"{user_id}\n{key}")
+    return str(uuid.uuid5(token, str(leg)))
+
+
+def test_both_legs_commit_in_one_transaction(transaction_service, dynamodb, user_id):
+    calls = []
+    dynamodb.meta.events.register('before-call.dynamodb.*', lambda model, **kwargs: calls.append(model.name))
+    income, expense = transaction_service.borrow_money(user_id, LOAN)
+    assert (income.type, income.amount, expense.type, expense.amount) == ('income', 100, 'expense', 110)
+    assert calls == ['TransactWriteItems']
+    assert transaction_service.data_version(user_id) == 1
+    assert {item.id for item in transaction_service.list_user_transactions(user_id)} == {income.id, expense.id}
+
+
+def test_retry_returns_the_original_loan(transaction_service, user_id):
+    first = transaction_service.borrow_money(user_id, LOAN, idempotency_key='retry')
+    assert transaction_service.borrow_money(user_id, LOAN, idempotency_key='retry') == first
+    assert len(transaction_service.list_user_transactions(user_id)) == 2
+    assert transaction_service.data_version(user_id) == 1
+
+
+def test_failed_second_leg_leaves_nothing_written(transaction_service, user_id):
+    # Another request already holds the repayment leg's id
+    transaction_service.storage.put({'id': leg_id(user_id, 'taken', 1), 'user_id': user_id, 'name': 'other',
+                                     'type': 'expense', 'amount': 1, 'frequency': 'one-time',
+                                     'date_of_transaction': '01-01-2026'})
+    with pytest.raises(IdempotencyConflict):
+        transaction_service.borrow_money(user_id, LOAN, idempotency_key='taken')
+    assert transaction_service.storage.get(leg_id(user_id, 'taken', 0)) is None
+    assert transaction_service.data_version(user_id) == 1
+
+
+@pytest.mark.parametrize('attributes', [
+    {key: value for key, value in LOAN.items() if key != 'date_of_return'},
+    {**LOAN, 'amount_to_be_returned': 'lots'},
+])
+def test_invalid_loans_write_nothing(transaction_service, user_id, attributes):
+    with pytest.raises(ValueError):
+        transaction_service.borrow_money(user_id, attributes)
+    assert transaction_service.list_user_transactions(user_id) == []
+    assert transaction_service.data_version(user_id) == 0
+
+
+def test_borrow_route(client, user_id):
+    url = f'/api/v1/users/{user_id}/borrow'
+    first = client.post(url, json=LOAN, headers={'Idempotency-Key': 'route'})
+    assert first.status_code == 200
+    assert client.post(url, json=LOAN, headers={'Idempotency-Key': 'route'}).json() == first.json()
+    conflict = client.post(url, json={**LOAN, 'amount_borrowed': 5}, headers={'Idempotency-Key': 'route'})
+    assert conflict.status_code == 409
+    assert client.post(url, json={'amount_borrowed': 5}).status_code == 400
@@ -0,0 +1,45 @@
+"""Bulk imports report a result for every row, whatever failed"""
+from botocore.exceptions import EndpointConnectionError
+from services.storage import DynamoDBStorage, SQLiteStorage
+
+
+def item(transaction_id, user_id='u1'):
+    return {'id': transaction_id, 'user_id': user_id, 'name': transaction_id}
+
+
+def test_sqlite_put_many_reports_failed_rows():
+    storage = SQLiteStorage(':memory:')
+    errors = storage.put_many([item('a'), {'user_id': 'u1', 'name': 'no id'}, item('b')])
+    assert errors[0] is None and errors[2] is None
+    assert errors[1]
+    assert [stored['id'] for stored in storage.query_user('u1')[0]] == ['a', 'b']
+
+
+def test_dynamodb_connection_error_fails_only_its_chunk(dynamodb):
+    calls = []
+
+    def fail_second_call(**kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise EndpointConnectionError(endpoint_url='https://dynamodb.us-east-1.amazonaws.com')
+    dynamodb.meta.events.register('before-call.dynamodb.BatchWriteItem', fail_second_call)
+
+    storage = DynamoDBStorage(dynamodb, 'transactions', sleep=lambda _: None)
+    errors = storage.put_many([item(f'id-{index:02}') for index in range(30)])
+    assert errors[:25] == [None] * 25
+    assert all('Could not connect' in error for error in errors[25:])
+    assert len(storage.query_user('u1')[0]) == 25
+
+
+def test_csv_import_route(client, user_id):
+    body = (
+        "type,name,amount,frequency,date_of_transaction\n"
+        "expense,rent,900,monthly,01-01-2026\n"
+        "expense,broken,-5,monthly,01-01-2026\n"
+    )
+    response = client.post(
+        f'/api/v1/users/{user_id}/transactions/bulk/csv',
+        files={'file': ('rows.csv', body, 'text/csv')}
+    )
+    assert response.status_code == 200
+    assert [row['status'] for row in response.json()['rows']] == ['created', 'invalid']
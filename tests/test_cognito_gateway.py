@@ -0,0 +1,132 @@
+"""CognitoGateway admission control, timeouts and circuit breaker against a fake client"""
+import asyncio
+import time
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from fastapi import HTTPException
+from services.cognito_gateway import CircuitBreaker, CognitoGateway
+
+DELAY = 0.05
+WORKERS, QUEUE = 2, 2
+
+
+class FakeCognito:
+    """Blocks for delay seconds per call; raises the queued errors first"""
+    def __init__(self):
+        self.delay = DELAY
+        self.errors = []
+
+    def initiate_auth(self, **kwargs):
+        time.sleep(self.delay)
+        if self.errors:
+            error = self.errors.pop(0)
+            if isinstance(error, Exception):
+                raise error
+            raise ClientError({'Error': {'Code': error, 'Message': error}}, 'InitiateAuth')
+        return {'AuthenticationResult': {}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def client():
+    return FakeCognito()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def gateway(client, clock):
+    gateway = CognitoGateway(client, max_workers=WORKERS, max_queue=QUEUE, timeout=1,
+                             breaker=CircuitBreaker(threshold=3, cooldown=30, clock=clock))
+    yield gateway
+    gateway.executor.shutdown(wait=True)
+
+
+async def outcome(gateway):
+    """Status code of one call, 200 on success or the client error code"""
+    try:
+        await gateway.call('initiate_auth', AuthFlow='USER_PASSWORD_AUTH')
+        return 200
+    except HTTPException as e:
+        return e.status_code
+    except ClientError as e:
+        return e.response['Error']['Code']
+
+
+async def in_turn(gateway, count):
+    return [await outcome(gateway) for _ in range(count)]
+
+
+def test_burst_past_capacity_is_shed(gateway):
+    async def burst():
+        return await asyncio.gather(*(outcome(gateway) for _ in range(3 * (WORKERS + QUEUE))))
+
+    outcomes = asyncio.run(burst())
+    assert outcomes.count(200) == WORKERS + QUEUE
+    assert outcomes.count(503) == 2 * (WORKERS + QUEUE)
+    assert gateway.stats()['operations']['initiate_auth']['rejected'] == 2 * (WORKERS + QUEUE)
+    assert gateway.pending == 0
+
+
+def test_event_loop_stays_responsive_while_workers_block(gateway, client):
+    client.delay = 0.2
+
+    async def scenario():
+        calls = asyncio.gather(*(outcome(gateway) for _ in range(WORKERS)))
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lag = time.perf_counter() - started - 0.01
+        await calls
+        return lag
+
+    assert asyncio.run(scenario()) < 0.05
+
+
+def test_timed_out_calls_free_their_slot_when_the_thread_finishes(gateway):
+    gateway.timeout = DELAY / 5
+
+    async def scenario():
+        outcomes = await asyncio.gather(*(outcome(gateway) for _ in range(WORKERS)))
+        still_running = gateway.pending
+        await asyncio.sleep(DELAY * 2)
+        return outcomes, still_running
+
+    outcomes, still_running = asyncio.run(scenario())
+    assert outcomes == [504] * WORKERS
+    assert still_running == WORKERS
+    assert gateway.pending == 0
+
+
+def test_client_errors_pass_through_and_keep_the_breaker_closed(gateway, client):
+    client.errors = ['NotAuthorizedException'] * 5
+    assert asyncio.run(in_turn(gateway, 5)) == ['NotAuthorizedException'] * 5
+    assert gateway.breaker.state == 'closed'
+
+
+def test_throttling_opens_the_breaker_until_a_trial_succeeds(gateway, client, clock):
+    client.errors = ['TooManyRequestsException'] * 3
+    assert asyncio.run(in_turn(gateway, 4)) == [429, 429, 429, 503]
+    assert gateway.breaker.state == 'open'
+    clock.now += 30
+    assert gateway.breaker.state == 'half-open'
+    assert asyncio.run(in_turn(gateway, 1)) == [200]
+    assert gateway.breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker(gateway, client, clock):
+    client.errors = [EndpointConnectionError(endpoint_url='https://cognito')] * 4
+    assert asyncio.run(in_turn(gateway, 3)) == [503] * 3
+    clock.now += 30
+    assert asyncio.run(in_turn(gateway, 2)) == [503, 503]
+    assert gateway.breaker.state == 'open'
+    assert client.errors == []
@@ -0,0 +1,144 @@
+"""CognitoService sign up checks and login profiles against a fake gateway"""
+import asyncio
+import json
+import uuid
+import pytest
+from fastapi import HTTPException
+from benchmarks.auth import make_token
+from config.settings import settings
+from models.auth import SignUpModel
+from services import cognito_service
+from services.cognito_service import CognitoService
+from utils.cache import LRUCache
+
+
+class FakeGateway:
+    """Answers list_users from a set of registered emails and logins from one user, recording each call"""
+    def __init__(self):
+        self.emails = set()
+        self.calls = []
+        # AuthenticationResult initiate_auth returns, aliases by cognito:username and get_user's attributes
+        self.authentication = None
+        self.aliases = {}
+        self.attributes = {}
+
+    async def call(self, operation, **kwargs):
+        self.calls.append(operation)
+        if operation == 'list_users':
+            email = kwargs['Filter'].split('"')[1]
+            return {'Users': [{'Username': email}] if email in self.emails else []}
+        if operation == 'sign_up':
+            self.emails.add(kwargs['UserAttributes'][0]['Value'])
+            return {}
+        if operation == 'initiate_auth':
+            return {'AuthenticationResult': self.authentication}
+        if operation == 'get_user':
+            username = next(iter(self.aliases))
+            return {'Username': username,
+                    'UserAttributes': [{'Name': name, 'Value': value} for name, value in self.attributes.items()]}
+        if operation == 'admin_update_user_attributes':
+            return {}
+        if operation == 'admin_get_user':
+            for username, aliases in self.aliases.items():
+                if kwargs['Username'] == username or kwargs['Username'] in aliases:
+                    return {'Username': username}
+        raise AssertionError(operation)
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    gateway = FakeGateway()
+    monkeypatch.setattr(cognito_service, 'cognito_gateway', gateway)
+    return gateway
+
+
+@pytest.fixture
+def email():
+    return f'{uuid.uuid4()}@example.com'
+
+
+def sign_up(email, username='user'):
+    return asyncio.run(CognitoService.sign_up(SignUpModel(username=username, email=email, password='pw')))
+
+
+def test_free_emails_are_checked_every_time(gateway, email):
+    assert not asyncio.run(CognitoService.email_exists(email))
+    # Registered through another worker in between
+    gateway.emails.add(email)
+    assert asyncio.run(CognitoService.email_exists(email))
+    assert gateway.calls == ['list_users', 'list_users']
+
+
+def test_taken_emails_are_remembered(gateway, email):
+    gateway.emails.add(email)
+    assert asyncio.run(CognitoService.email_exists(email))
+    assert asyncio.run(CognitoService.email_exists(email))
+    assert gateway.calls == ['list_users']
+
+
+def test_second_sign_up_with_an_email_is_refused_without_a_lookup(gateway, email):
+    assert sign_up(email) == {"message": "User signed up successfully"}
+    with pytest.raises(HTTPException) as raised:
+        sign_up(email, username='other')
+    assert raised.value.status_code == 409
+    assert gateway.calls == ['list_users', 'sign_up']
+
+
+@pytest.fixture
+def login_user(gateway, signing_key, no_refetch, monkeypatch):
+    """A user whose cognito:username differs from the email alias they log in with"""
+    monkeypatch.setattr(CognitoService, 'profile_cache', LRUCache(max_entries=16))
+    username, email = f'user-{uuid.uuid4()}', f'{uuid.uuid4()}@example.com'
+    gateway.aliases = {username: {email}}
+    gateway.attributes = {'sub': 'sub-1', 'email': email, 'given_name': 'Ada'}
+    id_token = make_token(signing_key, token_use='id', client_id=None, aud=settings.AWS_COGNITO_CLIENT_ID,
+                          sub='sub-1', email=email, given_name='Ada', **{'cognito:username': username})
+    gateway.authentication = {'IdToken': id_token, 'RefreshToken': 'refresh',
+                              'AccessToken': make_token(signing_key, sub='sub-1', username=username)}
+    return username, email
+
+
+def login(email):
+    response = asyncio.run(CognitoService.login(email, 'pw'))
+    return json.loads(response.body)
+
+
+def test_login_profile_comes_from_the_id_token(gateway, login_user):
+    username, email = login_user
+    profile = login(email)
+    assert (profile['username'], profile['user_id'], profile['email'], profile['first_name']) == (
+        username, 'sub-1', email, 'Ada'
+    )
+    assert gateway.calls == ['initiate_auth']
+    assert CognitoService.profile_cache.get(username)['email'] == email
+
+
+def test_login_falls_back_to_get_user_once_per_user(gateway, login_user):
+    username, email = login_user
+    # Not a token Cognito signed, so the profile cannot come from it
+    gateway.authentication['IdToken'] = 'not-a-token'
+    first = login(email)
+    assert first['username'] == username and first['first_name'] == 'Ada'
+    # Logging in again with the alias finds the profile cached under cognito:username
+    assert login(email) == first
+    assert gateway.calls == ['initiate_auth', 'get_user', 'initiate_auth']
+
+
+def test_attribute_updates_drop_the_cached_profile(gateway, login_user):
+    username, email = login_user
+    login(email)
+    asyncio.run(CognitoService.update_user_attributes(email, {'firstName': 'Grace'}))
+    assert CognitoService.profile_cache.get(username) is None
+    assert gateway.calls == ['initiate_auth', 'admin_update_user_attributes', 'admin_get_user']
+
+    login(email)
+    asyncio.run(CognitoService.mark_onboarding_completed(username, {}))
+    assert CognitoService.profile_cache.get(username) is None
+    # A cognito:username is dropped directly, without resolving it
+    assert gateway.calls[-1] == 'admin_update_user_attributes'
+
+
+def test_updates_resolve_no_alias_when_nothing_is_cached(gateway, login_user):
+    username, email = login_user
+    asyncio.run(CognitoService.update_user_attributes(email, {'firstName': 'Grace'}))
+    assert gateway.calls == ['admin_update_user_attributes']
@@ -0,0 +1,69 @@
+"""ETags and conditional requests on the transaction and balance routes"""
+import pytest
+
+
+def expense(user_id, **fields) -> dict:
+    return {'user_id': user_id, 'type': 'expense', 'name': 'rent', 'amount': 10,
+            'frequency': 'one-time', 'date_of_transaction': '01-01-2026', **fields}
+
+
+@pytest.fixture
+def created(client, user_id) -> dict:
+    response = client.post('/api/v1/transactions', json=expense(user_id))
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_balance_revalidates_until_a_write(client, user_id, created):
+    url = f'/api/v1/users/{user_id}/balance'
+    first = client.get(url)
+    etag = first.headers['ETag']
+    not_modified = client.get(url, headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == etag
+    assert not_modified.content == b''
+
+    client.post('/api/v1/transactions', json=expense(user_id, name='gym'))
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_transaction_revalidates_until_a_write(client, user_id, created):
+    url = f"/api/v1/transactions/{created['id']}"
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(url, headers={'If-None-Match': f'"v0", W/{etag}'}).status_code == 304
+
+    client.put(url, json=expense(user_id, amount=20))
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert float(changed.json()['amount']) == 20
+
+
+def test_update_with_a_stale_if_match_is_refused(client, user_id, created):
+    url = f"/api/v1/transactions/{created['id']}"
+    etag = client.get(url).headers['ETag']
+    client.post('/api/v1/transactions', json=expense(user_id, name='gym'))
+    assert client.put(url, json=expense(user_id, amount=20), headers={'If-Match': etag}).status_code == 412
+    assert float(client.get(url).json()['amount']) == 10
+
+    current = client.get(url).headers['ETag']
+    updated = client.put(url, json=expense(user_id, amount=20), headers={'If-Match': current})
+    assert updated.status_code == 200
+    assert float(updated.json()['amount']) == 20
+
+
+def test_if_match_star_requires_only_that_the_transaction_exists(client, user_id, created):
+    url = f"/api/v1/transactions/{created['id']}"
+    assert client.put(url, json=expense(user_id, amount=30), headers={'If-Match': '*'}).status_code == 200
+    assert client.put('/api/v1/transactions/missing', json=expense(user_id),
+                      headers={'If-Match': '*'}).status_code == 412
+
+
+@pytest.mark.parametrize('header', ['"abc"', 'W/"v1"', '"v1", "v2"', 'v1', ''])
+def test_malformed_if_match_is_refused(client, user_id, created, header):
+    url = f"/api/v1/transactions/{created['id']}"
+    assert client.put(url, json=expense(user_id, amount=30), headers={'If-Match': header}).status_code == 412
+    assert float(client.get(url).json()['amount']) == 10
@@ -0,0 +1,46 @@
+"""ForecastCache only refuses results computed across a write by the same user"""
+from datetime import date
+from services.forecast_cache import ForecastCache
+
+WINDOW = (date(2026, 1, 1), date(2026, 1, 1), date(2026, 8, 1), False)
+
+
+class Forecast(list):
+    """Stand-in forecast; the cache only weighs it by length"""
+
+
+def make_cache(**kwargs) -> ForecastCache:
+    return ForecastCache(max_entries=16, ttl=None, max_days=10000, **kwargs)
+
+
+def test_write_by_another_user_does_not_block_caching():
+    cache = make_cache()
+    generation = cache.generation('alice')
+    cache.invalidate('bob')
+    cache.set('alice', WINDOW, Forecast([1]), generation)
+    assert cache.get('alice', WINDOW) == [1]
+
+
+def test_write_by_the_same_user_blocks_caching():
+    cache = make_cache()
+    generation = cache.generation('alice')
+    cache.invalidate('alice')
+    cache.set('alice', WINDOW, Forecast([1]), generation)
+    assert cache.get('alice', WINDOW) is None
+    cache.set('alice', WINDOW, Forecast([2]), cache.generation('alice'))
+    assert cache.get('alice', WINDOW) == [2]
+
+
+def test_forgotten_writers_still_block_caching():
+    cache = make_cache(max_writers=2)
+    carol = cache.generation('carol')
+    cache.invalidate('alice')
+    alice = cache.generation('alice')
+    cache.invalidate('carol')
+    cache.invalidate('bob')
+    cache.invalidate('dave')
+    # Both stamps are forgotten: carol's write must still block, alice's result is conservatively dropped
+    cache.set('carol', WINDOW, Forecast([1]), carol)
+    cache.set('alice', WINDOW, Forecast([1]), alice)
+    assert cache.get('carol', WINDOW) is None
+    assert cache.get('alice', WINDOW) is None
@@ -0,0 +1,125 @@
+"""Round trips of the compact, columnar and msgpack encodings, and gzip negotiation"""
+import gzip
+import msgpack
+import pytest
+from fastapi.encoders import jsonable_encoder
+from benchmarks.synthetic import make_transactions
+from config.settings import settings
+from models.transaction import TransactionCreate
+from services.forecast_format import (
+    BALANCE_FIELDS, TRANSACTION_FIELDS, columnar_forecast, columnar_from_compact, compact_forecast,
+    expand_compact, format_compact,
+)
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+from utils.serialization import accepts_gzip, accepts_msgpack
+from utils.transactions import get_transaction_service
+
+
+@pytest.fixture
+def transactions(user_id):
+    transaction_service = get_transaction_service()
+    for transaction in make_transactions(25, seed=11, user_id=user_id):
+        transaction_service.create_transaction(TransactionCreate(**transaction.model_dump(exclude={'id'})))
+    return transaction_service
+
+
+def forecast_for(user_id, seed, sparse=False):
+    transaction_service = TransactionService(MemoryStorage())
+    for transaction in make_transactions(30, seed=seed, user_id=user_id):
+        transaction_service.storage.put(transaction.model_dump())
+    return MainService(user_id, transaction_service).calculate_balances(sparse=sparse)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('seed', range(3))
+def test_expanding_compact_gives_the_full_json(user_id, seed, sparse):
+    forecast = forecast_for(user_id, seed, sparse)
+    compact = compact_forecast(forecast)
+    assert expand_compact(compact) == jsonable_encoder(forecast)
+    assert format_compact(compact, 'full') == jsonable_encoder(forecast)
+    assert format_compact(compact, 'compact') is compact
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_columnar_arrays_are_aligned(user_id, seed):
+    forecast = forecast_for(user_id, seed)
+    columnar = columnar_forecast(forecast)
+    full = jsonable_encoder(forecast)
+    columns = ('dates', 'can_pay', 'overdraft') + BALANCE_FIELDS + TRANSACTION_FIELDS
+    assert set(columnar) == {'transactions', *columns}
+    assert {len(columnar[column]) for column in columns} == {len(forecast)}
+    for index, date in enumerate(columnar['dates']):
+        day = full[date]
+        for field in BALANCE_FIELDS + ('can_pay',):
+            assert columnar[field][index] == day[field]
+        assert columnar['overdraft'][index] == day.get('overdraft')
+        for field in TRANSACTION_FIELDS:
+            assert [columnar['transactions'][id] for id in columnar[field][index]] == day[field]
+    assert columnar_from_compact(compact_forecast(forecast)) == columnar
+
+
+@pytest.mark.parametrize('response_format', ['compact', 'columnar'])
+def test_msgpack_decodes_to_the_json_payload(client, user_id, transactions, response_format):
+    url = f'/api/v1/users/{user_id}/balance'
+    params = {'format': response_format}
+    expected = client.get(url, params=params).json()
+    response = client.get(url, params=params, headers={'Accept': 'application/msgpack'})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/msgpack'
+    assert 'Accept' in response.headers['vary'].split(', ')
+    assert msgpack.unpackb(response.content, raw=False) == expected
+
+
+def test_full_format_is_always_json(client, user_id, transactions):
+    response = client.get(f'/api/v1/users/{user_id}/balance', headers={'Accept': 'application/msgpack'})
+    assert response.headers['content-type'] == 'application/json'
+
+
+def test_gzip_only_above_the_minimum_size(client, user_id, transactions):
+    url = f'/api/v1/users/{user_id}/balance'
+    today = MainService(user_id).today.strftime('%m-%d-%Y')
+    small = client.get(url, params={'from': today, 'to': today}, headers={'Accept-Encoding': 'identity'})
+    large = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert len(small.content) < settings.GZIP_MINIMUM_SIZE < len(large.content)
+
+    response = client.get(url, params={'from': today, 'to': today}, headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in response.headers
+    assert response.content == small.content
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert int(response.headers['content-length']) < len(large.content)
+    assert response.json() == large.json()
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', True),
+    ('deflate, gzip;q=0.5', True),
+    ('gzip;q=0', False),
+    ('gzip; q=0, deflate', False),
+    ('identity', False),
+    (None, False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert accepts_gzip(accept_encoding) is expected
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('application/msgpack', True),
+    ('application/json, application/x-msgpack;q=0.9', True),
+    ('application/msgpack;q=0', False),
+    ('application/json', False),
+    (None, False),
+])
+def test_accepts_msgpack(accept, expected):
+    assert accepts_msgpack(accept) is expected
+
+
+def test_gzip_payload_is_standard_gzip(client, user_id, transactions):
+    # The test client decodes transparently; read the raw body to check the framing
+    url = f'/api/v1/users/{user_id}/balance'
+    with client.stream('GET', url, headers={'Accept-Encoding': 'gzip'}) as response:
+        raw = b''.join(response.iter_raw())
+    assert gzip.decompress(raw) == client.get(url, headers={'Accept-Encoding': 'identity'}).content
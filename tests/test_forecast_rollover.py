@@ -0,0 +1,125 @@
+"""Rolling forecasts over to the next day"""
+import asyncio
+import random
+from datetime import datetime, timedelta
+import pytest
+from benchmarks.synthetic import format_date, make_transactions
+from models.transaction import Transaction
+from services import forecast_rollover, main_service
+from services.forecast_cache import ForecastCache
+from services.forecast_rollover import ActiveUsers, ForecastRollover, cache_capacity
+from services.incremental_forecast import IncrementalForecast
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Tomorrow(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + timedelta(days=1)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_roll_forward_matches_a_build_for_the_next_days(seed):
+    transactions = make_transactions(random.Random(seed).randint(1, 40), seed=seed)
+    service = MainService('rollover-user', transaction_service=object())
+    start_window, end_window = service.forecast_window()
+    # Starts after the window; its first occurrence moves back onto a day a roll adds
+    start_date = end_window + timedelta(days=3)
+    transactions.append(Transaction(
+        id='late-weekly', user_id='rollover-user', type='expense', name='late weekly', amount=10,
+        frequency='weekly', start_date=format_date(start_date),
+        day=(start_date.weekday() + 4) % 7 + 1, skip_end_date=True
+    ))
+    forecast = IncrementalForecast(service, transactions, start_window, end_window)
+    for days in (1, 2, 3, 4):
+        forecast.roll_forward()
+        built = IncrementalForecast(service, transactions, start_window + timedelta(days=days),
+                                    end_window + timedelta(days=days))
+        assert forecast.forecast == built.forecast
+
+
+def test_only_whole_window_forecasts_roll():
+    service = MainService('rollover-user', transaction_service=object())
+    start_window, end_window = service.forecast_window()
+    forecast = IncrementalForecast(service, make_transactions(5, seed=1), start_window, end_window,
+                                   start_window + timedelta(days=10))
+    with pytest.raises(ValueError):
+        forecast.roll_forward()
+
+
+def test_active_users_expire_and_stay_bounded():
+    clock = Clock()
+    active = ActiveUsers(max_users=2, ttl=100, clock=clock)
+    active.touch('a')
+    clock.now = 50
+    active.touch('b')
+    active.touch('c')
+    assert active.users() == ['b', 'c']
+    active.touch('b')
+    assert active.users() == ['c', 'b']
+    clock.now = 151
+    assert active.users() == []
+
+
+def test_active_set_fits_the_cache():
+    assert cache_capacity(max_entries=1024, max_days=250000, window_days=241) == 1024
+    assert cache_capacity(max_entries=5000, max_days=250000, window_days=241) == 1037
+
+
+def test_run_rolls_cached_forecasts_to_the_next_day(monkeypatch, user_id):
+    cache = ForecastCache(max_entries=16, ttl=300, max_days=100000, keep_previous=True)
+    transaction_service = TransactionService(MemoryStorage())
+    for transaction in make_transactions(20, seed=3, user_id=user_id):
+        transaction_service.storage.put(transaction.model_dump())
+    monkeypatch.setattr(main_service, 'forecast_cache', cache)
+    monkeypatch.setattr(forecast_rollover, 'forecast_cache', cache)
+    monkeypatch.setattr(forecast_rollover, 'get_transaction_service', lambda: transaction_service)
+    version = transaction_service.data_version(user_id)
+    MainService(user_id, transaction_service).calculate_balances(version=version)
+
+    active = ActiveUsers(max_users=10, ttl=86400)
+    active.touch(user_id)
+    rollover = ForecastRollover(active, concurrency=1, cpu_share=1, delay=0)
+    monkeypatch.setattr(main_service, 'datetime', Tomorrow)
+    try:
+        assert asyncio.run(rollover.run()) == {'rolled': 1, 'rebuilt': 0, 'failed': 0}
+    finally:
+        rollover.executor.shutdown()
+
+    service = MainService(user_id, transaction_service)
+    hits = cache.stats()['hits']
+    rolled = service.calculate_balances(version=version)
+    assert cache.stats()['hits'] == hits + 1
+    assert rolled == service.build_forecast(transaction_service.list_user_transactions(user_id)).forecast
+
+
+def test_run_rolls_at_most_max_users(monkeypatch):
+    cache = ForecastCache(max_entries=16, ttl=300, max_days=100000, keep_previous=True)
+    monkeypatch.setattr(forecast_rollover, 'forecast_cache', cache)
+    start_window, end_window = MainService('rollover-user').forecast_window()
+    window = (start_window.date(), start_window.date(), end_window.date(), False)
+    for user_id in ('old-1', 'old-2', 'seen-2'):
+        cache.set(user_id, window, [None], cache.generation(user_id), version=1)
+    active = ActiveUsers(max_users=3, ttl=86400)
+    active.touch('seen-1')
+    active.touch('seen-2')
+    rollover = ForecastRollover(active, concurrency=1, cpu_share=1, delay=0)
+    rolled = []
+    monkeypatch.setattr(rollover, '_roll', lambda user_id: rolled.append(user_id) or 'rebuilt')
+    # No read comes in after midnight, so the run itself sets yesterday's forecasts aside
+    monkeypatch.setattr(main_service, 'datetime', Tomorrow)
+    try:
+        assert asyncio.run(rollover.run())['rebuilt'] == 3
+    finally:
+        rollover.executor.shutdown()
+    assert rolled == ['old-1', 'seen-1', 'seen-2']
@@ -0,0 +1,84 @@
+"""Cached forecasts updated incrementally must match a fresh recompute"""
+import random
+from decimal import Decimal
+import pytest
+from benchmarks.synthetic import make_transaction
+from models.transaction import TransactionCreate
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+
+
+def create_fields(transaction) -> dict:
+    return transaction.model_dump(exclude={'id'})
+
+
+def expense(user_id: str, name: str) -> TransactionCreate:
+    return TransactionCreate(
+        user_id=user_id, type='expense', name=name, amount=Decimal('50'),
+        frequency='one-time', date_of_transaction=MainService(user_id).today.strftime("%m-%d-%Y")
+    )
+
+
+def assert_matches_recompute(transaction_service, user_id, sparse=False):
+    cached = MainService(user_id, transaction_service).calculate_balances(
+        sparse=sparse, version=transaction_service.data_version(user_id)
+    )
+    service = MainService(user_id, transaction_service)
+    transactions = transaction_service.list_user_transactions(user_id)
+    if sparse:
+        fresh = service.build_forecast(transactions, sparse=True).forecast
+    else:
+        fresh = service.calculate_forecast(transactions)
+    assert cached == fresh
+
+
+def test_removed_rank_is_not_reused(user_id):
+    transaction_service = TransactionService(MemoryStorage())
+    a, b, c = (transaction_service.create_transaction(expense(user_id, name)) for name in 'ABC')
+    assert_matches_recompute(transaction_service, user_id)
+
+    transaction_service.delete_transaction(a.id)
+    transaction_service.create_transaction(expense(user_id, 'D'))
+    transaction_service.update_transaction(c.id, TransactionCreate(**{**create_fields(c), 'name': 'C2'}))
+
+    forecast = MainService(user_id, transaction_service).calculate_balances(
+        version=transaction_service.data_version(user_id)
+    )
+    today = MainService(user_id).today.strftime("%m-%d-%Y")
+    assert [expense.name for expense in forecast[today]['unpaid_transactions']] == ['B', 'C2', 'D']
+    assert_matches_recompute(transaction_service, user_id)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('seed', range(20))
+def test_write_sequences_match_recompute(user_id, seed, sparse):
+    rng = random.Random(seed)
+    transaction_service = TransactionService(MemoryStorage())
+    live = {}
+    for index in range(8):
+        created = transaction_service.create_transaction(
+            TransactionCreate(**create_fields(make_transaction(rng, index, user_id=user_id)))
+        )
+        live[created.id] = created
+    # Warm the cache so every later write is applied incrementally
+    assert_matches_recompute(transaction_service, user_id, sparse)
+
+    for step in range(30):
+        action = rng.choice(['add', 'remove', 'update'] if live else ['add'])
+        if action == 'add':
+            created = transaction_service.create_transaction(
+                TransactionCreate(**create_fields(make_transaction(rng, 100 + step, user_id=user_id)))
+            )
+            live[created.id] = created
+        elif action == 'remove':
+            transaction_id = rng.choice(sorted(live))
+            transaction_service.delete_transaction(transaction_id)
+            del live[transaction_id]
+        else:
+            transaction_id = rng.choice(sorted(live))
+            replacement = make_transaction(rng, 200 + step, user_id=user_id)
+            live[transaction_id] = transaction_service.update_transaction(
+                transaction_id, TransactionCreate(**create_fields(replacement))
+            )
+        assert_matches_recompute(transaction_service, user_id, sparse)
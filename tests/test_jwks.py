@@ -0,0 +1,135 @@
+"""JWKSManager against a local stub JWKS endpoint"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from services.jwks import JWKSManager, JWKSUnavailable
+
+# Any RSA public key will do: the tests only look keys up by kid
+PUBLIC_JWK = {
+    'alg': 'RS256', 'kty': 'RSA', 'e': 'AQAB', 'use': 'sig',
+    'n': '6iOvlObdMya1RSjUZons4cgBvmtpE_dYUVxh1CslrewQzCOIonLo5aMdECswmGa3VbioZ1DOP52lRWqURosOVbuYlQzoeSS'
+         'hv5GwBdzT3ao_it6dwe9FEmEb-Hl0bI7bMlGht40vInCySFyFAonNVPpmKXPNEHLtH8UER10AinUJ7XYBdGZzjqXeennG2N'
+         'ltAkNrmZTcAgR0gss_23qYNWUPmtdtDoLo7v9ZUzUXdBd987HEDkYTZ7qWCH-KJQ3jycg3URBwREFGGggcOM6yaIVgg0ngkyn'
+         'h597Im-eY5l0Mc_bRV8_8E8NBQpLMITIXzNWX2cPabqis-QpXYy_w0w',
+}
+TTL, REFRESH_AHEAD, MAX_STALE, MIN_REFETCH = 3600, 300, 86400, 30
+
+
+class StubJWKS:
+    """Serves a JWKS document on localhost after delay seconds, counting requests"""
+    def __init__(self):
+        self.delay = 0.0
+        self.kids = ['key-1']
+        self.status = 200
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps({'keys': [{**PUBLIC_JWK, 'kid': kid} for kid in stub.kids]}).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def stub():
+    stub = StubJWKS()
+    yield stub
+    stub.server.shutdown()
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def manager(stub, clock):
+    return JWKSManager(stub.url, ttl=TTL, refresh_ahead=REFRESH_AHEAD, max_stale=MAX_STALE,
+                       min_refetch_interval=MIN_REFETCH, timeout=5, clock=clock)
+
+
+async def get_many(manager, kid, count=50):
+    return await asyncio.gather(*(manager.get_key(kid) for _ in range(count)))
+
+
+def test_cold_start_shares_one_fetch(manager, stub):
+    stub.delay = 0.1
+    keys = asyncio.run(get_many(manager, 'key-1'))
+    assert all(keys)
+    assert stub.requests == 1
+
+
+def test_refresh_ahead_serves_current_keys_while_refreshing(manager, stub, clock):
+    async def scenario():
+        await manager.get_key('key-1')
+        stub.delay = 0.5
+        clock.now = TTL - REFRESH_AHEAD + 1
+        started = time.perf_counter()
+        keys = await get_many(manager, 'key-1')
+        elapsed = time.perf_counter() - started
+        await manager._background
+        return keys, elapsed
+
+    keys, elapsed = asyncio.run(scenario())
+    assert all(keys)
+    assert elapsed < 0.25
+    assert stub.requests == 2
+
+
+def test_outage_serves_stale_keys_until_max_stale(manager, stub, clock):
+    async def scenario():
+        await manager.get_key('key-1')
+        stub.status = 500
+        clock.now = TTL + 1
+        stale = await manager.get_key('key-1')
+        await manager._background
+        clock.now = TTL + MAX_STALE
+        with pytest.raises(JWKSUnavailable):
+            await manager.get_key('key-1')
+        return stale
+
+    assert asyncio.run(scenario()) is not None
+    assert manager.failures == 2
+
+
+def test_unknown_kids_refetch_at_most_once_per_interval(manager, stub, clock):
+    async def scenario():
+        await manager.get_key('key-1')
+        clock.now = MIN_REFETCH
+        first = await get_many(manager, 'forged')
+        again = await get_many(manager, 'forged')
+        requests_after_flood = stub.requests
+        stub.kids = ['key-2']
+        clock.now += MIN_REFETCH
+        rotated = await manager.get_key('key-2')
+        return first + again, requests_after_flood, rotated
+
+    forged, requests_after_flood, rotated = asyncio.run(scenario())
+    assert not any(forged)
+    assert requests_after_flood == 2
+    assert rotated is not None
+    assert stub.requests == 3
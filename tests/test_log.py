@@ -0,0 +1,160 @@
+"""Log record formatting, request ids, debug sampling and the queue handler"""
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from utils import log
+from utils.log import (
+    DebugSampler, JSONFormatter, NonBlockingQueueHandler, RequestIdFilter, RequestIdMiddleware, parse_levels
+)
+
+
+class Records(logging.Handler):
+    """Keeps the records it is handed"""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class SlowCount(int):
+    """A count whose increments take long enough for another thread to read the old value"""
+    def __add__(self, other):
+        time.sleep(0.001)
+        return SlowCount(int(self) + other)
+
+
+def make_record(level=logging.INFO, lineno=1, msg='message', args=None, **extra):
+    record = logging.LogRecord('test.logger', level, __file__, lineno, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_configured_logging_leaves_stdout_alone(monkeypatch, capsys):
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    monkeypatch.setattr(log, '_listener', None)
+    monkeypatch.setattr(log, '_handler', None)
+    monkeypatch.setattr(log.atexit, 'register', lambda func: None)
+    try:
+        log.configure_logging()
+        logging.getLogger('test.output').warning('to stderr')
+        log._listener.stop()
+    finally:
+        root.handlers[:] = handlers
+        root.setLevel(level)
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert json.loads(captured.err)['message'] == 'to stderr'
+
+
+def test_json_records_carry_the_message_request_id_and_extra_fields():
+    record = make_record(msg='paid %s', args=('rent',), request_id='req-1', user='u1')
+    entry = json.loads(JSONFormatter().format(record))
+    assert entry.pop('time').endswith('+00:00')
+    assert entry == {'level': 'INFO', 'logger': 'test.logger', 'message': 'paid rent',
+                     'request_id': 'req-1', 'user': 'u1'}
+
+
+def test_json_records_include_tracebacks_before_and_after_queueing():
+    try:
+        raise RuntimeError('boom')
+    except RuntimeError:
+        record = logging.LogRecord('test.logger', logging.ERROR, __file__, 1, 'failed', None,
+                                   sys.exc_info())
+    formatter = JSONFormatter()
+    assert 'RuntimeError: boom' in json.loads(formatter.format(record))['exc_info']
+    queued = NonBlockingQueueHandler(queue.Queue()).prepare(record)
+    entry = json.loads(formatter.format(queued))
+    assert entry['message'] == 'failed'
+    assert 'RuntimeError: boom' in entry['exc_info']
+    assert 'request_id' not in entry
+
+
+@pytest.mark.parametrize('sent', ['client-id', None])
+def test_request_ids_reach_the_records_and_the_response(sent):
+    records = Records()
+    records.addFilter(RequestIdFilter())
+    logger = logging.getLogger('test.request_id')
+    logger.addHandler(records)
+    logger.setLevel(logging.INFO)
+    app = FastAPI()
+
+    @app.get('/ping')
+    def ping():
+        logger.info('pong')
+        return {}
+
+    app.add_middleware(RequestIdMiddleware)
+    try:
+        response = TestClient(app).get('/ping', headers={'X-Request-ID': sent} if sent else {})
+    finally:
+        logger.removeHandler(records)
+    returned = response.headers['x-request-id']
+    if sent:
+        assert returned == sent
+    else:
+        assert len(returned) == 32
+    assert [record.request_id for record in records.records] == [returned]
+
+
+def test_records_outside_a_request_have_no_request_id():
+    record = make_record()
+    assert RequestIdFilter().filter(record)
+    assert record.request_id is None
+
+
+def test_debug_sampler_keeps_one_in_every_per_call_site():
+    sampler = DebugSampler(0.25)
+    kept = [sampler.filter(make_record(logging.DEBUG, lineno=10)) for _ in range(8)]
+    assert kept == [True, False, False, False] * 2
+    # Another call site is counted on its own
+    assert sampler.filter(make_record(logging.DEBUG, lineno=20))
+    assert all(sampler.filter(make_record(logging.INFO, lineno=10)) for _ in range(3))
+
+
+def test_debug_sampler_at_rate_zero_drops_debug_only():
+    sampler = DebugSampler(0)
+    assert not sampler.filter(make_record(logging.DEBUG))
+    assert sampler.filter(make_record(logging.WARNING))
+
+
+def test_parse_levels():
+    assert parse_levels(' botocore=warning, services.jwks = DEBUG,,') == {
+        'botocore': 'WARNING', 'services.jwks': 'DEBUG'
+    }
+    assert parse_levels('') == {}
+
+
+@pytest.mark.parametrize('levels', ['botocore', 'botocore=LOUD', '=DEBUG', 'botocore='])
+def test_parse_levels_rejects_invalid_entries(levels):
+    with pytest.raises(ValueError):
+        parse_levels(levels)
+
+
+def test_full_queue_counts_every_drop_across_threads():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.dropped = SlowCount(0)
+    record = make_record()
+    handler.enqueue(record)
+    start = threading.Barrier(8)
+
+    def drop():
+        start.wait()
+        for _ in range(25):
+            handler.enqueue(record)
+
+    threads = [threading.Thread(target=drop) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert handler.dropped == 8 * 25
+    assert handler.queue.qsize() == 1
@@ -0,0 +1,87 @@
+"""Metrics registry, the instrumented request path and the /metrics route"""
+import pytest
+from config.settings import settings
+from services.incremental_forecast import forecast_phase_seconds
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+from models.transaction import TransactionCreate
+from utils.metrics import Metric, Registry, http_requests
+
+
+def observations(histogram, *labels) -> int:
+    state = histogram._values.get(labels)
+    return sum(state[0]) if state else 0
+
+
+def test_metrics_must_define_their_samples():
+    with pytest.raises(TypeError):
+        Metric('plain', 'No samples')
+
+
+def test_render_uses_the_prometheus_text_format():
+    registry = Registry()
+    counter = registry.counter('calls_total', 'Calls', ['route'])
+    histogram = registry.histogram('call_seconds', 'Latency', ['route'], buckets=(0.1, 1))
+    registry.callback('queue_depth', 'Depth', lambda: 3)
+    counter.inc('/a "quoted"')
+    histogram.observe(0.5, '/a')
+    histogram.observe(2, '/a')
+    assert registry.render().splitlines() == [
+        '# HELP calls_total Calls',
+        '# TYPE calls_total counter',
+        'calls_total{route="/a \\"quoted\\""} 1',
+        '# HELP call_seconds Latency',
+        '# TYPE call_seconds histogram',
+        'call_seconds_bucket{route="/a",le="0.1"} 0',
+        'call_seconds_bucket{route="/a",le="1"} 1',
+        'call_seconds_bucket{route="/a",le="+Inf"} 2',
+        'call_seconds_sum{route="/a"} 2.5',
+        'call_seconds_count{route="/a"} 2',
+        '# HELP queue_depth Depth',
+        '# TYPE queue_depth gauge',
+        'queue_depth 3',
+    ]
+    with pytest.raises(ValueError):
+        registry.counter('calls_total', 'Again')
+
+
+def test_failing_callback_does_not_break_the_scrape():
+    registry = Registry()
+    registry.callback('broken', 'Raises', lambda: 1 / 0)
+    registry.counter('kept_total', 'Kept').inc()
+    assert registry.render().splitlines()[-1] == 'kept_total 1'
+
+
+def test_balance_path_times_expansion_and_sweeps(user_id):
+    transaction_service = TransactionService(MemoryStorage())
+    before = {phase: observations(forecast_phase_seconds, phase)
+              for phase in ('fetch_transactions', 'expand', 'sweep', 'resweep')}
+    MainService(user_id, transaction_service).calculate_balances(version=0)
+    transaction_service.create_transaction(TransactionCreate(
+        user_id=user_id, type='income', name='salary', amount=100, frequency='monthly',
+        date_of_transaction=MainService(user_id).today.strftime("%m-%d-%Y")
+    ))
+    after = {phase: observations(forecast_phase_seconds, phase) for phase in before}
+    assert {phase: after[phase] - before[phase] for phase in before} == {
+        'fetch_transactions': 1, 'expand': 1, 'sweep': 1, 'resweep': 1
+    }
+
+
+def test_requests_are_counted_by_route_template(client, user_id):
+    route = '/api/v1/users/{user_id}/balance'
+    before = http_requests._values.get(('GET', route, '200'), 0)
+    assert client.get(f'/api/v1/users/{user_id}/balance').status_code == 200
+    assert http_requests._values[('GET', route, '200')] == before + 1
+
+
+def test_metrics_need_the_configured_token(client, monkeypatch):
+    monkeypatch.setattr(settings, 'METRICS_TOKEN', '')
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(settings, 'METRICS_TOKEN', 'scrape-secret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert '# TYPE http_requests_total counter' in response.text
@@ -0,0 +1,90 @@
+"""Cursor pagination of a user's transactions"""
+import base64
+import json
+import pytest
+from models.transaction import TransactionCreate
+from services.storage import DynamoDBStorage, MemoryStorage
+from services.transaction_service import AsyncTransactionService, TransactionService, encode_cursor
+from utils.transactions import get_async_transaction_service
+
+
+class SmallPages:
+    """Mixin returning at most two items per query, so listings span several pages"""
+    queries = 0
+
+    def query_user(self, user_id, limit=None, start_key=None):
+        self.queries += 1
+        return super().query_user(user_id, limit=limit or 2, start_key=start_key)
+
+
+class SmallMemoryPages(SmallPages, MemoryStorage):
+    pass
+
+
+class SmallDynamoDBPages(SmallPages, DynamoDBStorage):
+    pass
+
+
+def make_storage(request, backend, small_pages=False):
+    if backend == 'memory':
+        return SmallMemoryPages() if small_pages else MemoryStorage()
+    storage = SmallDynamoDBPages if small_pages else DynamoDBStorage
+    return storage(request.getfixturevalue('dynamodb'), 'transactions')
+
+
+def expense(user_id, index) -> TransactionCreate:
+    return TransactionCreate(user_id=user_id, type='expense', name=f'expense {index}', amount=10,
+                             frequency='one-time', date_of_transaction='01-01-2026')
+
+
+@pytest.fixture(params=['memory', 'dynamodb'])
+def transaction_service(request, client):
+    service = TransactionService(make_storage(request, request.param))
+    async_service = AsyncTransactionService(service, max_workers=2)
+    client.app.dependency_overrides[get_async_transaction_service] = lambda: async_service
+    yield service
+    client.app.dependency_overrides.pop(get_async_transaction_service, None)
+    async_service.executor.shutdown()
+
+
+def test_pages_round_trip_through_next(client, user_id, transaction_service):
+    created = {transaction_service.create_transaction(expense(user_id, index)).id for index in range(7)}
+    seen, params, pages = [], {'limit': 3}, 0
+    while True:
+        response = client.get(f'/api/v1/users/{user_id}/transactions', params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page['items']) <= 3
+        seen.extend(item['id'] for item in page['items'])
+        pages += 1
+        if not page['next']:
+            break
+        params = {'limit': 3, 'next': page['next']}
+    assert len(seen) == len(created) and set(seen) == created
+    assert pages >= 3
+
+
+def test_cursor_of_another_user_is_rejected(client, user_id, transaction_service):
+    cursor = encode_cursor({'id': 'some-id', 'user_id': 'someone-else'})
+    response = client.get(f'/api/v1/users/{user_id}/transactions', params={'next': cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('cursor', [
+    '%%%not-base64',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    base64.urlsafe_b64encode(json.dumps(['a', 'list']).encode()).decode(),
+])
+def test_malformed_cursor_is_rejected(client, user_id, transaction_service, cursor):
+    response = client.get(f'/api/v1/users/{user_id}/transactions', params={'limit': 2, 'next': cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('backend', ['memory', 'dynamodb'])
+def test_listing_follows_last_evaluated_key(request, user_id, backend):
+    storage = make_storage(request, backend, small_pages=True)
+    transaction_service = TransactionService(storage)
+    created = {transaction_service.create_transaction(expense(user_id, index)).id for index in range(5)}
+    storage.queries = 0
+    assert {transaction.id for transaction in transaction_service.list_user_transactions(user_id)} == created
+    assert storage.queries == 3
@@ -0,0 +1,75 @@
+"""The closed-form recurrence expansion against the stepwise reference"""
+import random
+from datetime import datetime, timedelta
+import pytest
+from benchmarks.synthetic import FREQUENCIES, format_date, make_transaction
+from models.transaction import Transaction
+from services.main_service import MainService
+
+CASES_PER_SEED = 50
+
+
+@pytest.fixture(scope='module')
+def service():
+    return MainService('test-user', transaction_service=object())
+
+
+def random_case(rng: random.Random, index: int, frequency: str, service: MainService):
+    """A random schedule of frequency and a window of 0 to 400 days around it"""
+    base = datetime(2020, 1, 1) + timedelta(days=rng.randint(0, 3650))
+    transaction = make_transaction(rng, index, frequencies=[frequency], base=base)
+    start_window = service.truncate_date(base - timedelta(days=rng.randint(0, 400)))
+    end_window = start_window + timedelta(days=rng.randint(0, 400))
+    return transaction, start_window, end_window
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('frequency', FREQUENCIES)
+def test_closed_form_matches_stepwise_within_the_window(service, frequency, seed):
+    rng = random.Random(f'{frequency}-{seed}')
+    for index in range(CASES_PER_SEED):
+        transaction, start_window, end_window = random_case(rng, index, frequency, service)
+        closed_form = service.expand_transaction(transaction, start_window, end_window)
+        stepwise = service.expand_transaction_stepwise(transaction, start_window, end_window)
+
+        assert all(start_window <= day <= end_window for day in closed_form)
+        # Order is irrelevant: occurrences are mapped to their days
+        inside = [day for day in stepwise if day <= end_window]
+        assert sorted(closed_form) == sorted(inside), (transaction, start_window, end_window)
+        # The only allowed difference is the stepwise overshoot, which only semi-monthly has
+        overshoot = [day for day in stepwise if day > end_window]
+        assert not overshoot or frequency == 'semi-monthly'
+
+
+def test_semi_monthly_stops_at_the_end_of_the_window(service):
+    transaction = Transaction(
+        id='rent', user_id='test-user', type='expense', name='rent', amount=100,
+        frequency='semi-monthly', date_of_transaction='01-01-2026',
+        date_of_second_transaction='01-15-2026', end_date='12-31-2026'
+    )
+    start_window, end_window = datetime(2026, 1, 1), datetime(2026, 1, 10)
+    # The stepwise loop still emits the second date of the last month it visits
+    assert service.expand_transaction_stepwise(transaction, start_window, end_window) == [
+        datetime(2026, 1, 1), datetime(2026, 1, 15)
+    ]
+    assert service.expand_transaction(transaction, start_window, end_window) == [datetime(2026, 1, 1)]
+
+
+@pytest.mark.parametrize('lead', [1, 2, 3])
+@pytest.mark.parametrize('frequency', ['weekly', 'bi-weekly'])
+def test_range_matches_the_full_window_for_back_shifted_schedules(service, frequency, lead):
+    # The first occurrence is moved back lead days from start_date, onto the last day of the range
+    day = service.today + timedelta(days=10)
+    transactions = [
+        Transaction(id='pay', user_id='test-user', type='income', name='pay', amount=1000,
+                    frequency='one-time', date_of_transaction=format_date(service.today)),
+        Transaction(id='gym', user_id='test-user', type='expense', name='gym', amount=10,
+                    frequency=frequency, start_date=format_date(day + timedelta(days=lead)),
+                    day=day.weekday() + 1, skip_end_date=True),
+    ]
+    full = service.build_forecast(transactions).forecast
+    for start in (None, day - timedelta(days=5)):
+        ranged = MainService('test-user', transaction_service=object(), start=start, end=day)
+        forecast = ranged.build_forecast(transactions).forecast
+        assert forecast == {label: full[label] for label in forecast}
+        assert forecast[format_date(day)]['closing_balance'] == 990
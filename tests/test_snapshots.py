@@ -0,0 +1,118 @@
+"""Snapshot stores and forecasts materialized at write time"""
+import zlib
+from datetime import timedelta
+import pytest
+from models.transaction import TransactionCreate
+from services.forecast_cache import forecast_cache
+from services.forecast_format import compact_forecast
+from services.main_service import MainService
+from services.materialized_forecast import ForecastMaterializer
+from services.snapshot_storage import DynamoDBSnapshotStorage, MemorySnapshotStorage, SQLiteSnapshotStorage
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+from utils.serialization import dumps_json
+
+
+def dynamodb_snapshot_storage(client) -> DynamoDBSnapshotStorage:
+    """A snapshot table with its user_id hash key, on the mocked DynamoDB"""
+    client.create_table(
+        TableName='forecast_snapshots',
+        KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST',
+    )
+    return DynamoDBSnapshotStorage(client, 'forecast_snapshots')
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'dynamodb'])
+def snapshot_storage(request):
+    if request.param == 'memory':
+        return MemorySnapshotStorage()
+    if request.param == 'sqlite':
+        return SQLiteSnapshotStorage(':memory:')
+    return dynamodb_snapshot_storage(request.getfixturevalue('dynamodb'))
+
+
+def snapshot(user_id='u1', base_date='2026-01-01', version=1, payload=b'{}'):
+    return {'user_id': user_id, 'base_date': base_date, 'end_date': '2026-08-01',
+            'data_version': version, 'payload': payload}
+
+
+def expense(user_id, name='rent', amount=10) -> TransactionCreate:
+    return TransactionCreate(user_id=user_id, type='expense', name=name, amount=amount, frequency='monthly',
+                             date_of_transaction=MainService(user_id).today.strftime("%m-%d-%Y"))
+
+
+def fresh_body(transaction_service, user_id) -> bytes:
+    forecast_cache.invalidate(user_id)
+    service = MainService(user_id, transaction_service)
+    return dumps_json(compact_forecast(service.calculate_balances(version=transaction_service.data_version(user_id))))
+
+
+def test_store_keeps_one_snapshot_per_user(snapshot_storage):
+    snapshot_storage.put(snapshot(version=1, payload=b'old'))
+    snapshot_storage.put(snapshot(version=2, payload=b'new'))
+    assert snapshot_storage.get('u1', '2026-01-01') == snapshot(version=2, payload=b'new')
+    assert snapshot_storage.get('u1', '2025-12-31') is None
+    assert snapshot_storage.get('u2', '2026-01-01') is None
+    snapshot_storage.delete('u1')
+    assert snapshot_storage.get('u1', '2026-01-01') is None
+    snapshot_storage.delete('u1')
+
+
+def test_dynamodb_drops_snapshots_over_the_item_limit(dynamodb):
+    storage = dynamodb_snapshot_storage(dynamodb)
+    storage.put(snapshot())
+    storage.put(snapshot(version=2, payload=b'x' * (DynamoDBSnapshotStorage.MAX_PAYLOAD_BYTES + 1)))
+    assert storage.get('u1', '2026-01-01') is None
+
+
+def test_writes_refresh_the_snapshot(snapshot_storage, user_id):
+    materializer = ForecastMaterializer(snapshot_storage)
+    transaction_service = TransactionService(MemoryStorage(), materializer=materializer)
+    created = transaction_service.create_transaction(expense(user_id))
+    transaction_service.update_transaction(created.id, expense(user_id, amount=25))
+    transaction_service.create_transaction(expense(user_id, name='gym', amount=5))
+
+    service = MainService(user_id, transaction_service)
+    stored = snapshot_storage.get(user_id, service.window_start.date().isoformat())
+    assert stored['data_version'] == transaction_service.data_version(user_id) == 3
+    assert zlib.decompress(stored['payload']) == fresh_body(transaction_service, user_id)
+    assert materializer.read(service, 3) == fresh_body(transaction_service, user_id)
+
+
+def test_stale_snapshots_are_recomputed_on_read(snapshot_storage, user_id):
+    materializer = ForecastMaterializer(snapshot_storage)
+    storage = MemoryStorage()
+    TransactionService(storage, materializer=materializer).create_transaction(expense(user_id))
+    # A process without materialization writes next
+    transaction_service = TransactionService(storage)
+    transaction_service.create_transaction(expense(user_id, name='gym', amount=5))
+
+    service = MainService(user_id, transaction_service)
+    base_date = service.window_start.date().isoformat()
+    assert snapshot_storage.get(user_id, base_date)['data_version'] == 1
+    assert materializer.read(service, 2) == fresh_body(transaction_service, user_id)
+    assert snapshot_storage.get(user_id, base_date)['data_version'] == 2
+
+
+def test_snapshot_from_an_earlier_day_is_not_served(user_id):
+    snapshot_storage = MemorySnapshotStorage()
+    materializer = ForecastMaterializer(snapshot_storage)
+    transaction_service = TransactionService(MemoryStorage(), materializer=materializer)
+    transaction_service.create_transaction(expense(user_id))
+    service = MainService(user_id, transaction_service)
+    yesterday = (service.window_start - timedelta(days=1)).date().isoformat()
+    snapshot_storage.snapshots[user_id] = {**snapshot_storage.snapshots[user_id], 'base_date': yesterday,
+                                           'payload': zlib.compress(b'yesterday')}
+    assert materializer.read(service, 1) == fresh_body(transaction_service, user_id)
+
+
+def test_failed_refresh_does_not_fail_the_write(user_id):
+    class BrokenStorage(MemorySnapshotStorage):
+        def put(self, snapshot):
+            raise ConnectionError("snapshot store is down")
+
+    transaction_service = TransactionService(MemoryStorage(), materializer=ForecastMaterializer(BrokenStorage()))
+    created = transaction_service.create_transaction(expense(user_id))
+    assert transaction_service.get_transaction(created.id) == created
@@ -0,0 +1,151 @@
+"""Storage backends: writes and their data version bumps apply together or not at all"""
+import pytest
+from services.snapshot_storage import SnapshotStorage
+from services.storage import (
+    DynamoDBStorage, MemoryStorage, ReplicatedStorage, SQLiteStorage, TransactionStorage, VersionMismatch,
+    WriteConflict
+)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'dynamodb', 'replicated'])
+def storage(request):
+    if request.param == 'memory':
+        return MemoryStorage()
+    if request.param == 'sqlite':
+        return SQLiteStorage(':memory:')
+    dynamodb = DynamoDBStorage(request.getfixturevalue('dynamodb'), 'transactions', sleep=lambda _: None)
+    if request.param == 'dynamodb':
+        return dynamodb
+    return ReplicatedStorage(dynamodb, SQLiteStorage(':memory:'), ttl=300)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def item(transaction_id, user_id='u1', **fields):
+    return {'id': transaction_id, 'user_id': user_id, 'name': transaction_id, **fields}
+
+
+def test_put_bumps_version(storage):
+    assert storage.get_version('u1') == 0
+    assert storage.put(item('a')) == 1
+    assert storage.put(item('b')) == 2
+    assert storage.get_version('u1') == 2
+    assert storage.get_version('u2') == 0
+
+
+def test_update_bumps_version(storage):
+    storage.put(item('a'))
+    assert storage.update('a', 'u1', {'name': 'renamed'}) == 2
+    assert storage.get('a')['name'] == 'renamed'
+
+
+def test_update_checks_expected_version(storage):
+    storage.put(item('a'))
+    assert storage.update('a', 'u1', {'name': 'first'}, expected_version=1) == 2
+    with pytest.raises(VersionMismatch):
+        storage.update('a', 'u1', {'name': 'second'}, expected_version=1)
+    assert storage.get('a')['name'] == 'first'
+    assert storage.get_version('u1') == 2
+
+
+def test_update_of_missing_item_changes_nothing(storage):
+    storage.put(item('a'))
+    with pytest.raises(KeyError):
+        storage.update('missing', 'u1', {'name': 'x'})
+    assert storage.get('missing') is None
+    assert storage.get_version('u1') == 1
+
+
+def test_delete_bumps_version_only_when_deleted(storage):
+    storage.put(item('a'))
+    assert storage.delete('a', 'u1') == 2
+    assert storage.get('a') is None
+    assert storage.delete('a', 'u1') is None
+    assert storage.get_version('u1') == 2
+
+
+def test_put_atomic_bumps_once_or_not_at_all(storage):
+    assert storage.put_atomic('u1', [item('a'), item('b')]) == 1
+    with pytest.raises(WriteConflict):
+        storage.put_atomic('u1', [item('c'), item('b')])
+    assert storage.get('c') is None
+    assert storage.get_version('u1') == 1
+
+
+def test_dynamodb_writes_and_bump_share_one_transaction(dynamodb):
+    storage = DynamoDBStorage(dynamodb, 'transactions')
+    calls = []
+    dynamodb.meta.events.register(
+        'before-call.dynamodb.*', lambda model, **kwargs: calls.append(model.name)
+    )
+    storage.put(item('a'))
+    storage.update('a', 'u1', {'name': 'renamed'}, expected_version=1)
+    storage.delete('a', 'u1')
+    storage.put_atomic('u1', [item('b'), item('c')], token='token')
+    # The new versions follow from the known ones, so none is read back
+    assert calls == ['TransactWriteItems'] * 4
+    assert storage.get_version('u1') == 4
+
+
+def test_dynamodb_reads_the_version_only_after_a_write_elsewhere(dynamodb):
+    # Two storages stand for two processes writing the same user
+    first = DynamoDBStorage(dynamodb, 'transactions')
+    second = DynamoDBStorage(dynamodb, 'transactions')
+    calls = []
+    dynamodb.meta.events.register(
+        'before-call.dynamodb.*', lambda model, **kwargs: calls.append(model.name)
+    )
+    assert first.put(item('a')) == 1
+    assert second.put(item('b')) == 2
+    assert second.put(item('c')) == 3
+    assert calls == ['TransactWriteItems', 'TransactWriteItems', 'GetItem', 'TransactWriteItems',
+                     'TransactWriteItems']
+    with pytest.raises(KeyError):
+        first.update('missing', 'u1', {'name': 'x'})
+    assert first.put_atomic('u1', [item('d')], token='token') == 4
+    with pytest.raises(WriteConflict):
+        second.put_atomic('u1', [item('d')])
+    assert first.get_version('u1') == 4
+
+
+def test_dynamodb_version_items_stay_out_of_user_queries(dynamodb):
+    storage = DynamoDBStorage(dynamodb, 'transactions')
+    storage.put(item('a'))
+    items, _ = storage.query_user('u1')
+    assert [stored['id'] for stored in items] == ['a']
+    assert storage.get(f'{DynamoDBStorage.VERSION_PREFIX}u1') is None
+
+
+def test_interfaces_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        TransactionStorage()
+    with pytest.raises(TypeError):
+        SnapshotStorage()
+
+    class Partial(TransactionStorage):
+        def get(self, transaction_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_replica_serves_items_only_while_the_copy_is_fresh():
+    clock = Clock()
+    primary = MemoryStorage()
+    storage = ReplicatedStorage(primary, SQLiteStorage(':memory:'), ttl=300, clock=clock)
+    storage.put(item('a'))
+    storage.query_user('u1')
+    # Written through another process, without this one seeing it
+    primary.update('a', 'u1', {'name': 'elsewhere'})
+    assert storage.get('a')['name'] == 'a'
+    clock.now = 300
+    assert storage.get('a')['name'] == 'elsewhere'
+    storage.query_user('u1')
+    assert storage.get('a')['name'] == 'elsewhere'
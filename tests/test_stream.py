@@ -0,0 +1,117 @@
+"""The streamed balance must carry the same days as the balance route"""
+import calendar
+import json
+from datetime import datetime, timedelta
+import pytest
+from benchmarks.synthetic import make_transactions
+from models.transaction import Transaction, TransactionCreate
+from services.forecast_cache import forecast_cache
+from services.main_service import MainService
+from services.storage import MemoryStorage
+from services.transaction_service import TransactionService
+from utils.transactions import get_transaction_service
+
+
+@pytest.fixture
+def transactions(user_id):
+    transaction_service = get_transaction_service()
+    for transaction in make_transactions(25, seed=7, user_id=user_id):
+        transaction_service.create_transaction(TransactionCreate(**transaction.model_dump(exclude={'id'})))
+    return transaction_service
+
+
+def ndjson_days(body: bytes) -> dict:
+    days = {}
+    for line in body.splitlines():
+        day = json.loads(line)
+        days[day.pop('date')] = day
+    return days
+
+
+def ranges(user_id):
+    today = MainService(user_id).today
+    return [
+        {},
+        {'sparse': 'true'},
+        {'from': (today + timedelta(days=3)).strftime("%m-%d-%Y"),
+         'to': (today + timedelta(days=40)).strftime("%m-%d-%Y")},
+    ]
+
+
+@pytest.mark.parametrize('case', range(3))
+@pytest.mark.parametrize('cached', [False, True])
+def test_stream_matches_the_balance_route(client, user_id, transactions, case, cached):
+    params = ranges(user_id)[case]
+    expected = client.get(f'/api/v1/users/{user_id}/balance', params=params).json()
+    if not cached:
+        forecast_cache.invalidate(user_id)
+    response = client.get(f'/api/v1/users/{user_id}/balance/stream', params=params)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert ndjson_days(response.content) == expected
+
+
+def test_event_stream_ends_with_an_end_event(client, user_id, transactions):
+    expected = client.get(f'/api/v1/users/{user_id}/balance').json()
+    response = client.get(f'/api/v1/users/{user_id}/balance/stream', headers={'Accept': 'text/event-stream'})
+    assert response.headers['content-type'].startswith('text/event-stream')
+    events = response.text.split('\n\n')[:-1]
+    assert events[-1] == 'event: end\ndata: {}'
+    days = [json.loads(event.removeprefix('data: ')) for event in events[:-1]]
+    assert {day.pop('date'): day for day in days} == expected
+
+
+def test_gzipped_stream_and_etag(client, user_id, transactions):
+    url = f'/api/v1/users/{user_id}/balance/stream'
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert ndjson_days(response.content) == client.get(f'/api/v1/users/{user_id}/balance').json()
+    assert client.get(url, headers={'If-None-Match': response.headers['etag']}).status_code == 304
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('seed', range(5))
+def test_iter_balances_matches_calculate_balances(user_id, seed, sparse):
+    transaction_service = TransactionService(MemoryStorage())
+    for transaction in make_transactions(30, seed=seed, user_id=user_id):
+        transaction_service.storage.put(transaction.model_dump())
+    streamed = dict(MainService(user_id, transaction_service).iter_balances(sparse=sparse))
+    forecast_cache.invalidate(user_id)
+    assert streamed == MainService(user_id, transaction_service).calculate_balances(sparse=sparse)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_iter_balances_matches_build_forecast_across_boundaries(user_id, sparse):
+    later = MainService(user_id).today + timedelta(days=15)
+    month_end = later.replace(day=calendar.monthrange(later.year, later.month)[1])
+    end_date = (month_end + timedelta(days=5)).strftime("%m-%d-%Y")
+    start_date = (month_end - timedelta(days=60)).strftime("%m-%d-%Y")
+    schedules = [
+        ('income', 'salary', 1500, {'frequency': 'monthly', 'last_day_of_month': True}),
+        ('expense', 'rent', 900, {'frequency': 'monthly', 'day': 31}),
+        ('expense', 'gym', 40, {'frequency': 'weekly', 'day': month_end.isoweekday(), 'end_date': end_date}),
+        ('expense', 'cleaner', 40, {'frequency': 'weekly', 'day': month_end.isoweekday(), 'end_date': end_date,
+                                    'skip_end_date': True}),
+        ('expense', 'phone', 40, {'frequency': 'semi-monthly', 'date_of_second_transaction':
+                                  (month_end - timedelta(days=14)).strftime("%m-%d-%Y")}),
+    ]
+    transaction_service = TransactionService(MemoryStorage())
+    for number, (kind, name, amount, fields) in enumerate(schedules):
+        transaction_service.storage.put(Transaction(
+            id=f'transaction-{number}', user_id=user_id, type=kind, name=name, amount=amount,
+            date_of_transaction=start_date, start_date=start_date, **fields
+        ).model_dump())
+
+    # The range starts after the window, so both seed its opening balance, and spans
+    # the month end and the day the bounded weekly schedule stops
+    service = MainService(user_id, transaction_service, start=month_end - timedelta(days=10),
+                          end=month_end + timedelta(days=20))
+    expected = service.build_forecast(transaction_service.list_user_transactions(user_id), sparse).forecast
+    streamed = dict(service.iter_balances(sparse=sparse))
+    assert streamed == expected
+    assert month_end.strftime("%m-%d-%Y") in streamed
+    def days_of(name):
+        return [datetime.strptime(day, "%m-%d-%Y") for day, balances in streamed.items()
+                if any(transaction.name == name
+                       for transaction in balances['paid_transactions'] + balances['unpaid_transactions'])]
+    assert days_of('gym') and days_of('gym')[-1] <= month_end + timedelta(days=5) < days_of('cleaner')[-1]
@@ -0,0 +1,43 @@
+"""TransactionService writes and the data versions they leave behind"""
+import pytest
+from models.transaction import TransactionCreate
+from services.storage import MemoryStorage, VersionMismatch
+from services.transaction_service import IdempotencyConflict, TransactionService
+
+LOAN = {'amount_borrowed': 100, 'amount_to_be_returned': 110,
+        'current_date': '01-01-2026', 'date_of_return': '02-01-2026'}
+
+
+def expense(user_id, **fields) -> TransactionCreate:
+    return TransactionCreate(**{'user_id': user_id, 'type': 'expense', 'name': 'rent', 'amount': 10,
+                                'frequency': 'one-time', 'date_of_transaction': '01-01-2026', **fields})
+
+
+def test_borrow_retry_returns_first_result_without_bumping(user_id):
+    transaction_service = TransactionService(MemoryStorage())
+    first = transaction_service.borrow_money(user_id, LOAN, idempotency_key='key')
+    assert transaction_service.data_version(user_id) == 1
+    assert transaction_service.borrow_money(user_id, LOAN, idempotency_key='key') == first
+    assert transaction_service.data_version(user_id) == 1
+    assert len(transaction_service.list_user_transactions(user_id)) == 2
+    with pytest.raises(IdempotencyConflict):
+        transaction_service.borrow_money(user_id, {**LOAN, 'amount_borrowed': 5}, idempotency_key='key')
+
+
+def test_update_with_stale_version_is_refused(user_id):
+    transaction_service = TransactionService(MemoryStorage())
+    created = transaction_service.create_transaction(expense(user_id))
+    transaction_service.create_transaction(expense(user_id, name='other'))
+    with pytest.raises(VersionMismatch):
+        transaction_service.update_transaction(created.id, expense(user_id, amount=20), expected_version=1)
+    updated = transaction_service.update_transaction(created.id, expense(user_id, amount=20), expected_version=2)
+    assert updated.amount == 20
+    assert transaction_service.data_version(user_id) == 3
+
+
+def test_writes_to_missing_transactions_change_nothing(user_id):
+    transaction_service = TransactionService(MemoryStorage())
+    assert transaction_service.update_transaction('missing', expense(user_id)) is None
+    transaction_service.delete_transaction('missing')
+    assert transaction_service.storage.get('missing') is None
+    assert transaction_service.data_version(user_id) == 0
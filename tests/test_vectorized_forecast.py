@@ -0,0 +1,36 @@
+"""The vectorized engine must reproduce the reference sweep exactly, Decimal exponents included"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+import pytest
+from benchmarks.synthetic import make_transactions
+from services.main_service import MainService
+
+
+def services(**kwargs):
+    return (MainService('test-user', transaction_service=object(), engine=engine, **kwargs)
+            for engine in ('reference', 'vectorized'))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_full_forecast_matches_the_reference(seed):
+    transactions = make_transactions(random.Random(seed).randint(0, 200), seed=seed)
+    reference, vectorized = services()
+    assert repr(vectorized.calculate_forecast(transactions)) == repr(reference.calculate_forecast(transactions))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_sweep_of_a_range_matches_the_reference(seed):
+    transactions = make_transactions(40, seed=seed)
+    start = MainService('test-user').today + timedelta(days=20)
+    reference, vectorized = services(start=start)
+    forecast = vectorized.build_forecast(transactions[:-1])
+    forecast.upsert(transactions[-1])
+    assert repr(forecast.forecast) == repr(reference.build_forecast(transactions).forecast)
+
+
+def test_sub_cent_amounts_fall_back_to_the_reference():
+    transactions = make_transactions(20, seed=1)
+    transactions[0].amount = Decimal('10.125')
+    reference, vectorized = services()
+    assert repr(vectorized.calculate_forecast(transactions)) == repr(reference.calculate_forecast(transactions))
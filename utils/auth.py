@@ -0,0 +1,55 @@
+"""Authentication dependency shared by every router"""
+import hashlib
+from fastapi import Depends, HTTPException
+from fastapi.security import APIKeyCookie
+from config.settings import settings
+from services.cognito_service import CognitoService
+from utils.cache import LRUCache
+
+cookie_scheme = APIKeyCookie(name="access_token")
+
+# Verified claims by token hash, each dropped when its token expires
+claims_cache = LRUCache(max_entries=settings.AUTH_CACHE_MAX_ENTRIES)
+
+
+def token_key(token: str) -> bytes:
+    """Cache key for a token, so raw tokens are never kept in memory"""
+    return hashlib.sha256(token.encode()).digest()
+
+
+async def verify_claims(token: str) -> dict:
+    """Return the token's verified claims, checking the signature only on a cache miss"""
+    key = token_key(token)
+    claims = claims_cache.get(key)
+    if claims is None:
+        claims = await CognitoService.decode_and_validate_token(token)
+        claims_cache.set(key, claims, expires_at=claims['exp'])
+    return claims
+
+
+def forget_token(token: str):
+    """Drop a token's cached claims in this process, e.g. after it is signed out
+
+    The token itself stays valid until it expires: a later request re-verifies
+    its signature and caches its claims again.
+    """
+    claims_cache.pop(token_key(token))
+
+
+# Dependency to verify the token
+async def verify_token(token: str = Depends(cookie_scheme)):
+    """Verify the token and return the user id"""
+    if not token:
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    claims = await verify_claims(token)
+    return claims['sub']
+
+
+def require_group(group: str):
+    """Dependency requiring the token's user to be in the Cognito group; returns the user id"""
+    async def verify_group(token: str = Depends(cookie_scheme)):
+        claims = await verify_claims(token)
+        if group not in claims.get('cognito:groups', []):
+            raise HTTPException(status_code=403, detail="Not allowed")
+        return claims['sub']
+    return verify_group
@@ -0,0 +1,58 @@
+"""Process-wide boto3 session and client factory shared by all services"""
+import threading
+from functools import lru_cache
+import boto3
+from botocore.config import Config
+from config.settings import settings
+from config.settings import dbconf
+from utils.metrics import instrument_botocore
+
+_session_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def get_session():
+    """Return the boto3 session shared by every AWS client in the process
+
+    It uses the default credential chain; only the DynamoDB client is given the
+    explicit keys from dbconf, so Cognito admin calls keep their own principal.
+    """
+    session = boto3.session.Session(region_name=settings.AWS_REGION)
+    instrument_botocore(session.events)
+    return session
+
+@lru_cache(maxsize=None)
+def get_client_config():
+    """Connection pool, timeout and retry settings applied to every AWS client"""
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_READ_TIMEOUT,
+        tcp_keepalive=settings.AWS_TCP_KEEPALIVE,
+        retries={
+            'mode': settings.AWS_RETRY_MODE,
+            'max_attempts': settings.AWS_MAX_ATTEMPTS
+        }
+    )
+
+@lru_cache(maxsize=None)
+def get_dynamodb_client():
+    """Return the shared DynamoDB client, which takes and returns plain Python values
+
+    boto3 resources are not thread safe but clients are. The client of a
+    resource has the resource's value conversion, so it is shared and the
+    resource itself is never used.
+    """
+    # boto3 sessions are not thread safe while creating clients
+    with _session_lock:
+        return get_session().resource(
+            'dynamodb',
+            aws_access_key_id=dbconf.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=dbconf.AWS_SECRET_ACCESS_KEY,
+            config=get_client_config()
+        ).meta.client
+
+@lru_cache(maxsize=None)
+def get_cognito_client():
+    """Return the shared Cognito identity provider client"""
+    with _session_lock:
+        return get_session().client('cognito-idp', config=get_client_config())
@@ -0,0 +1,115 @@
+"""Small thread-safe LRU cache with TTL expiry and an optional weight bound"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """LRU cache with per-entry expiry, bounded by entry count and total weight"""
+    def __init__(self, max_entries, ttl=None, max_weight=None, weigher=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher or (lambda value: 1)
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """Store value under key, expiring after ttl seconds or at expires_at"""
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = self.clock() + ttl if ttl is not None else None
+        weight = self.weigher(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self._entries[key] = (value, expires_at, weight)
+            self._weight += weight
+            while len(self._entries) > self.max_entries or (
+                    self.max_weight is not None and self._weight > self.max_weight):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Remove key and return its value"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)
+
+    def pop_where(self, predicate):
+        """Remove every entry whose key matches predicate and return how many were removed"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def take_where(self, predicate):
+        """Remove every entry whose key matches predicate and return the unexpired (key, value) pairs"""
+        with self._lock:
+            now = self.clock()
+            taken = []
+            for key in [key for key in self._entries if predicate(key)]:
+                expires_at = self._entries[key][1]
+                value = self._remove(key)
+                if expires_at is None or expires_at > now:
+                    taken.append((key, value))
+            return taken
+
+    def peek_where(self, predicate):
+        """Return values whose key matches predicate without touching LRU order or counters"""
+        with self._lock:
+            return [value for key, (value, _, _) in self._entries.items() if predicate(key)]
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._weight = 0
+
+    def _remove(self, key):
+        value, _, weight = self._entries.pop(key)
+        self._weight -= weight
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return hit, miss and eviction counters along with current size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "weight": self._weight,
+            }
@@ -0,0 +1,40 @@
+"""ETags built from a user's data version, and conditional request checks"""
+from typing import Optional
+
+# Revalidate on every use; the ETag makes that a 304 when nothing changed
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(version: int, *qualifiers: str) -> str:
+    """Strong ETag for data at version, qualified e.g. by forecast start date or media type"""
+    return '"' + '-'.join((f'v{version}', *qualifiers)) + '"'
+
+
+def _tags(header: str):
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+
+def if_none_match(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison)"""
+    if not header:
+        return False
+    for tag in _tags(header):
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+def expected_version(header: str) -> Optional[int]:
+    """Data version an If-Match header requires, None for '*'
+
+    Raises ValueError if the header does not hold exactly one version ETag.
+    """
+    tags = _tags(header)
+    if tags == ['*']:
+        return None
+    if len(tags) != 1 or tags[0].startswith('W/'):
+        raise ValueError("If-Match must hold one strong ETag")
+    tag = tags[0]
+    if not (tag.startswith('"v') and tag.endswith('"') and tag[2:-1].isdigit()):
+        raise ValueError("If-Match does not hold an ETag issued for transactions")
+    return int(tag[2:-1])
@@ -0,0 +1,185 @@
+"""Process-wide logging: JSON records with request ids, written by a background thread.
+
+Loggers hand records to a bounded queue and return; a QueueListener thread
+formats and writes them. When the queue is full records are dropped and
+counted rather than blocking the caller, so logging never stalls the event
+loop. Debug records can be sampled per call site.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from config.settings import settings
+from utils.metrics import registry
+
+request_id: ContextVar[Optional[str]] = ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed in extra
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'request_id'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, including any fields passed in extra"""
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id while still on the caller's thread"""
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Keeps one in every `every` DEBUG records per call site; other levels pass"""
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG:
+            return True
+        if not self.every:
+            return False
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._seen.get(site, 0)
+            self._seen[site] = count + 1
+        return count % self.every == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full"""
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+        # Callers on request threads and the event loop can find the queue full at once
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Merge the arguments now, as they may change once the caller moves on, but
+        # keep the traceback separate from the message so formatters can place it
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    """Parse 'botocore=WARNING,services.jwks=DEBUG' into a logger to level map
+
+    Raises ValueError for an entry without a logger name or with an unknown level.
+    """
+    parsed = {}
+    for entry in levels.split(','):
+        if entry.strip():
+            name, _, level = entry.partition('=')
+            name, level = name.strip(), level.strip().upper()
+            if not name or not isinstance(logging.getLevelName(level), int):
+                raise ValueError(f"Invalid logger level: {entry.strip()!r}")
+            parsed[name] = level
+    return parsed
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def configure_logging():
+    """Route the root logger through the queue; later calls are no-ops"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    # stderr, so programs that write results to stdout keep it clean
+    output = logging.StreamHandler(sys.stderr)
+    if settings.LOG_FORMAT == 'json':
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _handler.addFilter(RequestIdFilter())
+    _handler.addFilter(DebugSampler(settings.LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(_handler.queue, output)
+    _listener.start()
+    # Flush what is still queued on shutdown
+    atexit.register(_listener.stop)
+
+
+def dropped_records() -> int:
+    """Records discarded because the queue was full"""
+    return _handler.dropped if _handler is not None else 0
+
+
+class RequestIdMiddleware:
+    """ASGI middleware giving each request an id, taken from X-Request-ID when sent"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope['headers']).get(b'x-request-id', b'').decode('latin-1')[:128]
+        current = incoming or uuid.uuid4().hex
+        token = request_id.set(current)
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [(b'x-request-id', current.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+registry.callback('log_records_dropped_total', 'Log records dropped because the queue was full',
+                  dropped_records, kind='counter')
@@ -0,0 +1,275 @@
+"""In-process metrics exported in the Prometheus text format.
+
+Recording a sample is a dict lookup and an addition under a per-metric lock,
+so instrumentation stays on in production. Values are per process; forecast
+workers in the batch process pool are not included.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 7.5, 10)
+
+# AWS calls made while serving the current request, counted by the botocore hooks
+request_aws_calls: ContextVar[Optional[List[int]]] = ContextVar('request_aws_calls', default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """Named metric with fixed label names; samples are keyed by label values"""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """Yield (suffix, label names, label values, value) tuples"""
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    """Monotonic count per label set"""
+    kind = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield '', self.labelnames, labels, value
+
+
+class Histogram(Metric):
+    """Bucketed observations per label set, with their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the duration of a with block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def timed(self, *labels: str):
+        """Decorator observing the duration of each call in seconds"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        names = self.labelnames + ('le',)
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', names, labels + (_format_value(bound),), cumulative
+            yield '_sum', self.labelnames, labels, total
+            yield '_count', self.labelnames, labels, cumulative
+
+
+class Callback(Metric):
+    """Values read from a function at scrape time, e.g. a cache's own counters
+
+    func returns a number, or a dict of label values tuple to number.
+    """
+    def __init__(self, name: str, documentation: str, func: Callable, kind: str = 'gauge',
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+        self.kind = kind
+
+    def samples(self):
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            yield '', self.labelnames, labels, value
+
+
+class Registry:
+    """Metrics exported by /metrics"""
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, func: Callable, kind: str = 'gauge',
+                 labelnames: Sequence[str] = ()) -> Callback:
+        return self.register(Callback(name, documentation, func, kind, labelnames))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception("Could not collect metric %s", metric.name)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    'http_requests_total', 'HTTP requests by method, route and status', ['method', 'route', 'status']
+)
+http_request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency including the response body', ['method', 'route']
+)
+http_request_aws_calls = registry.histogram(
+    'http_request_aws_calls', 'AWS API calls made per HTTP request', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)
+)
+aws_calls = registry.counter(
+    'aws_calls_total', 'AWS API calls by service, operation and outcome', ['service', 'operation', 'outcome']
+)
+aws_call_seconds = registry.histogram(
+    'aws_call_duration_seconds', 'AWS API call latency including retries', ['service', 'operation']
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and AWS call count per route template"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+        calls = [0]
+        token = request_aws_calls.set(calls)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_aws_calls.reset(token)
+            # The router records the matched route; raw paths would give unbounded label values
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            http_requests.inc(scope['method'], route, str(status_code))
+            http_request_seconds.observe(time.perf_counter() - started, scope['method'], route)
+            http_request_aws_calls.observe(calls[0], route)
+
+
+def _before_aws_call(model, context, **kwargs):
+    context['metrics_operation'] = (model.service_model.service_name, model.name)
+    context['metrics_started'] = time.perf_counter()
+
+
+def _after_aws_call(context, outcome: str):
+    operation = context.pop('metrics_operation', None)
+    if operation is None:
+        return
+    aws_calls.inc(*operation, outcome)
+    aws_call_seconds.observe(time.perf_counter() - context.pop('metrics_started'), *operation)
+    calls = request_aws_calls.get()
+    if calls is not None:
+        calls[0] += 1
+
+
+def _after_aws_call_success(http_response, parsed, context, **kwargs):
+    if http_response.status_code < 300:
+        outcome = 'ok'
+    else:
+        outcome = parsed.get('Error', {}).get('Code') or str(http_response.status_code)
+    _after_aws_call(context, outcome)
+
+
+def _after_aws_call_error(exception, context, **kwargs):
+    _after_aws_call(context, type(exception).__name__)
+
+
+def instrument_botocore(events):
+    """Count and time every API call of clients created from a session with these events
+
+    Registered on the session before any client is created; clients copy the
+    session's handlers when they are built.
+    """
+    # before-call handlers must return None, or botocore skips the request
+    events.register('before-call', _before_aws_call)
+    events.register('after-call', _after_aws_call_success)
+    events.register('after-call-error', _after_aws_call_error)
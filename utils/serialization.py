@@ -0,0 +1,78 @@
+"""Response encoders with Accept-header negotiation.
+
+orjson and msgpack are used when installed; without orjson responses fall back
+to the standard json module and without msgpack only JSON is offered.
+"""
+import json
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Encode JSON-native data, with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    """Encode JSON-native data as msgpack"""
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    """Whether the Accept header asks for msgpack and it can be produced"""
+    if msgpack is None or not accept:
+        return False
+    for part in accept.split(','):
+        media_type, _, params = part.strip().partition(';')
+        if media_type.strip() in MSGPACK_MEDIA_TYPES and 'q=0' not in params.replace(' ', '').split(';'):
+            return True
+    return False
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether the Accept-Encoding header allows gzip"""
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip() == 'gzip' and 'q=0' not in params.replace(' ', '').split(';'):
+            return True
+    return False
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a streamed body, flushing after every chunk so each can be decoded on arrival
+
+    GZipMiddleware leaves responses that set Content-Encoding alone; its own
+    streaming compression holds data back until the compressor fills up.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def encode_response(payload: Any, accept: Optional[str] = None) -> Response:
+    """Encode payload as msgpack if the client accepts it, otherwise JSON
+
+    Compression is left to GZipMiddleware, which honours Accept-Encoding.
+    """
+    if accepts_msgpack(accept):
+        return Response(content=dumps_msgpack(payload), media_type=MSGPACK_MEDIA_TYPES[0],
+                        headers={'Vary': 'Accept'})
+    return Response(content=dumps_json(payload), media_type=JSON_MEDIA_TYPE,
+                    headers={'Vary': 'Accept'})
@@ -1,20 +1,56 @@
-from services.transaction_service import TransactionService
-from config.settings import settings
+from functools import lru_cache
+from services.transaction_service import TransactionService, AsyncTransactionService
+from services.storage import DynamoDBStorage, MemoryStorage, ReplicatedStorage, SQLiteStorage
+from services.snapshot_storage import DynamoDBSnapshotStorage, MemorySnapshotStorage, SQLiteSnapshotStorage
 from config.settings import dbconf
-import requests
+from utils.aws import get_dynamodb_client
 
+@lru_cache(maxsize=None)
+def get_transaction_storage():
+    backend = dbconf.STORAGE_BACKEND
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(dbconf.SQLITE_PATH)
+    dynamodb = DynamoDBStorage(
+        get_dynamodb_client(),
+        dbconf.TRANSACTION_TABLE_NAME,
+        max_attempts=dbconf.BATCH_WRITE_MAX_ATTEMPTS,
+        base_delay=dbconf.BATCH_WRITE_BASE_DELAY
+    )
+    if backend == 'dynamodb':
+        return dynamodb
+    if backend == 'dynamodb+sqlite':
+        return ReplicatedStorage(dynamodb, SQLiteStorage(dbconf.SQLITE_PATH), ttl=dbconf.STORAGE_REPLICA_TTL)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+@lru_cache(maxsize=None)
+def get_snapshot_storage():
+    backend = dbconf.FORECAST_SNAPSHOT_BACKEND
+    if backend == 'memory':
+        return MemorySnapshotStorage()
+    if backend == 'sqlite':
+        return SQLiteSnapshotStorage(dbconf.SQLITE_PATH)
+    if backend == 'dynamodb':
+        return DynamoDBSnapshotStorage(get_dynamodb_client(), dbconf.FORECAST_SNAPSHOT_TABLE_NAME)
+    raise ValueError(f"Unknown FORECAST_SNAPSHOT_BACKEND: {backend}")
+
+@lru_cache(maxsize=None)
+def get_forecast_materializer():
+    """The ForecastMaterializer, or None when FORECAST_SNAPSHOT_BACKEND is empty"""
+    if not dbconf.FORECAST_SNAPSHOT_BACKEND:
+        return None
+    # Imported here: it forecasts with MainService, which imports this module
+    from services.materialized_forecast import ForecastMaterializer
+    return ForecastMaterializer(get_snapshot_storage())
+
+@lru_cache(maxsize=None)
 def get_transaction_service():
-    return TransactionService(
-        region_name=settings.AWS_REGION,
-        aws_access_key_id=dbconf.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=dbconf.AWS_SECRET_ACCESS_KEY,
-        table_name=dbconf.TRANSACTION_TABLE_NAME
+    return TransactionService(get_transaction_storage(), materializer=get_forecast_materializer())
+
+@lru_cache(maxsize=None)
+def get_async_transaction_service():
+    return AsyncTransactionService(
+        get_transaction_service(),
+        max_workers=dbconf.TRANSACTION_EXECUTOR_WORKERS
     )
-    
-def get_jwks(user_pool_id):
-    region = user_pool_id.split('_')[0]  # Extract region from user pool ID
-    jwks_url = f"https://cognito-idp.{region}.amazonaws.com/{user_pool_id}/.well-known/jwks.json"
-    
-    
-    response = requests.get(jwks_url)
-    return response.json(), jwks_url
\ No newline at end of file